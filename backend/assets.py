@@ -0,0 +1,294 @@
+"""Static files: the frontend and uploaded media, served from memory with strong validators.
+
+Every file in FRONTEND_DIR is read once at startup. Each gets a strong ETag from
+its SHA-256 and a content-hashed URL such as /static/app.3f9a0c2b.js, cached by
+browsers for a year; index.html, which they revalidate on every visit, has its
+references to the other files rewritten to those URLs. Text files also get gzip
+and, with the optional brotli package, br variants compressed once at the
+highest level, so a request only picks bytes and headers.
+
+Media under MEDIA_DIR, the files media_url and profile_pic point at, is loaded
+on first request and reloaded when its size or mtime changes. Files up to
+STATIC_MEMORY_MAX_BYTES stay in memory, within STATIC_MEDIA_CACHE_BYTES in
+total; larger ones stream from disk. Both answer single byte-range requests.
+"""
+import asyncio
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import stat
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+from fastapi import Request, Response
+from fastapi.responses import FileResponse
+from conditional import http_date, is_not_modified
+
+try:
+    import brotli
+except ImportError:  # gzip still works, browsers that prefer br just get slightly larger files
+    brotli = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FRONTEND_DIR = os.path.realpath(os.getenv("FRONTEND_DIR") or os.path.join(BASE_DIR, "..", "frontend"))
+MEDIA_DIR = os.path.realpath(os.getenv("MEDIA_DIR") or os.path.join(BASE_DIR, "..", "media"))
+STATIC_MEMORY_MAX_BYTES = int(os.getenv("STATIC_MEMORY_MAX_BYTES", 1024 * 1024))
+STATIC_MEDIA_CACHE_BYTES = int(os.getenv("STATIC_MEDIA_CACHE_BYTES", 64 * 1024 * 1024))
+STATIC_COMPRESS_MIN_BYTES = int(os.getenv("STATIC_COMPRESS_MIN_BYTES", 1024))
+MEDIA_MAX_AGE_SECONDS = int(os.getenv("MEDIA_MAX_AGE_SECONDS", 86400))
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+COMPRESSIBLE = {"application/javascript", "application/json", "application/manifest+json", "application/xml", "image/svg+xml"}
+# preferred first
+ENCODINGS = ("br", "gzip")
+RANGE = re.compile(r"bytes=(\d*)-(\d*)")
+
+
+class Asset:
+    """One file: its bytes when small enough, precompressed variants and validators"""
+
+    def __init__(self, path: str, body: Optional[bytes], digest: str, stat_result: os.stat_result):
+        self.path = path
+        self.body = body
+        self.stat_result = stat_result
+        self.size = len(body) if body is not None else stat_result.st_size
+        self.mtime_ns = stat_result.st_mtime_ns
+        self.modified = datetime.utcfromtimestamp(stat_result.st_mtime)
+        self.last_modified = http_date(self.modified)
+        self.content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if self.content_type.startswith("text/"):
+            self.content_type += "; charset=utf-8"
+        self.digest = digest
+        self.etag = f'"{digest[:32]}"'
+        # encoding -> (bytes, etag); a representation per encoding, each with its own strong tag
+        self.variants: Dict[str, Tuple[bytes, str]] = {}
+
+    def compressible(self) -> bool:
+        media_type = self.content_type.split(";")[0]
+        return self.body is not None and self.size >= STATIC_COMPRESS_MIN_BYTES and (media_type.startswith("text/") or media_type in COMPRESSIBLE)
+
+    def compress(self):
+        if not self.compressible():
+            return
+        candidates = {"gzip": gzip.compress(self.body, 9, mtime=0)}
+        if brotli is not None:
+            candidates["br"] = brotli.compress(self.body, quality=11)
+        for encoding, data in candidates.items():
+            if len(data) < self.size:
+                self.variants[encoding] = (data, f'"{self.digest[:32]}-{encoding}"')
+
+    def memory_bytes(self) -> int:
+        return len(self.body or b"") + sum(len(data) for data, _ in self.variants.values())
+
+
+def load(path: str, stat_result: os.stat_result, body: Optional[bytes] = None) -> Asset:
+    """Read and hash path; blocking, run it in a thread from request handlers"""
+    if body is None and stat_result.st_size <= STATIC_MEMORY_MAX_BYTES:
+        with open(path, "rb") as f:
+            body = f.read()
+    if body is not None:
+        digest = hashlib.sha256(body).hexdigest()
+    else:
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+    asset = Asset(path, body, digest, stat_result)
+    asset.compress()
+    return asset
+
+
+def hashed_name(name: str, digest: str) -> str:
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{digest[:8]}{ext}"
+
+
+class FrontendAssets:
+    """The frontend directory, loaded once; index.html points at content-hashed URLs"""
+
+    INDEX = "index.html"
+
+    def __init__(self, root: str = FRONTEND_DIR):
+        self.root = root
+        self.hashed: Dict[str, Asset] = {}
+        self.plain: Dict[str, Asset] = {}
+        self.loaded = False
+
+    def load(self):
+        plain = {}
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.join(directory, name)
+                plain[os.path.relpath(path, self.root).replace(os.sep, "/")] = load(path, os.stat(path))
+        hashed = {hashed_name(name, asset.digest): asset for name, asset in plain.items() if name != self.INDEX}
+        index = plain.get(self.INDEX)
+        if index is not None and index.body is not None:
+            html = index.body.decode()
+            for name, asset in plain.items():
+                if name != self.INDEX:
+                    html = html.replace(f'"{name}"', f'"/static/{hashed_name(name, asset.digest)}"')
+            plain[self.INDEX] = load(index.path, index.stat_result, html.encode())
+        self.hashed, self.plain, self.loaded = hashed, plain, True
+        print(f"Loaded {len(plain)} frontend files, {sum(asset.memory_bytes() for asset in plain.values())} bytes in memory")
+
+    def get(self, name: str) -> Tuple[Optional[Asset], str]:
+        """The asset and its Cache-Control: hashed names never change, anything else is revalidated"""
+        if not self.loaded:
+            self.load()
+        asset = self.hashed.get(name)
+        if asset is not None:
+            return asset, IMMUTABLE
+        return self.plain.get(name), REVALIDATE
+
+    def stats(self) -> dict:
+        return {
+            "files": len(self.plain),
+            "memory_bytes": sum(asset.memory_bytes() for asset in self.plain.values()),
+            "brotli": brotli is not None,
+        }
+
+
+class MediaFiles:
+    """Files under MEDIA_DIR, cached by path and checked against size and mtime on every request"""
+
+    def __init__(self, root: str = MEDIA_DIR, max_bytes: int = STATIC_MEDIA_CACHE_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[str, Asset]" = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def resolve(self, name: str) -> Optional[str]:
+        path = os.path.realpath(os.path.join(self.root, name))
+        return path if path.startswith(self.root + os.sep) else None
+
+    def cached(self, path: str, stat_result: os.stat_result) -> Optional[Asset]:
+        with self._lock:
+            asset = self.entries.get(path)
+            if asset is None or asset.size != stat_result.st_size or asset.mtime_ns != stat_result.st_mtime_ns:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(path)
+            self.hits += 1
+            return asset
+
+    def store(self, path: str, asset: Asset):
+        with self._lock:
+            previous = self.entries.pop(path, None)
+            if previous is not None:
+                self.bytes -= previous.memory_bytes()
+            self.entries[path] = asset
+            self.bytes += asset.memory_bytes()
+            while self.bytes > self.max_bytes and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                self.bytes -= evicted.memory_bytes()
+
+    def stats(self) -> dict:
+        return {"entries": len(self.entries), "memory_bytes": self.bytes, "hits": self.hits, "misses": self.misses}
+
+
+frontend = FrontendAssets()
+media = MediaFiles()
+
+
+def pick_encoding(request: Request, asset: Asset) -> Optional[str]:
+    if not asset.variants:
+        return None
+    accepted = {}
+    for part in request.headers.get("accept-encoding", "").split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    for encoding in ENCODINGS:
+        if encoding in asset.variants and accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+def byte_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """(start, end exclusive) for a single satisfiable range; None means serve the whole file.
+
+    Raises ValueError when the range cannot be satisfied.
+    """
+    match = RANGE.fullmatch(header.strip())
+    if match is None or not any(match.groups()):
+        # multiple ranges or another unit; a full 200 is a valid answer to both
+        return None
+    first, last = match.groups()
+    if not first:
+        start, end = max(0, size - int(last)), size
+    else:
+        start, end = int(first), min(size, int(last) + 1) if last else size
+    if start >= size or start >= end:
+        raise ValueError(header)
+    return start, end
+
+
+def serve(request: Request, asset: Asset, cache_control: str) -> Response:
+    """The asset as a 200, 206, 304 or 416, whichever the request's headers call for"""
+    range_header = request.headers.get("range")
+    # ranges address the identity bytes, so they are never compressed
+    encoding = None if range_header else pick_encoding(request, asset)
+    body, etag = asset.variants[encoding] if encoding else (asset.body, asset.etag)
+    headers = {"ETag": etag, "Last-Modified": asset.last_modified, "Cache-Control": cache_control, "Accept-Ranges": "bytes", "X-Content-Type-Options": "nosniff"}
+    if asset.variants:
+        headers["Vary"] = "Accept-Encoding"
+    if is_not_modified(request, etag, asset.modified):
+        return Response(status_code=304, headers=headers)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    if body is None:
+        # FileResponse handles Range and If-Range itself, from these validators
+        return FileResponse(asset.path, headers=headers, media_type=asset.content_type, stat_result=asset.stat_result)
+    status = 200
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range.strip() in (asset.etag, asset.last_modified)):
+        try:
+            span = byte_range(range_header, asset.size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{asset.size}"})
+        if span is not None:
+            start, end = span
+            body = body[start:end]
+            headers["Content-Range"] = f"bytes {start}-{end - 1}/{asset.size}"
+            status = 206
+    if request.method == "HEAD":
+        headers["Content-Length"] = str(len(body))
+        body = b""
+    return Response(body, status_code=status, headers=headers, media_type=asset.content_type)
+
+
+async def media_asset(name: str) -> Optional[Asset]:
+    path = media.resolve(name)
+    if path is None:
+        return None
+    try:
+        stat_result = os.stat(path)
+    except OSError:
+        return None
+    if not stat.S_ISREG(stat_result.st_mode):
+        return None
+    asset = media.cached(path, stat_result)
+    if asset is None:
+        asset = await asyncio.to_thread(load, path, stat_result)
+        media.store(path, asset)
+    return asset
+
+
+def media_cache_control() -> str:
+    return f"public, max-age={MEDIA_MAX_AGE_SECONDS}"
+
+
+def stats() -> dict:
+    return {"frontend": frontend.stats(), "media": media.stats()}
@@ -1,28 +1,37 @@
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
-import bcrypt
+import time
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import event, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, object_session
 import os
-from dotenv import load_dotenv
-from database import get_db
+from database import get_async_db
+import hashing
+import message_bus
+from ttl_cache import TTLCache
 import models
 import schemas
-load_dotenv()
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 10080))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", 10000))
+PRINCIPAL_CACHE_TTL = int(os.getenv("PRINCIPAL_CACHE_TTL", 60))
+
+# Decoded JWT claims keyed by token, and user snapshots keyed by token subject
+claims_cache = TTLCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL)
+principal_cache = TTLCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+    return hashing.check_password_sync(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    return hashing.hash_password_sync(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -34,29 +43,96 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def decode_token(token: str) -> dict:
+    payload = claims_cache.get(token)
+    if payload is None:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        remaining = payload.get("exp", 0) - time.time()
+        claims_cache.set(token, payload, ttl=max(0, min(PRINCIPAL_CACHE_TTL, remaining)))
+    return payload
+
+async def get_user_by_username(db: AsyncSession, username: str) -> Optional[models.User]:
+    result = await db.execute(select(models.User).where(models.User.username == username))
+    return result.scalar_one_or_none()
+
+async def load_principal(db: AsyncSession, username: str) -> Optional[schemas.UserSnapshot]:
+    snapshot = principal_cache.get(username)
+    if snapshot is None:
+        user = await get_user_by_username(db, username)
+        if user is None or user.deleted_at:
+            return None
+        snapshot = schemas.UserSnapshot.model_validate(user)
+        principal_cache.set(username, snapshot)
+    return snapshot
+
+def drop_principals(usernames):
+    for username in usernames:
+        principal_cache.pop(username)
+
+message_bus.invalidators["principal"] = drop_principals
+
+def invalidate_principal(*usernames: str):
+    """Forget cached snapshots here and on every other worker; call after the change commits"""
+    drop_principals(usernames)
+    message_bus.announce("principal", list(usernames))
+
+def _stale_principals(target) -> list:
+    return object_session(target).info.setdefault("stale_principals", [])
+
+@event.listens_for(models.User, "after_update")
+def _invalidate_updated_user(mapper, connection, target):
+    # Follow/unfollow only touch the collection, which is not part of the snapshot
+    if not object_session(target).is_modified(target, include_collections=False):
+        return
+    _stale_principals(target).extend([target.username, *inspect(target).attrs.username.history.deleted])
+
+@event.listens_for(models.User, "after_delete")
+def _invalidate_deleted_user(mapper, connection, target):
+    _stale_principals(target).append(target.username)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_users(session):
+    # not before: a request in between would cache the old row again
+    stale = session.info.pop("stale_principals", None)
+    if stale:
+        invalidate_principal(*dict.fromkeys(stale))
+
+@event.listens_for(Session, "after_transaction_end")
+def _forget_rolled_back_users(session, transaction):
+    if transaction.parent is None:
+        session.info.pop("stale_principals", None)
+
+def principal_cache_stats() -> dict:
+    return {"claims": claims_cache.stats(), "principals": principal_cache.stats()}
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)) -> schemas.UserSnapshot:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_token(token)
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
     
-    user = db.query(models.User).filter(models.User.username == username).first()
+    user = await load_principal(db, username)
     if user is None:
         raise credentials_exception
     return user
 
-def authenticate_user(db: Session, username: str, password: str):
-    user = db.query(models.User).filter(models.User.username == username).first()
-    if not user:
+async def authenticate_user(db: AsyncSession, username: str, password: str):
+    user = await get_user_by_username(db, username)
+    if not user or user.deleted_at:
         return False
-    if not verify_password(password, user.hashed_password):
+    # bcrypt is deliberately slow, it runs on the size-limited hashing pool
+    if not await hashing.check_password(password, user.hashed_password):
         return False
+    if hashing.needs_rehash(user.hashed_password) and hashing.pool.has_capacity():
+        # the cost factor was raised since this hash was made; upgrade it while we hold the password
+        user.hashed_password = await hashing.hash_password(password)
+        await db.commit()
     return user
\ No newline at end of file
@@ -0,0 +1,140 @@
+"""Minimal in-process ASGI client, so scenarios can drive the app without a server or extra dependencies"""
+import asyncio
+import json
+import time
+from urllib.parse import urlencode
+
+
+class ASGIResponse:
+    def __init__(self, status, headers, body, seconds):
+        self.status_code = status
+        self.headers = headers
+        self.content = bytes(body)
+        self.seconds = seconds
+
+    def json(self):
+        return json.loads(self.content)
+
+
+async def request(app, method, path, headers=None, params=None, json_body=None, form=None):
+    query = urlencode(params or {})
+    if "?" in path:
+        path, query = path.split("?", 1)
+    headers = {key.lower(): value for key, value in (headers or {}).items()}
+    body = b""
+    if json_body is not None:
+        body = json.dumps(json_body).encode()
+        headers["content-type"] = "application/json"
+    elif form is not None:
+        body = urlencode(form).encode()
+        headers["content-type"] = "application/x-www-form-urlencoded"
+    headers["content-length"] = str(len(body))
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": [(key.encode(), value.encode()) for key, value in headers.items()],
+        "client": ("127.0.0.1", 50000),
+        "server": ("testserver", 80),
+    }
+    pending = [{"type": "http.request", "body": body, "more_body": False}]
+    done = asyncio.Event()
+    result = {"status": 0, "headers": {}, "body": bytearray(), "end": None}
+
+    async def receive():
+        if pending:
+            return pending.pop()
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            result["status"] = message["status"]
+            result["headers"] = {key.decode().lower(): value.decode() for key, value in message.get("headers", [])}
+        elif message["type"] == "http.response.body":
+            result["body"] += message.get("body", b"")
+            if not message.get("more_body"):
+                result["end"] = time.perf_counter()
+                done.set()
+
+    start = time.perf_counter()
+    await app(scope, receive, send)
+    done.set()
+    return ASGIResponse(result["status"], result["headers"], result["body"], (result["end"] or time.perf_counter()) - start)
+
+
+async def load(app, method, path, total, concurrency, **kwargs):
+    """Issue total requests with at most concurrency in flight, returns (elapsed_seconds, latencies, statuses)"""
+    latencies, statuses = [], {}
+    remaining = iter(range(total))
+
+    async def worker():
+        for _ in remaining:
+            start = time.perf_counter()
+            try:
+                response = await request(app, method, path, **kwargs)
+                status = response.status_code
+            except Exception as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - start, latencies, statuses
+
+
+class ASGIWebSocket:
+    """In-process WebSocket client; every text frame the app sends is passed to on_message"""
+
+    def __init__(self, app, path, on_message):
+        self.app = app
+        self.path = path
+        self.on_message = on_message
+        self.inbox = asyncio.Queue()
+        self.accepted = asyncio.Event()
+        self.closed = asyncio.Event()
+        self.task = None
+
+    async def connect(self):
+        scope = {
+            "type": "websocket",
+            "asgi": {"version": "3.0"},
+            "scheme": "ws",
+            "path": self.path,
+            "raw_path": self.path.encode(),
+            "query_string": b"",
+            "root_path": "",
+            "headers": [],
+            "client": ("127.0.0.1", 50000),
+            "server": ("testserver", 80),
+            "subprotocols": [],
+        }
+        await self.inbox.put({"type": "websocket.connect"})
+        self.task = asyncio.create_task(self.app(scope, self.inbox.get, self._send))
+        accepted = asyncio.create_task(self.accepted.wait())
+        await asyncio.wait([accepted, self.task], return_when=asyncio.FIRST_COMPLETED)
+        accepted.cancel()
+        return self.accepted.is_set() and not self.closed.is_set()
+
+    async def _send(self, message):
+        if message["type"] == "websocket.accept":
+            self.accepted.set()
+        elif message["type"] == "websocket.send":
+            self.on_message(message.get("text") or message.get("bytes"))
+        elif message["type"] == "websocket.close":
+            self.closed.set()
+
+    async def send_text(self, text):
+        await self.inbox.put({"type": "websocket.receive", "text": text})
+
+    async def close(self):
+        await self.inbox.put({"type": "websocket.disconnect", "code": 1000})
+        if self.task is not None:
+            await asyncio.gather(self.task, return_exceptions=True)
@@ -0,0 +1,50 @@
+"""Throughput and tail latency of GET /posts/ with a sync Session in the threadpool vs the AsyncSession routes.
+
+    python -m benchmarks.bench_async_load [requests] [concurrency]
+
+Set DATABASE_URL to a local Postgres to compare against a real server instead of SQLite.
+With concurrency above the threadpool size (40) the sync mode can stall on pool
+timeouts, which are reported under statuses rather than aborting the run.
+"""
+import sys
+from typing import List
+from fastapi import Depends, FastAPI
+from sqlalchemy.orm import Session, selectinload
+from benchmarks.asgi import load
+from benchmarks.common import close, percentile, reset_schema, run
+from database import engine, get_db
+import models, schemas
+from routes import posts as posts_routes
+
+sync_app = FastAPI()
+
+
+@sync_app.get("/posts/", response_model=List[schemas.Post])
+def sync_posts(limit: int = 20, db: Session = Depends(get_db)):
+    """The pre-async handler shape: blocking Session on a threadpool worker"""
+    return db.query(models.Post).options(selectinload(models.Post.author)).order_by(models.Post.created_at.desc(), models.Post.id.desc()).limit(limit).all()
+
+
+async_app = FastAPI()
+async_app.include_router(posts_routes.router)
+
+
+def seed(n_users=200, n_posts=5000):
+    with engine.begin() as conn:
+        conn.execute(models.User.__table__.insert(), [
+            {"email": f"u{i}@example.com", "username": f"u{i}", "full_name": f"User {i}", "hashed_password": "x"} for i in range(n_users)
+        ])
+        conn.execute(models.Post.__table__.insert(), [{"content": f"post {i}", "author_id": i % n_users + 1} for i in range(n_posts)])
+
+
+if __name__ == "__main__":
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    reset_schema()
+    seed()
+    for name, app in (("sync", sync_app), ("async", async_app)):
+        run(load(app, "GET", "/posts/", 50, 10))
+        elapsed, latencies, statuses = run(load(app, "GET", "/posts/", total, concurrency))
+        print(f"{name:5} rps={total / elapsed:8.1f} p50={percentile(latencies, 50) * 1000:7.1f} ms "
+              f"p99={percentile(latencies, 99) * 1000:7.1f} ms statuses={statuses}")
+    close()
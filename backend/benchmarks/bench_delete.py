@@ -0,0 +1,66 @@
+"""Deleting a popular post: the ORM cascade vs the set-based posts.delete job.
+
+    python -m benchmarks.bench_delete [likes_and_comments]
+
+"cascade" is the previous delete_post: db.delete(post) loads every like and
+comment through cascade="all, delete-orphan" and deletes them row by row.
+"job" is deletion.delete_post, three DELETE statements. "request" is what the
+client now waits for: marking the post deleted, its author's counter and the
+job row, in one commit.
+"""
+import sys
+import time
+from datetime import datetime
+from benchmarks.common import QueryCounter, close, reset_schema, run
+from counters import adjust_user_counts
+from database import AsyncSessionLocal, engine
+import deletion
+import jobs
+import models
+
+
+def seed(n):
+    with engine.begin() as conn:
+        conn.execute(models.User.__table__.insert(), [
+            {"email": f"u{i}@example.com", "username": f"u{i}", "full_name": f"User {i}", "hashed_password": "x"} for i in range(n)
+        ])
+        conn.execute(models.Post.__table__.insert(), [{"content": "popular", "author_id": 1, "likes_count": n, "comments_count": n}])
+        conn.execute(models.Like.__table__.insert(), [{"post_id": 1, "user_id": i + 1} for i in range(n)])
+        conn.execute(models.Comment.__table__.insert(), [{"post_id": 1, "author_id": i + 1, "content": "congrats"} for i in range(n)])
+
+
+async def cascade():
+    async with AsyncSessionLocal() as db:
+        post = await db.get(models.Post, 1)
+        await db.delete(post)
+        await db.commit()
+
+
+async def request():
+    async with AsyncSessionLocal() as db:
+        post = await db.get(models.Post, 1)
+        post.deleted_at = datetime.utcnow()
+        await adjust_user_counts(db, post.author_id, posts=-1)
+        await jobs.enqueue(db, "posts.delete", key=f"bench:{time.perf_counter()}", post_id=post.id, author_id=post.author_id)
+        await db.commit()
+
+
+async def job():
+    async with AsyncSessionLocal() as db:
+        await deletion.delete_post(db, post_id=1, author_id=1)
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    counter = QueryCounter()
+    print(f"likes={n} comments={n}")
+    for name, fn in (("cascade", cascade), ("request", request), ("job", job)):
+        reset_schema()
+        seed(n)
+        with counter.track():
+            start = time.perf_counter()
+            run(fn())
+            seconds = time.perf_counter() - start
+        print(f"{name:8} {seconds * 1000:9.1f} ms {counter.count:6d} statements")
+    run(jobs.runner.stop())
+    close()
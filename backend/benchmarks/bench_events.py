@@ -0,0 +1,84 @@
+"""Latency of "next 20 upcoming events" as the events table grows.
+
+    python -m benchmarks.bench_events [sizes]
+
+sizes is a comma-separated list of table sizes, 80% of them past events. The
+previous query, every event sorted by date with no lower bound, is called
+directly, on a table without the event_date index ("unindexed", as databases
+created before the index have it until counters.py adds it) and with it ("all").
+Then three cases are timed for GET /events/?limit=20:
+- "window": an explicit ?from= window, read through the event_date index;
+- "cached": the default upcoming window served from memory;
+- "304": the same call with If-None-Match from a previous response.
+"""
+import sys
+import time
+from datetime import datetime, timedelta
+from fastapi import Response
+from benchmarks.asgi import request
+from benchmarks.common import close, percentile, reset_schema, run
+from database import AsyncSessionLocal, engine
+import models, schemas
+from loaders import shaped_select
+from main import app
+from pagination import paginate
+
+REPEAT = 200
+
+
+def seed(n_events):
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(models.User.__table__.insert(), [{"email": "a@example.com", "username": "a", "full_name": "A", "hashed_password": "x"}])
+        for offset in range(0, n_events, 10000):
+            conn.execute(models.Event.__table__.insert(), [
+                {"title": f"event {i}", "description": "", "location": "", "creator_id": 1,
+                 "event_date": now + timedelta(hours=i - int(n_events * 0.8))}
+                for i in range(offset, min(offset + 10000, n_events))
+            ])
+
+
+async def previous_query():
+    async with AsyncSessionLocal() as db:
+        query = shaped_select(schemas.Event)
+        rows = await paginate(db, query, (models.Event.event_date, models.Event.id), Response(), None, 0, 20, descending=False)
+        return [schemas.Event.model_validate(row) for row in rows]
+
+
+async def measure(n_events):
+    samples = {"unindexed": [], "all": [], "window": [], "cached": [], "304": []}
+    index = next(index for index in models.Event.__table__.indexes if index.name == "ix_events_event_date_id")
+    with engine.begin() as conn:
+        index.drop(conn)
+    for _ in range(3):
+        start = time.perf_counter()
+        await previous_query()
+        samples["unindexed"].append(time.perf_counter() - start)
+    with engine.begin() as conn:
+        index.create(conn)
+    since = datetime.utcnow().isoformat()
+    etag = (await request(app, "GET", "/events/", params={"limit": 20})).headers["etag"]
+    for _ in range(REPEAT):
+        response = await request(app, "GET", "/events/", params={"limit": 20})
+        samples["cached"].append(response.seconds)
+        response = await request(app, "GET", "/events/", params={"limit": 20}, headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        samples["304"].append(response.seconds)
+        response = await request(app, "GET", "/events/", params={"limit": 20, "from": since})
+        samples["window"].append(response.seconds)
+    for _ in range(max(1, REPEAT // 20)):
+        start = time.perf_counter()
+        await previous_query()
+        samples["all"].append(time.perf_counter() - start)
+    print(f"events={n_events:8d} " + " ".join(
+        f"{name}_p50={percentile(values, 50) * 1000:7.2f} ms" for name, values in samples.items()
+    ))
+
+
+if __name__ == "__main__":
+    sizes = [int(size) for size in (sys.argv[1] if len(sys.argv) > 1 else "10000,100000,500000").split(",")]
+    for n_events in sizes:
+        reset_schema()
+        seed(n_events)
+        run(measure(n_events))
+    close()
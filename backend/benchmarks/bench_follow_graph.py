@@ -0,0 +1,76 @@
+"""Follow graph on a synthetic directory: build and "alumni you may know".
+
+    python -m benchmarks.bench_follow_graph [users] [edges] [requests]
+
+Edges follow a skewed popularity curve, so a few users have very many followers
+as real alumni networks do. The graph is built straight from generated edge
+arrays; warming it from a table of this size is bounded by how fast the database
+streams rows. Without numpy the same runs use array/bisect and Python counting,
+and the build alone takes minutes at the default size.
+"""
+import random
+import sys
+import time
+from array import array
+from benchmarks.common import percentile
+from follow_graph import Adjacency, FollowGraph, numpy
+
+
+def generate(n_users, n_edges, seed=19):
+    """Deduplicated (follower, following) arrays with ids 1..n_users and no self-follows"""
+    if numpy is not None:
+        rng = numpy.random.default_rng(seed)
+        sources = rng.integers(1, n_users + 1, n_edges, dtype=numpy.int64)
+        targets = (n_users * rng.random(n_edges) ** 2).astype(numpy.int64) + 1
+        keys = numpy.unique((sources << 32) | targets)
+        sources, targets = (keys >> 32).astype(numpy.int32), (keys & 0xFFFFFFFF).astype(numpy.int32)
+        keep = sources != targets
+        return sources[keep], targets[keep]
+    rng = random.Random(seed)
+    pairs = {(rng.randint(1, n_users), int(n_users * rng.random() ** 2) + 1) for _ in range(n_edges)}
+    pairs = [(source, target) for source, target in pairs if source != target]
+    return array("i", (source for source, _ in pairs)), array("i", (target for _, target in pairs))
+
+
+def nbytes(adjacency):
+    return sum(part.nbytes if numpy is not None else part.itemsize * len(part) for part in (adjacency.offsets, adjacency.targets))
+
+
+if __name__ == "__main__":
+    n_users = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    n_edges = int(sys.argv[2]) if len(sys.argv) > 2 else 20_000_000
+    n_requests = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+    start = time.perf_counter()
+    sources, targets = generate(n_users, n_edges)
+    generate_seconds = time.perf_counter() - start
+    graph = FollowGraph()
+    start = time.perf_counter()
+    following = Adjacency.build(sources, targets, n_users + 1)
+    followers = Adjacency.build(targets, sources, n_users + 1)
+    build_seconds = time.perf_counter() - start
+    alumni = bytearray(n_users + 1)
+    for user_id in range(0, n_users + 1, 3):
+        alumni[user_id] = 1
+    graph.swap(following, followers, alumni, len(sources))
+    print(f"users={n_users} edges={len(sources)} vectorized={numpy is not None}")
+    print(f"generate {generate_seconds:6.2f} s  build {build_seconds:6.2f} s  "
+          f"adjacency {(nbytes(following) + nbytes(followers)) / 2 ** 20:7.1f} MiB ({(nbytes(following) + nbytes(followers)) / len(sources):4.1f} B/edge)")
+
+    rng = random.Random(7)
+    users = [rng.randint(1, n_users) for _ in range(n_requests)]
+    latencies = []
+    for user_id in users:
+        start = time.perf_counter()
+        graph.suggestions(user_id, 20)
+        latencies.append(time.perf_counter() - start)
+    print(f"suggestions p50={percentile(latencies, 50) * 1000:7.2f} ms p99={percentile(latencies, 99) * 1000:7.2f} ms "
+          f"max={max(latencies) * 1000:7.2f} ms over {n_requests} users")
+
+    for _ in range(n_requests):
+        follower, following = rng.randint(1, n_users), rng.randint(1, n_users)
+        if follower != following:
+            graph.follow(follower, following)
+    start = time.perf_counter()
+    for user_id in users:
+        graph.suggestions(user_id, 20)
+    print(f"suggestions with {graph.stats()['overlay_edges']} overlay edges {(time.perf_counter() - start) / n_requests * 1000:7.2f} ms avg")
@@ -0,0 +1,71 @@
+"""Onboarding a class: POST /register per user vs the bulk directory import.
+
+    python -m benchmarks.bench_import [users]
+
+"register" is the previous path, one request per user with its two uniqueness
+SELECTs, bcrypt hash and commit, sent sequentially as an onboarding script
+would. "import" streams the same users from CSV through directory.import_users.
+Both end with the same users table. BCRYPT_ROUNDS defaults to 8 here to keep
+runs short, which understates the gain from hashing in parallel.
+"""
+import io
+import os
+import sys
+import time
+os.environ.setdefault("BCRYPT_ROUNDS", "8")
+from benchmarks.asgi import request
+from benchmarks.common import QueryCounter, close, reset_schema, run
+from database import engine
+from sqlalchemy import func, select
+import directory
+import models
+from main import app
+
+
+def users(n, offset=0):
+    return [
+        {"email": f"u{i}@example.com", "username": f"u{i}", "full_name": f"User {i}", "password": f"password-{i}", "is_alumni": True}
+        for i in range(offset, offset + n)
+    ]
+
+
+async def register_all(batch):
+    for user in batch:
+        response = await request(app, "POST", "/register", json_body=user)
+        assert response.status_code == 200, response.content
+
+
+def to_csv(batch) -> io.StringIO:
+    buffer = io.StringIO()
+    buffer.write("email,username,full_name,password,is_alumni\n")
+    for user in batch:
+        buffer.write(f"{user['email']},{user['username']},{user['full_name']},{user['password']},true\n")
+    buffer.seek(0)
+    return buffer
+
+
+def user_count():
+    with engine.connect() as conn:
+        return conn.scalar(select(func.count()).select_from(models.User))
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    counter = QueryCounter()
+    reset_schema()
+    with counter.track():
+        start = time.perf_counter()
+        run(register_all(users(n)))
+        register_seconds = time.perf_counter() - start
+    register_queries = counter.count
+    assert user_count() == n
+    reset_schema()
+    with counter.track():
+        start = time.perf_counter()
+        report = directory.import_users(directory.read_records(to_csv(users(n)), "csv"), directory.ImportReport())
+        import_seconds = time.perf_counter() - start
+    assert report.summary() == {"imported": n, "skipped": 0, "failed": 0} and user_count() == n
+    print(f"users={n} bcrypt_rounds={os.environ['BCRYPT_ROUNDS']} hash_workers={directory.IMPORT_HASH_WORKERS}")
+    print(f"register: {register_seconds:7.2f} s {n / register_seconds:8.1f} users/s {register_queries} queries")
+    print(f"import:   {import_seconds:7.2f} s {n / import_seconds:8.1f} users/s {counter.count} queries ({register_seconds / import_seconds:4.1f}x)")
+    close()
@@ -0,0 +1,85 @@
+"""Building a chat inbox: the previous scans plus one history call per conversation vs the summary table.
+
+    python -m benchmarks.bench_inbox [peers] [messages_per_peer]
+
+"previous" is what the frontend had to do: /chat/conversations (two DISTINCT
+scans over the user's messages and a user load), then the newest message and the
+unread count of every conversation. "summary" is the new /chat/conversations,
+one indexed query.
+"""
+import sys
+from datetime import datetime, timedelta
+from fastapi import Response
+from sqlalchemy import func, select
+from benchmarks.common import QueryCounter, close, reset_schema, run, timed
+from database import AsyncSessionLocal, SessionLocal, engine
+import conversations
+import models, schemas
+from pagination import paginate
+from serializers import serializer
+
+OWNER = 1
+
+
+def seed(n_peers, per_peer):
+    start = datetime(2024, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(models.User.__table__.insert(), [
+            {"email": f"u{i}@example.com", "username": f"u{i}", "full_name": f"User {i}", "hashed_password": "x"} for i in range(n_peers + 1)
+        ])
+        for peer in range(2, n_peers + 2):
+            conn.execute(models.ChatMessage.__table__.insert(), [
+                {"sender_id": peer if i % 2 else OWNER, "receiver_id": OWNER if i % 2 else peer, "user_low": OWNER, "user_high": peer,
+                 "message": f"message {i}", "is_read": i < per_peer - 5, "created_at": start + timedelta(minutes=i * n_peers + peer)}
+                for i in range(per_peer)
+            ])
+    db = SessionLocal()
+    try:
+        conversations.rebuild_summaries(db)
+    finally:
+        db.close()
+
+
+async def previous_inbox():
+    message = models.ChatMessage
+    async with AsyncSessionLocal() as db:
+        sent = await db.execute(select(message.receiver_id).where(message.sender_id == OWNER).distinct())
+        received = await db.execute(select(message.sender_id).where(message.receiver_id == OWNER).distinct())
+        user_ids = set([r[0] for r in sent] + [r[0] for r in received])
+        users = (await db.execute(select(models.User).where(models.User.id.in_(user_ids)))).scalars().all()
+        inbox = []
+        for user in users:
+            last = (await db.execute(
+                select(message).where(message.user_low == min(OWNER, user.id), message.user_high == max(OWNER, user.id))
+                .order_by(message.created_at.desc(), message.id.desc()).limit(1)
+            )).scalars().first()
+            unread = await db.scalar(select(func.count()).where(message.sender_id == user.id, message.receiver_id == OWNER, message.is_read.is_(False)))
+            inbox.append((user.id, last.message, unread))
+        return inbox
+
+
+async def summary_inbox(limit):
+    async with AsyncSessionLocal() as db:
+        rows = await paginate(db, conversations.inbox_query(OWNER), conversations.INBOX_KEY, Response(), None, 0, limit, entities=False)
+        return serializer(schemas.ConversationSummary).to_dicts(rows)
+
+
+if __name__ == "__main__":
+    n_peers = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    per_peer = int(sys.argv[2]) if len(sys.argv) > 2 else 250
+    reset_schema()
+    seed(n_peers, per_peer)
+    counter = QueryCounter()
+    with counter.track():
+        previous = run(previous_inbox())
+    previous_queries = counter.count
+    with counter.track():
+        summary = run(summary_inbox(n_peers))
+    summary_queries = counter.count
+    assert sorted((row[0], row[1], row[2]) for row in previous) == sorted((item["peer_id"], item["last_message"], item["unread_count"]) for item in summary)
+    previous_seconds, _ = timed(lambda: run(previous_inbox()), repeat=3)
+    summary_seconds, _ = timed(lambda: run(summary_inbox(50)), repeat=20)
+    print(f"peers={n_peers} messages={n_peers * per_peer}")
+    print(f"previous full inbox:   {previous_seconds * 1000:8.2f} ms {previous_queries} queries")
+    print(f"summary first 50:      {summary_seconds * 1000:8.2f} ms {summary_queries} query")
+    close()
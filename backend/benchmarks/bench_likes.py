@@ -0,0 +1,100 @@
+"""Likes per second on one hot post, every user double-tapping it at once.
+
+    python -m benchmarks.bench_likes [users] [concurrency]
+
+"select+insert" is the previous like_post: load the post, look for an existing
+like, insert and bump the counter. Two taps from the same user race past the
+lookup, and the unique index now turns the second insert into an error.
+"upsert" is likes.like, one INSERT ... ON CONFLICT DO NOTHING plus the counter
+update. "write-behind" buffers taps in memory and includes the final flush.
+
+Uses a temporary SQLite file unless DATABASE_URL points somewhere else. SQLite
+has one writer at a time, so concurrent per-tap transactions also fail with
+"database is locked" when their locks collide; on Postgres they queue on the
+post's counter row instead. Write-behind takes both out of the request path.
+"""
+import asyncio
+import sys
+import time
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError, OperationalError
+from benchmarks.common import QueryCounter, close, reset_schema, run
+from counters import adjust_post_counts
+from database import AsyncSessionLocal, engine
+import jobs
+import likes
+import models
+
+
+def seed(n):
+    with engine.begin() as conn:
+        conn.execute(models.User.__table__.insert(), [
+            {"email": f"u{i}@example.com", "username": f"u{i}", "full_name": f"User {i}", "hashed_password": "x"} for i in range(n)
+        ])
+        conn.execute(models.Post.__table__.insert(), [{"content": "going viral", "author_id": 1}])
+
+
+async def select_insert(db, post_id, user_id):
+    post = await db.get(models.Post, post_id)
+    existing = (await db.execute(select(models.Like).where(models.Like.post_id == post_id, models.Like.user_id == user_id))).scalars().first()
+    if post and not existing:
+        db.add(models.Like(post_id=post_id, user_id=user_id))
+        await adjust_post_counts(db, post_id, likes=1)
+        await db.commit()
+
+
+async def upsert(db, post_id, user_id):
+    await likes.like(db, post_id, user_id)
+
+
+async def hammer(tap, taps, concurrency):
+    queue = asyncio.Queue()
+    for user_id in taps:
+        queue.put_nowait(user_id)
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        while not queue.empty():
+            user_id = queue.get_nowait()
+            try:
+                async with AsyncSessionLocal() as db:
+                    await tap(db, 1, user_id)
+            except (IntegrityError, OperationalError):
+                errors += 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return errors
+
+
+async def scenario(name, n, concurrency):
+    # each user taps twice, the second tap racing the first
+    taps = [user_id for user_id in range(1, n + 1) for _ in range(2)]
+    if name == "write-behind":
+        likes.LIKES_WRITE_BEHIND = True
+        await likes.writer.start()
+    errors = await hammer(select_insert if name == "select+insert" else upsert, taps, concurrency)
+    if name == "write-behind":
+        await likes.writer.stop()
+        likes.LIKES_WRITE_BEHIND = False
+    async with AsyncSessionLocal() as db:
+        rows = await db.scalar(select(func.count()).select_from(models.Like))
+        count = await db.scalar(select(models.Post.likes_count).where(models.Post.id == 1))
+    return len(taps), errors, rows, count
+
+
+if __name__ == "__main__":
+    n, concurrency = [int(arg) for arg in sys.argv[1:3]] + [500, 20][len(sys.argv[1:3]):]
+    counter = QueryCounter()
+    print(f"users={n} taps={2 * n} concurrency={concurrency}")
+    for name in ("select+insert", "upsert", "write-behind"):
+        reset_schema()
+        seed(n)
+        with counter.track():
+            start = time.perf_counter()
+            taps, errors, rows, count = run(scenario(name, n, concurrency))
+            seconds = time.perf_counter() - start
+        print(f"{name:14} {taps / seconds:9.0f} taps/s {counter.count / taps:5.2f} statements/tap "
+              f"{errors:5d} errors  likes={rows} likes_count={count}")
+    run(jobs.runner.stop())
+    close()
@@ -0,0 +1,73 @@
+"""Login throughput and the latency of other endpoints during a login flood.
+
+    python -m benchmarks.bench_login_flood [seconds] [concurrency]
+
+"threadpool" mimics the previous setup: bcrypt on up to 40 threads, no limit on
+waiting logins. "pool" is the hashing pool as configured (HASH_POOL_WORKERS,
+HASH_POOL_MAX_PENDING), which turns surplus logins away with 503. Meanwhile a
+probe client reads GET /posts/ in a loop, and its p99 shows what the flood costs
+everyone else. BCRYPT_ROUNDS defaults to 10 here to keep runs short.
+"""
+import asyncio
+import os
+import sys
+import time
+os.environ.setdefault("BCRYPT_ROUNDS", "10")
+from benchmarks.asgi import request
+from benchmarks.common import close, percentile, reset_schema, run
+from database import engine
+import hashing
+import models
+from main import app
+
+N_USERS = 50
+
+
+def seed():
+    hashed = hashing.hash_password_sync("flood-password")
+    with engine.begin() as conn:
+        conn.execute(models.User.__table__.insert(), [
+            {"email": f"u{i}@example.com", "username": f"u{i}", "full_name": f"User {i}", "hashed_password": hashed} for i in range(N_USERS)
+        ])
+        conn.execute(models.Post.__table__.insert(), [{"content": f"post {i}", "author_id": i % N_USERS + 1} for i in range(200)])
+
+
+async def flood(seconds, concurrency):
+    deadline = time.perf_counter() + seconds
+    logins, statuses, probes = [], {}, []
+
+    async def login_worker(index):
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            response = await request(app, "POST", "/token", form={"username": f"u{index % N_USERS}", "password": "flood-password"})
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            if response.status_code == 200:
+                logins.append(time.perf_counter() - start)
+            else:
+                # a rejected client backs off briefly, as the Retry-After header asks
+                await asyncio.sleep(0.05)
+
+    async def probe():
+        while time.perf_counter() < deadline:
+            response = await request(app, "GET", "/posts/")
+            probes.append(response.seconds)
+            await asyncio.sleep(0.02)
+
+    await asyncio.gather(probe(), *(login_worker(index) for index in range(concurrency)))
+    return logins, statuses, probes
+
+
+if __name__ == "__main__":
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+    reset_schema()
+    seed()
+    configured = hashing.pool
+    for name, pool in (("threadpool", hashing.HashPool(workers=40, max_pending=10 ** 9)), ("pool", configured)):
+        hashing.pool = pool
+        logins, statuses, probes = run(flood(seconds, concurrency))
+        print(f"{name:10} logins/s={len(logins) / seconds:7.1f} login_p99={percentile(logins, 99) * 1000:8.1f} ms "
+              f"posts_p50={percentile(probes, 50) * 1000:7.1f} ms posts_p99={percentile(probes, 99) * 1000:7.1f} ms "
+              f"statuses={statuses} pool={pool.stats()}")
+        pool.shutdown()
+    close()
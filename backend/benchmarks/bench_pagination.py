@@ -0,0 +1,57 @@
+"""Latency of deep /posts pages: OFFSET vs keyset cursor.
+
+    python -m benchmarks.bench_pagination [posts]
+"""
+import sys
+from datetime import datetime, timedelta
+from fastapi import Response
+from benchmarks.common import close, reset_schema, run, timed
+from database import AsyncSessionLocal, SessionLocal, engine
+import models
+from pagination import encode_cursor
+from routes import posts as posts_routes
+
+
+def seed(n_posts):
+    with engine.begin() as conn:
+        conn.execute(models.User.__table__.insert(), [{"email": "a@example.com", "username": "a", "full_name": "A", "hashed_password": "x"}])
+        start = datetime(2020, 1, 1)
+        for offset in range(0, n_posts, 10000):
+            conn.execute(models.Post.__table__.insert(), [
+                {"content": f"post {i}", "author_id": 1, "created_at": start + timedelta(seconds=i)}
+                for i in range(offset, min(offset + 10000, n_posts))
+            ])
+
+
+async def fetch_page(skip, cursor, limit):
+    async with AsyncSessionLocal() as db:
+        response = Response()
+        await posts_routes.get_posts(response, skip=skip, limit=limit, cursor=cursor, db=db)
+        return response.headers.get("X-Next-Cursor")
+
+
+def fetch(skip=0, cursor=None, limit=20):
+    return run(fetch_page(skip, cursor, limit))
+
+
+def cursor_for_page(page, limit=20):
+    """Cursor pointing at the start of page, built the way a client walking the feed would see it"""
+    db = SessionLocal()
+    try:
+        row = db.query(models.Post).order_by(models.Post.created_at.desc(), models.Post.id.desc()).offset(page * limit - 1).first()
+        return encode_cursor((row.created_at, row.id))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    n_posts = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    reset_schema()
+    seed(n_posts)
+    last_page = n_posts // 20 - 1
+    for page in (1, 100, last_page // 2, last_page):
+        offset_s, _ = timed(lambda: fetch(skip=page * 20))
+        cursor = cursor_for_page(page)
+        cursor_s, _ = timed(lambda: fetch(cursor=cursor))
+        print(f"page {page:6d}  offset={offset_s * 1000:8.2f} ms  cursor={cursor_s * 1000:8.2f} ms")
+    close()
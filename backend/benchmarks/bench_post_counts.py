@@ -0,0 +1,69 @@
+"""Queries and time per /posts page: len(post.likes) vs denormalized counters.
+
+    python -m benchmarks.bench_post_counts [posts] [likes_per_post] [comments_per_post]
+"""
+import sys
+from benchmarks.common import QueryCounter, close, reset_schema, run, timed
+from database import AsyncSessionLocal, SessionLocal
+import models, schemas
+from counters import reconcile_post_counts
+from fastapi import Response
+from routes import posts as posts_routes
+
+
+def seed(n_posts, likes_per_post, comments_per_post):
+    db = SessionLocal()
+    users = [models.User(email=f"u{i}@example.com", username=f"u{i}", full_name=f"User {i}", hashed_password="x")
+             for i in range(max(likes_per_post, comments_per_post, 1))]
+    db.add_all(users)
+    db.flush()
+    for i in range(n_posts):
+        post = models.Post(content=f"post {i}", author_id=users[i % len(users)].id)
+        db.add(post)
+        db.flush()
+        db.bulk_save_objects([models.Like(post_id=post.id, user_id=users[j].id) for j in range(likes_per_post)])
+        db.bulk_save_objects([models.Comment(post_id=post.id, author_id=users[j].id, content="c") for j in range(comments_per_post)])
+    db.commit()
+    reconcile_post_counts(db)
+    db.close()
+
+
+def legacy_page(db, limit):
+    posts = db.query(models.Post).order_by(models.Post.created_at.desc()).limit(limit).all()
+    return [{**schemas.Post.model_validate(post).model_dump(), "likes_count": len(post.likes), "comments_count": len(post.comments)}
+            for post in posts]
+
+
+def legacy(limit=20):
+    db = SessionLocal()
+    try:
+        return legacy_page(db, limit)
+    finally:
+        db.close()
+
+
+async def counters_page(limit=20):
+    async with AsyncSessionLocal() as db:
+        posts = await posts_routes.get_posts(Response(), skip=0, limit=limit, db=db)
+        return [schemas.Post.model_validate(post).model_dump() for post in posts]
+
+
+def measure(page_fn):
+    counter = QueryCounter()
+
+    def page():
+        with counter.track():
+            return page_fn()
+
+    seconds, _ = timed(page)
+    return counter.count, seconds
+
+
+if __name__ == "__main__":
+    n_posts, likes, comments = [int(arg) for arg in sys.argv[1:4]] + [200, 500, 50][len(sys.argv[1:4]):]
+    reset_schema()
+    seed(n_posts, likes, comments)
+    for name, fn in (("len(post.likes)", legacy), ("counter columns", lambda: run(counters_page()))):
+        queries, seconds = measure(fn)
+        print(f"{name:16} queries/page={queries:4d} best={seconds * 1000:8.2f} ms")
+    close()
@@ -0,0 +1,74 @@
+"""Public read endpoints with and without the response cache.
+
+    python -m benchmarks.bench_response_cache [requests] [concurrency]
+
+Requests are spread over a handful of hot posts, user profiles and follower
+lists, as a page of clients polling the same things would. "cold" starts from an
+empty cache, so it shows how concurrent misses for one key are coalesced into a
+single handler run; "warm" repeats the same requests.
+"""
+import asyncio
+import random
+import sys
+import time
+from benchmarks.asgi import request
+from benchmarks.common import QueryCounter, close, percentile, reset_schema, run
+from database import engine
+from main import app
+import models
+import response_cache
+
+HOT_KEYS = 20
+N_USERS = 200
+
+
+def seed():
+    with engine.begin() as conn:
+        conn.execute(models.User.__table__.insert(), [
+            {"email": f"u{i}@example.com", "username": f"u{i}", "full_name": f"User {i}", "hashed_password": "x"} for i in range(N_USERS)
+        ])
+        conn.execute(models.followers.insert(), [
+            {"follower_id": follower, "following_id": user} for user in range(1, HOT_KEYS + 1) for follower in range(HOT_KEYS + 1, HOT_KEYS + 51)
+        ])
+        conn.execute(models.Post.__table__.insert(), [{"content": f"post {i} " * 20, "author_id": i % N_USERS + 1} for i in range(2000)])
+
+
+def paths(total):
+    rng = random.Random(15)
+    choices = [f"/posts/{i}" for i in range(1, HOT_KEYS + 1)] + [f"/users/{i}" for i in range(1, HOT_KEYS + 1)] + [f"/users/{i}/followers" for i in range(1, HOT_KEYS + 1)]
+    return [rng.choice(choices) for _ in range(total)]
+
+
+async def scenario(targets, concurrency):
+    latencies, pending = [], iter(targets)
+
+    async def worker():
+        for path in pending:
+            response = await request(app, "GET", path)
+            latencies.append(response.seconds)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - start, latencies
+
+
+if __name__ == "__main__":
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    reset_schema()
+    seed()
+    targets = paths(total)
+    counter = QueryCounter()
+    for name, enabled in (("uncached", False), ("cold", True), ("warm", True)):
+        response_cache.RESPONSE_CACHE_ENABLED = enabled
+        if name == "cold":
+            response_cache.configure()
+        response_cache.route_stats.clear()
+        with counter.track():
+            elapsed, latencies = run(scenario(targets, concurrency))
+        routes = response_cache.stats()["routes"].values()
+        hits = sum(entry["hits"] + entry["coalesced"] for entry in routes)
+        coalesced = sum(entry["coalesced"] for entry in routes)
+        print(f"{name:9} req/s={total / elapsed:8.1f} p50={percentile(latencies, 50) * 1000:7.2f} ms p99={percentile(latencies, 99) * 1000:7.2f} ms "
+              f"queries={counter.count:6d} hit_ratio={hits / total:5.3f} coalesced={coalesced}")
+    close()
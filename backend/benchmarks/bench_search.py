@@ -0,0 +1,114 @@
+"""Search latency over a synthetic corpus: the full-text index vs a LIKE scan.
+
+    python -m benchmarks.bench_search [posts]
+
+Post bodies draw words from a Zipf-distributed vocabulary, so there are very common
+terms, rare ones and everything in between. The LIKE scan stands in for what
+clients do today (page through /posts/ and filter), minus the network; it is
+unranked, so it stops at the first 20 hits and looks fast for common words. The
+in-memory index is only measured for corpora of up to 200k posts.
+"""
+import itertools
+import random
+import sys
+import time
+from sqlalchemy import text
+from benchmarks.common import close, percentile, reset_schema, run
+from database import AsyncSessionLocal, engine
+import models
+import search
+
+VOCABULARY = 50_000
+WORDS_PER_POST = 12
+CHUNK = 50_000
+REPEAT = 20
+MEMORY_LIMIT = 200_000
+
+
+def make_vocabulary(rng):
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = set()
+    while len(words) < VOCABULARY:
+        words.add("".join(rng.choice(letters) for _ in range(rng.randint(3, 9))))
+    return sorted(words, key=lambda word: rng.random())
+
+
+def seed(n_posts, vocabulary, rng):
+    cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, VOCABULARY + 1)))
+    with engine.begin() as conn:
+        conn.execute(models.User.__table__.insert(), [
+            {"email": f"u{i}@example.com", "username": f"u{i}", "full_name": f"User {i}", "hashed_password": "x"} for i in range(100)
+        ])
+    for start in range(0, n_posts, CHUNK):
+        rows = [
+            {"content": " ".join(rng.choices(vocabulary, cum_weights=cum_weights, k=WORDS_PER_POST)), "author_id": i % 100 + 1}
+            for i in range(start, min(n_posts, start + CHUNK))
+        ]
+        with engine.begin() as conn:
+            conn.execute(models.Post.__table__.insert(), rows)
+
+
+def queries(vocabulary):
+    return {
+        "common": vocabulary[0],
+        "mid": vocabulary[500],
+        "rare": vocabulary[20_000],
+        "prefix": vocabulary[1][:3],
+        "two_terms": f"{vocabulary[3]} {vocabulary[40]}",
+    }
+
+
+async def time_search(query):
+    samples, hits = [], 0
+    async with AsyncSessionLocal() as db:
+        for _ in range(REPEAT):
+            start = time.perf_counter()
+            hits = len(await search.search(db, query, ["post"], _Headers(), limit=20))
+            samples.append(time.perf_counter() - start)
+    return samples, hits
+
+
+async def time_like(query):
+    terms = search.tokenize(query)
+    where = " AND ".join(f"lower(content) LIKE :t{n}" for n in range(len(terms)))
+    statement = text(f"SELECT id FROM posts WHERE {where} ORDER BY id DESC LIMIT 20")
+    params = {f"t{n}": f"%{term}%" for n, term in enumerate(terms)}
+    samples, hits = [], 0
+    async with AsyncSessionLocal() as db:
+        for _ in range(max(1, REPEAT // 4)):
+            start = time.perf_counter()
+            hits = len((await db.execute(statement, params)).all())
+            samples.append(time.perf_counter() - start)
+    return samples, hits
+
+
+class _Headers:
+    headers = {}
+
+
+def report(name, label, samples, hits):
+    print(f"{name:8} {label:10} p50={percentile(samples, 50) * 1000:9.2f} ms p99={percentile(samples, 99) * 1000:9.2f} ms hits={hits}")
+
+
+if __name__ == "__main__":
+    n_posts = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    rng = random.Random(13)
+    vocabulary = make_vocabulary(rng)
+    reset_schema()
+    start = time.perf_counter()
+    seed(n_posts, vocabulary, rng)
+    print(f"seeded {n_posts} posts in {time.perf_counter() - start:.1f} s")
+    backends = [search.configure(engine)]
+    if n_posts <= MEMORY_LIMIT and backends[0].name != "memory":
+        backends.append(search.MemoryBackend())
+    for backend in backends:
+        search.backend = backend
+        start = time.perf_counter()
+        with engine.begin() as conn:
+            backend.rebuild(conn)
+        print(f"{backend.name:8} indexed in {time.perf_counter() - start:.1f} s")
+        for label, query in queries(vocabulary).items():
+            report(backend.name, label, *run(time_search(query)))
+    for label, query in queries(vocabulary).items():
+        report("like", label, *run(time_like(query)))
+    close()
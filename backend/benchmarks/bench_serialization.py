@@ -0,0 +1,70 @@
+"""Feed page rendering: hydrated ORM rows through pydantic vs column tuples through RowSerializer.
+
+    python -m benchmarks.bench_serialization [authors]
+
+"current" is what FastAPI did for response_model=List[schemas.Post]: load Post
+entities with their authors, validate them with from_attributes, dump in JSON
+mode and render with the stdlib encoder. "rows" selects only the serialized
+columns, builds dicts directly with each author built once per page, and
+renders with orjson. Both bodies are checked to decode to the same data.
+"""
+import json
+import sys
+from typing import List
+from pydantic import TypeAdapter
+from benchmarks.common import close, reset_schema, run, timed
+from database import AsyncSessionLocal, engine
+import models, schemas
+from loaders import shaped_select
+from serializers import FastJSONResponse, row_select, serializer
+
+PAGE_SIZES = (20, 100, 500)
+adapter = TypeAdapter(List[schemas.Post])
+
+
+def seed(n_authors, n_posts=2000):
+    with engine.begin() as conn:
+        conn.execute(models.User.__table__.insert(), [
+            {"email": f"u{i}@example.com", "username": f"u{i}", "full_name": f"User {i}", "hashed_password": "x", "bio": "Alumni of the class of 2010 " * 3}
+            for i in range(n_authors)
+        ])
+        conn.execute(models.Post.__table__.insert(), [
+            {"content": f"post {i} " + "lorem ipsum " * 15, "author_id": i % n_authors + 1, "likes_count": i % 7, "comments_count": i % 3}
+            for i in range(n_posts)
+        ])
+
+
+def render_current(posts) -> bytes:
+    payload = adapter.dump_python(adapter.validate_python(posts, from_attributes=True), mode="json")
+    return json.dumps(payload, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode()
+
+
+def render_rows(rows) -> bytes:
+    return FastJSONResponse(serializer(schemas.Post).to_dicts(rows)).body
+
+
+async def load_current(limit):
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(shaped_select(schemas.Post).order_by(models.Post.id.desc()).limit(limit))).scalars().all()
+
+
+async def load_rows(limit):
+    async with AsyncSessionLocal() as db:
+        return [tuple(row) for row in await db.execute(row_select(schemas.Post).order_by(models.Post.id.desc()).limit(limit))]
+
+
+if __name__ == "__main__":
+    n_authors = int(sys.argv[1]) if len(sys.argv) > 1 else 25
+    reset_schema()
+    seed(n_authors)
+    for limit in PAGE_SIZES:
+        posts, rows = run(load_current(limit)), run(load_rows(limit))
+        assert json.loads(render_current(posts)) == json.loads(render_rows(rows))
+        serialize_current, _ = timed(lambda: render_current(posts), repeat=20)
+        serialize_rows, _ = timed(lambda: render_rows(rows), repeat=20)
+        total_current, _ = timed(lambda: render_current(run(load_current(limit))), repeat=20)
+        total_rows, _ = timed(lambda: render_rows(run(load_rows(limit))), repeat=20)
+        print(f"items={limit:4d} serialize current={serialize_current * 1000:7.2f} ms rows={serialize_rows * 1000:6.2f} ms "
+              f"({serialize_current / serialize_rows:4.1f}x)  load+serialize current={total_current * 1000:7.2f} ms "
+              f"rows={total_rows * 1000:6.2f} ms ({total_current / total_rows:4.1f}x)")
+    close()
@@ -0,0 +1,103 @@
+"""Cold start: how long importing main takes and how long until the first request is answered.
+
+    python -m benchmarks.bench_startup [runs]
+
+Every run is a fresh interpreter against an already migrated SQLite file, once
+with Redis refusing connections and once with Redis accepting them and never
+answering, the way a hung or black-holed instance behaves. Prints JSON with the
+median of each stage per case and the slowest imports from -X importtime.
+"""
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+from benchmarks.common import BACKEND_DIR
+
+STARTUP_TIMEOUT = 30
+
+CHILD = """
+import time
+start = time.perf_counter()
+import asyncio, json
+import main
+imported = time.perf_counter()
+from benchmarks.asgi import request
+
+async def first_request():
+    async with main.app.router.lifespan_context(main.app):
+        started = time.perf_counter()
+        response = await request(main.app, "GET", "/health")
+        return started, time.perf_counter(), response.status_code
+
+started, answered, status = asyncio.run(first_request())
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "startup_ms": (started - imported) * 1000,
+    "first_request_ms": (answered - started) * 1000,
+    "total_ms": (answered - start) * 1000,
+    "status": status,
+}))
+"""
+
+
+def child_env(database_url: str, redis_url: str) -> dict:
+    env = dict(os.environ, DATABASE_URL=database_url, REDIS_URL=redis_url)
+    env.setdefault("SECRET_KEY", "benchmark-secret")
+    env.setdefault("ALGORITHM", "HS256")
+    return env
+
+
+def start_once(env: dict, *flags):
+    try:
+        done = subprocess.run((sys.executable, *flags, "-c", CHILD), cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=STARTUP_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        return None, ""
+    lines = done.stdout.strip().splitlines()
+    return (json.loads(lines[-1]) if done.returncode == 0 and lines else None), done.stderr
+
+
+def slowest_imports(stderr: str, top: int = 10):
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        imports.append((int(cumulative), name.strip()))
+    return [{"module": name, "cumulative_ms": round(us / 1000, 1)} for us, name in sorted(imports, reverse=True)[:top]]
+
+
+def measure(env: dict, runs: int) -> dict:
+    samples = []
+    for _ in range(runs):
+        result, stderr = start_once(env)
+        if result is None:
+            return {"timed_out_after_s": STARTUP_TIMEOUT, "error": stderr.strip().splitlines()[-1:] or None}
+        samples.append(result)
+    return {stage: round(statistics.median(sample[stage] for sample in samples), 1) for stage in ("import_ms", "startup_ms", "first_request_ms", "total_ms")}
+
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='alumni-startup-'), 'startup.db')}"
+    # listens but never accepts, so connects succeed and replies never come
+    stalled = socket.socket()
+    stalled.bind(("127.0.0.1", 0))
+    stalled.listen(128)
+    closed = socket.socket()
+    closed.bind(("127.0.0.1", 0))
+    refused_url = f"redis://127.0.0.1:{closed.getsockname()[1]}"
+    closed.close()
+    # the first start creates the schema and is not counted
+    start_once(child_env(database_url, refused_url))
+    _, importtime = start_once(child_env(database_url, refused_url), "-X", "importtime")
+    report = {
+        "runs": runs,
+        "redis_refused": measure(child_env(database_url, refused_url), runs),
+        "redis_stalled": measure(child_env(database_url, f"redis://127.0.0.1:{stalled.getsockname()[1]}"), runs),
+        "slowest_imports": slowest_imports(importtime),
+    }
+    stalled.close()
+    print(json.dumps(report, indent=2))
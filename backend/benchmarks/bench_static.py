@@ -0,0 +1,57 @@
+"""CPU time and bytes per request for the frontend: FileResponse vs the in-memory asset store.
+
+    python -m benchmarks.bench_static [requests]
+
+"FileResponse" is the previous serve_frontend: build the path, stat and stream
+index.html from disk with no compression or validators. The others go through
+the app's routes: a first visit with gzip, a revisit answered 304 from the
+ETag, and app.js under its hashed URL, which browsers then keep for a year
+without asking again.
+"""
+import os
+import re
+import sys
+import time
+from fastapi.responses import FileResponse
+from benchmarks.asgi import request
+from benchmarks.common import BACKEND_DIR, close, run
+import assets
+
+
+async def scenario(app, path, headers, n):
+    cpu = time.process_time()
+    wall = time.perf_counter()
+    sent = 0
+    for _ in range(n):
+        response = await request(app, "GET", path, headers=headers)
+        sent += len(response.content)
+    return response.status_code, (time.process_time() - cpu) / n, n / (time.perf_counter() - wall), sent / n
+
+
+async def main(app, n):
+    @app.get("/bench/legacy")
+    async def legacy():
+        return FileResponse(os.path.join(BACKEND_DIR, "..", "frontend", "index.html"))
+
+    async with app.router.lifespan_context(app):
+        page = await request(app, "GET", "/")
+        script = re.search(r'src="(/static/app\.[0-9a-f]+\.js)"', page.content.decode()).group(1)
+        etag = (await request(app, "GET", "/", headers={"accept-encoding": "gzip"})).headers["etag"]
+        cases = [
+            ("FileResponse", "/bench/legacy", {"accept-encoding": "gzip"}),
+            ("first visit", "/", {"accept-encoding": "gzip"}),
+            ("revisit 304", "/", {"accept-encoding": "gzip", "if-none-match": etag}),
+            ("hashed app.js", script, {"accept-encoding": "gzip"}),
+        ]
+        print(f"requests={n} brotli={'yes' if assets.brotli else 'no'}")
+        for name, path, headers in cases:
+            status, cpu, rps, size = await scenario(app, path, headers, n)
+            print(f"{name:14} {status} {cpu * 1e6:8.0f} us cpu/request {rps:8.0f} req/s {size:9.0f} bytes/response")
+
+
+if __name__ == "__main__":
+    os.environ.setdefault("REDIS_URL", "redis://127.0.0.1:1")
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    from main import app
+    run(main(app, n))
+    close()
@@ -0,0 +1,129 @@
+"""Chat ingestion with simulated sockets: per-message commit and direct sends vs the echo-first pipeline.
+
+    python -m benchmarks.bench_ws_pipeline [sockets] [messages] [broadcasts]
+
+Every socket sends its share of messages one after another, as its receive loop
+would. A few sockets are slow readers. They stall the inline broadcast for everyone
+and are dropped by the pipeline once their outbox fills up.
+"""
+import asyncio
+import sys
+import time
+from sqlalchemy import func, select
+from benchmarks.common import close, percentile, reset_schema, run
+from database import AsyncSessionLocal, engine
+from connections import ConnectionManager
+import chat_pipeline
+import models, schemas
+
+SLOW_SOCKETS = 10
+SLOW_SEND_SECONDS = 0.01
+# small outboxes so the slow readers overflow within a short run
+QUEUE_SIZE = 64
+
+
+class SimulatedSocket:
+    def __init__(self, user_id, sent_at, latencies, slow=False):
+        self.user_id = user_id
+        self.sent_at = sent_at
+        self.latencies = latencies
+        self.slow = slow
+
+    async def accept(self):
+        pass
+
+    async def close(self, code=1000):
+        pass
+
+    async def send_json(self, message):
+        if self.slow:
+            await asyncio.sleep(SLOW_SEND_SECONDS)
+        if message.get("receiver_id") == self.user_id and message["message"] in self.sent_at:
+            self.latencies.append(time.perf_counter() - self.sent_at[message["message"]])
+
+
+def seed(n_users):
+    with engine.begin() as conn:
+        conn.execute(models.User.__table__.insert(), [
+            {"email": f"u{i}@example.com", "username": f"u{i}", "full_name": f"User {i}", "hashed_password": "x"} for i in range(n_users)
+        ])
+
+
+async def inline_ingest(manager, sender, message_data):
+    """The previous handler: commit, then send to each party in turn"""
+    chat_message = models.ChatMessage(sender_id=sender.id, receiver_id=message_data["receiver_id"], message=message_data["message"])
+    async with AsyncSessionLocal() as db:
+        db.add(chat_message)
+        await db.commit()
+    response_data = {"id": chat_message.id, "sender_id": sender.id, "receiver_id": message_data["receiver_id"], "message": message_data["message"]}
+    for user_id in (message_data["receiver_id"], sender.id):
+        connection = manager.active_connections.get(user_id)
+        if connection:
+            await connection.websocket.send_json(response_data)
+
+
+async def inline_broadcast(manager, message):
+    for connection in list(manager.active_connections.values()):
+        await connection.websocket.send_json(message)
+
+
+async def scenario(mode, n_sockets, n_messages, n_broadcasts):
+    manager = ConnectionManager(QUEUE_SIZE)
+    chat_pipeline.manager = manager
+    writer = chat_pipeline.writer = chat_pipeline.ChatWriter()
+    await writer.start()
+    sent_at, latencies = {}, []
+    users = [schemas.UserSnapshot(id=i, email=f"u{i}@example.com", username=f"u{i}", full_name=f"User {i}", created_at="2020-01-01T00:00:00") for i in range(1, n_sockets + 1)]
+    for user in users:
+        await manager.connect(user.id, SimulatedSocket(user.id, sent_at, latencies, slow=user.id <= SLOW_SOCKETS))
+
+    async def socket_loop(index):
+        sender = users[index]
+        for n in range(index, n_messages, n_sockets):
+            text = f"m{n}"
+            message_data = {"receiver_id": users[(index + n + 1) % n_sockets].id, "message": text}
+            # stands in for awaiting the next frame from the socket
+            await asyncio.sleep(0)
+            sent_at[text] = time.perf_counter()
+            if mode == "inline":
+                await inline_ingest(manager, sender, message_data)
+            else:
+                await chat_pipeline.ingest(sender, message_data)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(socket_loop(index) for index in range(n_sockets)))
+    accepted = time.perf_counter() - start
+    await writer.stop()
+    persisted = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for n in range(n_broadcasts):
+        message = {"type": "announcement", "message": f"b{n}"}
+        if mode == "inline":
+            await inline_broadcast(manager, message)
+        else:
+            await manager.broadcast(message)
+        await asyncio.sleep(0)
+    broadcast = time.perf_counter() - start
+    # let outboxes drain before the next scenario reuses the loop
+    while any(connection.queue.qsize() for connection in manager.active_connections.values()):
+        await asyncio.sleep(0.01)
+    for connection in manager.active_connections.values():
+        connection.sender.cancel()
+
+    async with AsyncSessionLocal() as db:
+        stored = await db.scalar(select(func.count(models.ChatMessage.id)))
+    print(f"{mode:8} msg/s={n_messages / accepted:9.1f} persisted_in={persisted:6.2f} s stored={stored} "
+          f"p50={percentile(latencies, 50) * 1000:7.2f} ms p99={percentile(latencies, 99) * 1000:7.2f} ms "
+          f"broadcasts/s={n_broadcasts / broadcast:8.1f} dropped={manager.dropped} batches={writer.batches}")
+
+
+if __name__ == "__main__":
+    n_sockets = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    n_messages = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    n_broadcasts = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+    for mode in ("inline", "pipeline"):
+        reset_schema()
+        seed(n_sockets)
+        run(scenario(mode, n_sockets, n_messages, n_broadcasts))
+    close()
@@ -0,0 +1,94 @@
+"""Check that every list endpoint issues the same number of queries whatever the page size.
+
+A count that grows with ?limit= means something in the response is lazy loaded per row;
+declare the relationship in loaders.RESPONSE_SHAPES. Exits non-zero on any mismatch.
+
+    python -m benchmarks.check_query_counts
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+# hold every page size in the chat cache so its read path compares like for like
+os.environ.setdefault("CHAT_CACHE_LENGTH", "1000")
+from benchmarks.asgi import request
+from benchmarks.common import close, reset_schema, run
+from database import engine
+from auth import create_access_token
+from instrumentation import QUERY_COUNT_HEADER
+from main import app
+import models
+
+ROWS = 150
+PAGE_SIZES = (5, 20, 100)
+ENDPOINTS = (
+    ("/posts/", {}),
+    ("/posts/feed", {}),
+    ("/posts/1/comments", {}),
+    ("/events/", {}),
+    # an explicit window always reads events from the database rather than the upcoming cache
+    ("/events/", {"from": "2000-01-01T00:00:00"}),
+    ("/users/", {}),
+    ("/users/1/followers", {}),
+    ("/users/1/following", {}),
+    ("/chat/history/2", {}),
+    # an offset always reads chat history from the database rather than the cache
+    ("/chat/history/2", {"skip": 1}),
+)
+
+
+def seed():
+    start = datetime(2020, 1, 1)
+    users = [
+        {"email": f"u{i}@example.com", "username": f"u{i}", "full_name": f"User {i}", "hashed_password": "x", "created_at": start + timedelta(seconds=i)}
+        for i in range(1, ROWS + 1)
+    ]
+    with engine.begin() as conn:
+        conn.execute(models.User.__table__.insert(), users)
+        conn.execute(models.followers.insert(), [{"follower_id": 1, "following_id": i} for i in range(2, ROWS + 1)])
+        conn.execute(models.followers.insert(), [{"follower_id": i, "following_id": 1} for i in range(2, ROWS + 1)])
+        conn.execute(models.Post.__table__.insert(), [
+            {"content": f"post {i}", "author_id": i % ROWS + 1, "created_at": start + timedelta(seconds=i)} for i in range(ROWS)
+        ])
+        conn.execute(models.Comment.__table__.insert(), [
+            {"content": f"comment {i}", "post_id": 1, "author_id": i % ROWS + 1, "created_at": start + timedelta(seconds=i)} for i in range(ROWS)
+        ])
+        conn.execute(models.Event.__table__.insert(), [
+            {"title": f"event {i}", "description": "", "event_date": datetime.utcnow() + timedelta(days=i + 1), "location": "", "creator_id": i % ROWS + 1}
+            for i in range(ROWS)
+        ])
+        conn.execute(models.ChatMessage.__table__.insert(), [
+            {"sender_id": 1 + i % 2, "receiver_id": 2 - i % 2, "message": f"message {i}", "created_at": start + timedelta(seconds=i)}
+            for i in range(ROWS)
+        ])
+
+
+async def query_counts(headers):
+    counts = {}
+    for path, params in ENDPOINTS:
+        # first hit warms the principal cache, the feed timeline and the chat cache
+        await request(app, "GET", path, headers=headers, params=params)
+        label = f"{path}?{urlencode(params)}" if params else path
+        for limit in PAGE_SIZES:
+            response = await request(app, "GET", path, headers=headers, params={**params, "limit": limit})
+            if response.status_code != 200:
+                raise RuntimeError(f"{label} returned {response.status_code}: {response.content[:200]}")
+            counts.setdefault(label, []).append(int(response.headers[QUERY_COUNT_HEADER.lower()]))
+    return counts
+
+
+if __name__ == "__main__":
+    reset_schema()
+    seed()
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'u1'})}"}
+    try:
+        counts = run(query_counts(headers))
+    finally:
+        close()
+    failed = False
+    for path, per_limit in counts.items():
+        constant = len(set(per_limit)) == 1
+        failed = failed or not constant
+        sizes = "  ".join(f"limit={limit}:{count}" for limit, count in zip(PAGE_SIZES, per_limit))
+        print(f"{'ok  ' if constant else 'FAIL'} {path:28s} {sizes}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,67 @@
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='alumni-bench-'), 'bench.db')}")
+os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+os.environ.setdefault("ALGORITHM", "HS256")
+
+from sqlalchemy import event
+from database import Base, async_engine, engine
+import migrations
+
+# One loop for the whole run so pooled async connections stay bound to it
+loop = asyncio.new_event_loop()
+run = loop.run_until_complete
+
+
+def close():
+    """Dispose pooled async connections, whose driver threads otherwise keep the process alive"""
+    run(async_engine.dispose())
+
+
+def reset_schema():
+    Base.metadata.drop_all(bind=engine)
+    migrations.upgrade(verbose=False)
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+    @contextmanager
+    def track(self):
+        self.count = 0
+        engines = (engine, async_engine.sync_engine)
+        for target in engines:
+            event.listen(target, "before_cursor_execute", self._on_execute)
+        try:
+            yield self
+        finally:
+            for target in engines:
+                event.remove(target, "before_cursor_execute", self._on_execute)
+
+
+def timed(fn, repeat=5):
+    """Run fn repeat times and return (best_seconds, last_result)"""
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] if ordered else 0.0
@@ -0,0 +1,194 @@
+"""Seeded synthetic alumni network written straight through the models' tables.
+
+    python -m benchmarks.datagen [profile] [seed]
+
+Popularity follows a power law: a few users attract most follows, likes and
+comments, and out-degrees are Pareto distributed, which is what makes feeds,
+follower lists and counters expensive in production. Every user's password is
+"password". The same profile and seed give the same rows, apart from
+timestamps, which are anchored to the current hour so events stay upcoming.
+Works on SQLite and on Postgres through DATABASE_URL.
+"""
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from itertools import accumulate
+from sqlalchemy import func, select
+from benchmarks.common import reset_schema
+from database import SessionLocal, engine
+import conversations
+import counters
+import hashing
+import models
+import search
+
+PROFILES = {
+    "small": {"users": 1000, "follows_per_user": 20, "posts": 5000, "likes": 30000, "comments": 5000, "events": 200, "conversations": 500, "messages_per_conversation": 20},
+    "medium": {"users": 10000, "follows_per_user": 40, "posts": 50000, "likes": 300000, "comments": 50000, "events": 1000, "conversations": 5000, "messages_per_conversation": 20},
+    "large": {"users": 100000, "follows_per_user": 40, "posts": 500000, "likes": 3000000, "comments": 500000, "events": 5000, "conversations": 50000, "messages_per_conversation": 20},
+}
+PASSWORD = "password"
+POPULARITY_EXPONENT = 1.1
+CHUNK = 10000
+WORDS = (
+    "alumni reunion career mentor internship campus class graduation research startup hiring job team "
+    "project conference talk networking scholarship thesis lab engineering design data product launch "
+    "congratulations proud excited thanks welcome meetup coffee chat opportunity referral remote"
+).split()
+
+
+def insert_chunks(conn, table, rows):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == CHUNK:
+            conn.execute(table.insert(), chunk)
+            chunk = []
+    if chunk:
+        conn.execute(table.insert(), chunk)
+
+
+def sentence(rng, low, high) -> str:
+    return " ".join(rng.choices(WORDS, k=rng.randint(low, high))).capitalize() + "."
+
+
+class Generator:
+    def __init__(self, profile: dict, seed: int):
+        self.profile = profile
+        self.rng = random.Random(seed)
+        self.now = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+        self.user_ids = list(range(1, profile["users"] + 1))
+        # user ids in popularity order, with Zipf weights over the ranks
+        ranked = self.user_ids[:]
+        self.rng.shuffle(ranked)
+        self.ranked = ranked
+        self.popularity = list(accumulate(1 / (rank + 1) ** POPULARITY_EXPONENT for rank in range(len(ranked))))
+        self.joined = {}
+        self.post_times = []
+        self.follow_pairs = []
+
+    def popular(self, k: int):
+        return self.rng.choices(self.ranked, cum_weights=self.popularity, k=k)
+
+    def users(self):
+        hashed_password = hashing.hash_password_sync(PASSWORD)
+        for user_id in self.user_ids:
+            joined = self.now - timedelta(days=730) + timedelta(seconds=self.rng.randint(0, 700 * 86400))
+            self.joined[user_id] = joined
+            yield {
+                "id": user_id,
+                "email": f"user{user_id}@alumni.example.com",
+                "username": f"user{user_id}",
+                "full_name": f"{self.rng.choice(WORDS).title()} {user_id}",
+                "hashed_password": hashed_password,
+                "is_alumni": self.rng.random() < 0.6,
+                "bio": sentence(self.rng, 5, 20) if self.rng.random() < 0.5 else None,
+                "created_at": joined,
+            }
+
+    def follows(self):
+        average = self.profile["follows_per_user"]
+        for user_id in self.user_ids:
+            # Pareto(2) has mean 2, so the average out-degree comes out near follows_per_user
+            degree = min(int(average / 2 * self.rng.paretovariate(2)), len(self.user_ids) - 1)
+            for target in set(self.popular(degree)):
+                if target == user_id:
+                    continue
+                self.follow_pairs.append((user_id, target))
+                since = max(self.joined[user_id], self.joined[target])
+                yield {"follower_id": user_id, "following_id": target, "created_at": since + (self.now - since) * self.rng.random()}
+
+    def posts(self):
+        for post_id, author in enumerate(self.popular(self.profile["posts"]), start=1):
+            created_at = self.joined[author] + (self.now - self.joined[author]) * self.rng.random()
+            self.post_times.append(created_at)
+            yield {"id": post_id, "author_id": author, "content": sentence(self.rng, 8, 60), "created_at": created_at}
+
+    def reactions(self, total: int, comment: bool):
+        posts = len(self.post_times)
+        weights = list(accumulate(1 / (rank + 1) ** POPULARITY_EXPONENT for rank in range(posts)))
+        ranked_posts = list(range(1, posts + 1))
+        self.rng.shuffle(ranked_posts)
+        seen = set()
+        for post_id in self.rng.choices(ranked_posts, cum_weights=weights, k=total):
+            user_id = self.rng.choice(self.user_ids)
+            if not comment and (post_id, user_id) in seen:
+                continue
+            seen.add((post_id, user_id))
+            created_at = self.post_times[post_id - 1] + (self.now - self.post_times[post_id - 1]) * self.rng.random()
+            if comment:
+                yield {"post_id": post_id, "author_id": user_id, "content": sentence(self.rng, 3, 25), "created_at": created_at}
+            else:
+                yield {"post_id": post_id, "user_id": user_id, "created_at": created_at}
+
+    def events(self):
+        for _ in range(self.profile["events"]):
+            yield {
+                "title": sentence(self.rng, 2, 6),
+                "description": sentence(self.rng, 10, 40),
+                "event_date": self.now + timedelta(hours=self.rng.randint(-180 * 24, 180 * 24)),
+                "location": self.rng.choice(("Main Hall", "Online", "Library", "Alumni Center", "Downtown")),
+                "creator_id": self.popular(1)[0],
+                "created_at": self.now - timedelta(hours=self.rng.randint(1, 365 * 24)),
+            }
+
+    def messages(self):
+        pairs = self.rng.sample(self.follow_pairs, min(self.profile["conversations"], len(self.follow_pairs)))
+        per_conversation = self.profile["messages_per_conversation"]
+        for first, second in pairs:
+            started = self.now - timedelta(minutes=self.rng.randint(per_conversation, 90 * 24 * 60))
+            for n in range(per_conversation):
+                sender, receiver = (first, second) if self.rng.random() < 0.5 else (second, first)
+                yield {
+                    "sender_id": sender,
+                    "receiver_id": receiver,
+                    "user_low": min(sender, receiver),
+                    "user_high": max(sender, receiver),
+                    "message": sentence(self.rng, 2, 20),
+                    "is_read": n < per_conversation - 3,
+                    "created_at": started + timedelta(minutes=n),
+                }
+
+
+def generate(profile: str = "small", seed: int = 21) -> dict:
+    """Recreate the schema and fill it, returns row counts and timings"""
+    spec = PROFILES[profile]
+    generator = Generator(spec, seed)
+    started = time.perf_counter()
+    reset_schema()
+    steps = (
+        (models.User.__table__, generator.users),
+        (models.followers, generator.follows),
+        (models.Post.__table__, generator.posts),
+        (models.Like.__table__, lambda: generator.reactions(spec["likes"], comment=False)),
+        (models.Comment.__table__, lambda: generator.reactions(spec["comments"], comment=True)),
+        (models.Event.__table__, generator.events),
+        (models.ChatMessage.__table__, generator.messages),
+    )
+    for table, rows in steps:
+        with engine.begin() as conn:
+            insert_chunks(conn, table, rows())
+    if engine.dialect.name == "postgresql":
+        # explicit ids leave the sequences behind
+        with engine.begin() as conn:
+            for table in (models.User.__table__, models.Post.__table__):
+                conn.exec_driver_sql(f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), (SELECT max(id) FROM {table.name}))")
+    db = SessionLocal()
+    try:
+        counters.reconcile_post_counts(db)
+        counters.reconcile_user_counts(db)
+        conversations.rebuild_summaries(db)
+    finally:
+        db.close()
+    with engine.begin() as conn:
+        search.configure(engine).rebuild(conn)
+    with engine.connect() as conn:
+        counts = {table.name: conn.scalar(select(func.count()).select_from(table)) for table, _ in steps}
+    return {"profile": profile, "seed": seed, "rows": counts, "seconds": round(time.perf_counter() - started, 2)}
+
+
+if __name__ == "__main__":
+    profile = sys.argv[1] if len(sys.argv) > 1 else "small"
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 21
+    print(generate(profile, seed))
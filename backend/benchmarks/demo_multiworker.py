@@ -0,0 +1,91 @@
+"""Websocket delivery across two uvicorn workers sharing Redis.
+
+Starts two app processes on different ports, connects alice to the first and bob
+to the second, and checks that a message alice sends reaches bob and that each
+worker sees the other's user in the presence registry. Needs a reachable Redis.
+
+    REDIS_URL=redis://localhost:6379 python -m benchmarks.demo_multiworker
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+import urllib.request
+from simple_websocket import Client
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PORTS = (int(os.getenv("DEMO_PORT", 8101)), int(os.getenv("DEMO_PORT", 8101)) + 1)
+
+
+def call(port, method, path, body=None, form=None, token=None):
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    data = None
+    if body is not None:
+        data, headers["Content-Type"] = json.dumps(body).encode(), "application/json"
+    elif form is not None:
+        data, headers["Content-Type"] = urllib.parse.urlencode(form).encode(), "application/x-www-form-urlencoded"
+    request = urllib.request.Request(f"http://127.0.0.1:{port}{path}", data=data, headers=headers, method=method)
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.loads(response.read())
+
+
+def start_worker(port, env):
+    worker = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env={**env, "WORKER_ID": f"demo-{port}"},
+    )
+    for _ in range(100):
+        try:
+            call(port, "GET", "/health")
+            return worker
+        except OSError:
+            time.sleep(0.1)
+    worker.terminate()
+    raise RuntimeError(f"worker on port {port} did not start")
+
+
+def sign_up(port, username):
+    call(port, "POST", "/register", {"email": f"{username}@example.com", "username": username, "full_name": username.title(), "password": "demo-password"})
+    token = call(port, "POST", "/token", form={"username": username, "password": "demo-password"})["access_token"]
+    return token, call(port, "GET", "/users/me", token=token)["id"]
+
+
+def main():
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='alumni-demo-'), 'demo.db')}")
+    env.setdefault("SECRET_KEY", "demo-secret")
+    env.setdefault("ALGORITHM", "HS256")
+    env.setdefault("REDIS_URL", "redis://localhost:6379")
+    # the first worker creates the schema before the second one starts
+    workers = [start_worker(PORTS[0], env)]
+    workers.append(start_worker(PORTS[1], env))
+    try:
+        alice_token, alice_id = sign_up(PORTS[0], "alice")
+        bob_token, bob_id = sign_up(PORTS[1], "bob")
+        alice = Client.connect(f"ws://127.0.0.1:{PORTS[0]}/ws/{alice_token}")
+        bob = Client.connect(f"ws://127.0.0.1:{PORTS[1]}/ws/{bob_token}")
+        time.sleep(0.2)
+        print("presence seen by worker 1:", call(PORTS[0], "GET", f"/chat/online?user_ids={alice_id}&user_ids={bob_id}", token=alice_token))
+        print("presence seen by worker 2:", call(PORTS[1], "GET", f"/chat/online?user_ids={alice_id}&user_ids={bob_id}", token=bob_token))
+        start = time.perf_counter()
+        alice.send(json.dumps({"receiver_id": bob_id, "message": "hello from worker 1"}))
+        received = json.loads(bob.receive(timeout=5) or "null")
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        alice.close()
+        bob.close()
+        if not received or received["message"] != "hello from worker 1":
+            print("FAIL: bob did not receive alice's message")
+            return 1
+        print(f"ok: delivered across workers in {elapsed_ms:.1f} ms: {received['message']!r}")
+        return 0
+    finally:
+        for worker in workers:
+            worker.terminate()
+            worker.wait()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""Read replica routing against SQLite files standing in for replicas.
+
+    python -m benchmarks.demo_replicas
+
+"Replication" is a copy of the primary file made with SQLite's backup API, so
+the replicas lag for as long as the demo wants them to. It shows reads spread
+over both replicas, a writer reading its own post from the primary while
+others still see the stale replicas, a broken replica leaving rotation and
+coming back once it passes a health check, and least-connections balancing.
+"""
+import os
+import sqlite3
+import tempfile
+
+DEMO_DIR = tempfile.mkdtemp(prefix="alumni-replicas-")
+PRIMARY = os.path.join(DEMO_DIR, "primary.db")
+REPLICAS = [os.path.join(DEMO_DIR, f"replica{n}.db") for n in (1, 2)]
+os.environ["DATABASE_URL"] = f"sqlite:///{PRIMARY}"
+os.environ["DATABASE_REPLICA_URLS"] = ",".join(f"sqlite:///{path}" for path in REPLICAS)
+os.environ.setdefault("DB_REPLICA_CHECK_SECONDS", "0.2")
+os.environ.setdefault("REDIS_URL", "redis://127.0.0.1:1")
+
+import asyncio
+from benchmarks.asgi import request
+from benchmarks.common import close, reset_schema, run
+from auth import create_access_token
+from database import engine
+import models
+import replicas
+
+
+def replicate(*paths):
+    source = sqlite3.connect(PRIMARY)
+    for path in paths or REPLICAS:
+        target = sqlite3.connect(path)
+        source.backup(target)
+        target.close()
+    source.close()
+
+
+def served():
+    return {name: stats["served"] for name, stats in replicas.replica_set.stats()["replicas"].items()}
+
+
+async def wait_for(condition, seconds=5.0):
+    for _ in range(int(seconds / 0.05)):
+        if condition():
+            return True
+        await asyncio.sleep(0.05)
+    return False
+
+
+async def demo(app):
+    async with app.router.lifespan_context(app):
+        before = served()
+        for n in range(40):
+            await request(app, "GET", f"/posts/{n % 4 + 1}/comments")
+        after = served()
+        print("round robin, 40 reads:", {name: after[name] - before[name] for name in after})
+
+        writer = {"Authorization": f"Bearer {create_access_token({'sub': 'alice'})}"}
+        post = (await request(app, "POST", "/posts/", headers=writer, json_body={"content": "fresh"})).json()
+        print(f"alice wrote post {post['id']}, replicas not yet caught up")
+        print("  alice reads it:", (await request(app, "GET", f"/posts/{post['id']}", headers=writer)).status_code)
+        print("  bob reads it:  ", (await request(app, "GET", f"/posts/{post['id']}")).status_code)
+        replicate()
+        print("  bob after replication:", (await request(app, "GET", f"/posts/{post['id']}")).status_code)
+
+        # its server goes away: the file is gone and pooled connections drop
+        os.remove(REPLICAS[1])
+        broken = replicas.replica_set.replicas[1]
+        await broken.engine.dispose()
+        await wait_for(lambda: not broken.healthy)
+        before = served()
+        statuses = [(await request(app, "GET", "/posts/1/comments")).status_code for _ in range(10)]
+        after = served()
+        print(f"replica2 deleted: healthy={broken.healthy}, 10 reads -> {set(statuses)}", {name: after[name] - before[name] for name in after})
+        os.remove(REPLICAS[1])
+        replicate(REPLICAS[1])
+        await broken.engine.dispose()
+        await wait_for(lambda: broken.healthy)
+        print(f"replica2 restored: healthy={broken.healthy}")
+
+        replicas.replica_set.balance = "least_connections"
+        before = served()
+        await asyncio.gather(*(request(app, "GET", "/users/", params={"limit": 50}) for _ in range(40)))
+        after = served()
+        print("least connections, 40 concurrent reads:", {name: after[name] - before[name] for name in after})
+
+
+if __name__ == "__main__":
+    reset_schema()
+    with engine.begin() as conn:
+        conn.execute(models.User.__table__.insert(), [{"email": f"{name}@example.com", "username": name, "full_name": name.title(), "hashed_password": "x"} for name in ("alice", "bob")])
+        conn.execute(models.Post.__table__.insert(), [{"content": f"post {n}", "author_id": 1} for n in range(4)])
+    replicate()
+    from main import app
+    run(demo(app))
+    close()
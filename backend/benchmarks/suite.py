@@ -0,0 +1,284 @@
+"""Scenario benchmarks driving main.app in-process, with JSON results to compare across commits.
+
+    python -m benchmarks.suite [profile] [results.json] [scenario ...]
+    python -m benchmarks.suite compare before.json after.json
+
+Each run seeds a fresh database with benchmarks.datagen (SUITE_SEED, default 21),
+runs the app's lifespan and runs the scenarios one after another: feed,
+profile, login_burst, chat_fanout and events. SUITE_REQUESTS and
+SUITE_CONCURRENCY scale the HTTP scenarios. Uses a temporary SQLite file unless
+DATABASE_URL points somewhere else, e.g. a local Postgres.
+"""
+import os
+
+# cheaper hashes so login bursts finish; the generator hashes with the same cost
+os.environ.setdefault("BCRYPT_ROUNDS", "10")
+
+import asyncio
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+from itertools import accumulate
+from sqlalchemy import select
+from benchmarks.asgi import ASGIWebSocket, request
+from benchmarks.common import BACKEND_DIR, QueryCounter, close, percentile, run
+from benchmarks import datagen
+from auth import create_access_token
+from database import engine
+import chat_pipeline
+import follow_graph
+import models
+
+SUITE_SEED = int(os.getenv("SUITE_SEED", 21))
+SUITE_REQUESTS = int(os.getenv("SUITE_REQUESTS", 2000))
+SUITE_CONCURRENCY = int(os.getenv("SUITE_CONCURRENCY", 20))
+CHAT_SOCKETS = 200
+CHAT_MESSAGES_PER_SOCKET = 10
+
+
+class Context:
+    """Users to act as, drawn the way real traffic is: active readers and popular profiles"""
+
+    def __init__(self, seed: int):
+        self.rng = random.Random(seed)
+        self.now = datetime.utcnow()
+        with engine.connect() as conn:
+            self.readers = conn.scalars(select(models.User.id).where(models.User.following_count > 0).order_by(models.User.id)).all()
+            self.popular = conn.scalars(select(models.User.id).order_by(models.User.followers_count.desc(), models.User.id)).all()
+        self.weights = list(accumulate(1 / (rank + 1) for rank in range(len(self.popular))))
+        self.tokens = {}
+
+    def auth(self, user_id: int) -> dict:
+        if user_id not in self.tokens:
+            self.tokens[user_id] = {"Authorization": f"Bearer {create_access_token({'sub': f'user{user_id}'})}"}
+        return self.tokens[user_id]
+
+    def popular_user(self) -> int:
+        return self.rng.choices(self.popular, cum_weights=self.weights)[0]
+
+
+def feed(ctx: Context, total: int):
+    for _ in range(total):
+        yield "GET", "/posts/feed", {"headers": ctx.auth(ctx.rng.choice(ctx.readers)), "params": {"limit": 20}}
+
+
+def profile(ctx: Context, total: int):
+    for _ in range(total):
+        user_id = ctx.popular_user()
+        path = ctx.rng.choices((f"/users/{user_id}", f"/users/{user_id}/followers", f"/users/{user_id}/following"), weights=(5, 3, 2))[0]
+        yield "GET", path, {}
+
+
+def login_burst(ctx: Context, total: int):
+    for _ in range(total):
+        yield "POST", "/token", {"form": {"username": f"user{ctx.rng.choice(ctx.popular)}", "password": datagen.PASSWORD}}
+
+
+def events(ctx: Context, total: int):
+    for _ in range(total):
+        if ctx.rng.random() < 0.7:
+            yield "GET", "/events/", {"params": {"limit": 20}}
+        else:
+            start = ctx.now + timedelta(days=ctx.rng.randint(-90, 90))
+            yield "GET", "/events/", {"params": {"from": start.isoformat(), "to": (start + timedelta(days=30)).isoformat(), "limit": 20}}
+
+
+# name: (calls, share of SUITE_REQUESTS, concurrency multiplier)
+HTTP_SCENARIOS = {
+    "feed": (feed, 1, 1),
+    "profile": (profile, 1, 1),
+    "login_burst": (login_burst, 0.1, 2.5),
+    "events": (events, 1, 1),
+}
+
+
+async def drive(app, calls, concurrency: int):
+    """Issue calls with at most concurrency in flight, returns (elapsed_seconds, latencies, statuses)"""
+    latencies, statuses = [], {}
+    remaining = iter(calls)
+
+    async def worker():
+        for method, path, kwargs in remaining:
+            start = time.perf_counter()
+            try:
+                status = str((await request(app, method, path, **kwargs)).status_code)
+            except Exception as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - start, latencies, statuses
+
+
+def summarize(total: int, concurrency: int, elapsed: float, latencies, statuses: dict, queries: int) -> dict:
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+            "p50": round(percentile(latencies, 50) * 1000, 2),
+            "p90": round(percentile(latencies, 90) * 1000, 2),
+            "p99": round(percentile(latencies, 99) * 1000, 2),
+            "max": round(max(latencies, default=0) * 1000, 2),
+        },
+        "queries_per_request": round(queries / total, 2) if total else 0.0,
+        "statuses": dict(sorted(statuses.items())),
+    }
+
+
+async def http_scenario(app, ctx: Context, name: str, counter: QueryCounter) -> dict:
+    calls, share, multiplier = HTTP_SCENARIOS[name]
+    total = max(1, int(SUITE_REQUESTS * share))
+    concurrency = max(1, int(SUITE_CONCURRENCY * multiplier))
+    await drive(app, calls(ctx, min(20, total)), concurrency)  # warm pools and caches' code paths, not their contents
+    with counter.track():
+        elapsed, latencies, statuses = await drive(app, calls(ctx, total), concurrency)
+    return summarize(total, concurrency, elapsed, latencies, statuses, counter.count)
+
+
+async def chat_fanout(app, ctx: Context, counter: QueryCounter) -> dict:
+    """Sockets for CHAT_SOCKETS users all sending at once; latency is send to delivery on the receiver's socket"""
+    user_ids = ctx.rng.sample(ctx.popular, min(CHAT_SOCKETS, len(ctx.popular)))
+    sent, latencies = {}, []
+    delivered = asyncio.Event()
+
+    def receiver(user_id):
+        def on_message(text):
+            message = json.loads(text)
+            if message.get("receiver_id") == user_id and message.get("message") in sent:
+                latencies.append(time.perf_counter() - sent.pop(message["message"]))
+                if len(latencies) == total:
+                    delivered.set()
+        return on_message
+
+    sockets = {}
+    for user_id in user_ids:
+        socket = ASGIWebSocket(app, f"/ws/{ctx.auth(user_id)['Authorization'][7:]}", receiver(user_id))
+        if await socket.connect():
+            sockets[user_id] = socket
+    connected = list(sockets)
+    total = len(connected) * CHAT_MESSAGES_PER_SOCKET
+
+    async def chatter(user_id):
+        for n in range(CHAT_MESSAGES_PER_SOCKET):
+            peer = ctx.rng.choice([other for other in connected if other != user_id] or [user_id])
+            text = f"bench {user_id}-{n}"
+            sent[text] = time.perf_counter()
+            await sockets[user_id].send_text(json.dumps({"receiver_id": peer, "message": text}))
+            await asyncio.sleep(0)
+
+    with counter.track():
+        start = time.perf_counter()
+        await asyncio.gather(*(chatter(user_id) for user_id in connected))
+        try:
+            await asyncio.wait_for(delivered.wait(), 60)
+        except asyncio.TimeoutError:
+            pass
+        elapsed = time.perf_counter() - start
+        # the rows are part of the cost, so wait for the writer to persist them
+        while chat_pipeline.writer.stats()["pending"]:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(chat_pipeline.writer.flush_interval * 2)
+    for socket in sockets.values():
+        await socket.close()
+    result = summarize(total, len(connected), elapsed, latencies, {"delivered": len(latencies), "lost": total - len(latencies)}, counter.count)
+    result["messages_per_write"] = chat_pipeline.writer.stats()["avg_batch"]
+    return result
+
+
+SCENARIOS = ("feed", "profile", "login_burst", "chat_fanout", "events")
+
+
+def git(*args):
+    try:
+        return subprocess.run(("git",) + args, cwd=BACKEND_DIR, capture_output=True, text=True, timeout=10).stdout.strip()
+    except Exception:
+        return None
+
+
+async def run_scenarios(app, names) -> dict:
+    counter = QueryCounter()
+    async with app.router.lifespan_context(app):
+        for _ in range(300):
+            if follow_graph.graph.ready:
+                break
+            await asyncio.sleep(0.1)
+        ctx = Context(SUITE_SEED)
+        results = {}
+        for name in names:
+            if name == "chat_fanout":
+                results[name] = await chat_fanout(app, ctx, counter)
+            else:
+                results[name] = await http_scenario(app, ctx, name, counter)
+            print(f"{name:12} {results[name]['throughput_rps']:9.1f} req/s  p99 {results[name]['latency_ms']['p99']:8.2f} ms  {results[name]['queries_per_request']:6.2f} queries/req", file=sys.stderr)
+        return results
+
+
+def benchmark(profile: str, names) -> dict:
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    dataset = datagen.generate(profile, SUITE_SEED)
+    print(f"Generated {profile} dataset in {dataset['seconds']} s", file=sys.stderr)
+    from main import app
+    started_at = datetime.utcnow().isoformat(timespec="seconds") + "Z"
+    results = run(run_scenarios(app, names))
+    return {
+        "meta": {
+            "commit": git("rev-parse", "HEAD"),
+            "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+            "started_at": started_at,
+            "database": engine.dialect.name,
+            "python": platform.python_version(),
+            "requests": SUITE_REQUESTS,
+            "concurrency": SUITE_CONCURRENCY,
+            "bcrypt_rounds": int(os.environ["BCRYPT_ROUNDS"]),
+            "dataset": dataset,
+        },
+        "scenarios": results,
+    }
+
+
+def compare(before_path: str, after_path: str):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    print(f"{before['meta']['commit'] or '?'} -> {after['meta']['commit'] or '?'}")
+    print(f"{'scenario':12} {'req/s':>21} {'p99 ms':>21} {'queries/req':>15}")
+    for name, new in after["scenarios"].items():
+        old = before["scenarios"].get(name)
+        if old is None:
+            continue
+        change = (new["throughput_rps"] / old["throughput_rps"] - 1) * 100 if old["throughput_rps"] else 0.0
+        print(
+            f"{name:12} {old['throughput_rps']:8.1f} -> {new['throughput_rps']:8.1f} {change:+5.0f}%"
+            f" {old['latency_ms']['p99']:8.2f} -> {new['latency_ms']['p99']:8.2f}"
+            f"   {old['queries_per_request']:5.2f} -> {new['queries_per_request']:5.2f}"
+        )
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if args[:1] == ["compare"]:
+        compare(*args[1:3])
+        raise SystemExit
+    profile = args.pop(0) if args and args[0] in datagen.PROFILES else "small"
+    output = args.pop(0) if args and args[0].endswith(".json") else None
+    report = benchmark(profile, args or SCENARIOS)
+    close()
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+        print(f"Wrote {output}", file=sys.stderr)
+    else:
+        print(text)
@@ -0,0 +1,284 @@
+import asyncio
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import List, Optional, Tuple
+from fastapi import Response
+from redis.exceptions import WatchError
+from sqlalchemy import case, event, inspect, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from database import SessionLocal, engine
+from loaders import shaped_select
+from pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor, paginate
+import models, schemas
+
+CHAT_CACHE_LENGTH = int(os.getenv("CHAT_CACHE_LENGTH", 100))
+CHAT_CACHE_CONVERSATIONS = int(os.getenv("CHAT_CACHE_CONVERSATIONS", 10000))
+CHAT_CACHE_TTL_SECONDS = int(os.getenv("CHAT_CACHE_TTL_SECONDS", 24 * 3600))
+HISTORY_KEY = (models.ChatMessage.created_at, models.ChatMessage.id)
+
+Conversation = Tuple[int, int]
+
+
+def conversation(user_a: int, user_b: int) -> Conversation:
+    return min(user_a, user_b), max(user_a, user_b)
+
+
+def to_entry(message: models.ChatMessage) -> dict:
+    return schemas.ChatMessage.model_validate(message).model_dump(mode="json")
+
+
+def sort_key(entry: dict):
+    return datetime.fromisoformat(entry["created_at"]), entry["id"]
+
+
+class MemoryChatStore:
+    """Newest messages per conversation kept in process, LRU-evicted by conversation.
+
+    Every write bumps the conversation's version; a rebuild read from the database
+    is only stored if no write happened while it was being read.
+    """
+
+    def __init__(self, capacity: int = CHAT_CACHE_LENGTH, max_conversations: int = CHAT_CACHE_CONVERSATIONS):
+        self.capacity = capacity
+        self.max_conversations = max_conversations
+        # conversation -> [version, entries newest first or None, complete]
+        self._conversations: "OrderedDict[Conversation, list]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _slot(self, key: Conversation) -> list:
+        slot = self._conversations.get(key)
+        if slot is None:
+            slot = self._conversations[key] = [0, None, False]
+            while len(self._conversations) > self.max_conversations:
+                self._conversations.popitem(last=False)
+        self._conversations.move_to_end(key)
+        return slot
+
+    async def get(self, key: Conversation) -> Optional[Tuple[List[dict], bool]]:
+        with self._lock:
+            slot = self._conversations.get(key)
+            if slot is None or slot[1] is None:
+                return None
+            self._conversations.move_to_end(key)
+            return list(slot[1]), slot[2]
+
+    async def version(self, key: Conversation) -> int:
+        with self._lock:
+            return self._slot(key)[0]
+
+    async def replace(self, key: Conversation, entries: List[dict], complete: bool, version: int) -> bool:
+        with self._lock:
+            slot = self._slot(key)
+            if slot[0] != version:
+                return False
+            slot[1], slot[2] = entries[:self.capacity], complete
+            return True
+
+    async def append(self, key: Conversation, entry: dict):
+        with self._lock:
+            slot = self._slot(key)
+            slot[0] += 1
+            if slot[1] is not None:
+                slot[1].insert(0, entry)
+                if len(slot[1]) > self.capacity:
+                    del slot[1][self.capacity:]
+                    slot[2] = False
+
+    async def invalidate(self, key: Conversation):
+        with self._lock:
+            slot = self._slot(key)
+            slot[0] += 1
+            slot[1] = None
+
+
+class RedisChatStore:
+    """Conversations as Redis lists, newest message first, next to a version counter.
+
+    A sentinel at the tail marks a list that holds the whole conversation.
+    """
+
+    SENTINEL = b"-"
+
+    def __init__(self, client, capacity: int = CHAT_CACHE_LENGTH, ttl: int = CHAT_CACHE_TTL_SECONDS):
+        self.client = client
+        self.capacity = capacity
+        self.ttl = ttl
+
+    @staticmethod
+    def key(key: Conversation) -> str:
+        return f"chat:history:{key[0]}:{key[1]}"
+
+    def version_key(self, key: Conversation) -> str:
+        return self.key(key) + ":version"
+
+    async def get(self, key: Conversation) -> Optional[Tuple[List[dict], bool]]:
+        items = await self.client.lrange(self.key(key), 0, -1)
+        if not items:
+            return None
+        complete = items[-1] == self.SENTINEL
+        return [json.loads(item) for item in items if item != self.SENTINEL], complete
+
+    async def version(self, key: Conversation) -> int:
+        return int(await self.client.get(self.version_key(key)) or 0)
+
+    async def replace(self, key: Conversation, entries: List[dict], complete: bool, version: int) -> bool:
+        items = [json.dumps(entry) for entry in entries[:self.capacity]]
+        if complete:
+            items.append(self.SENTINEL)
+        async with self.client.pipeline() as pipe:
+            try:
+                await pipe.watch(self.version_key(key))
+                if int(await pipe.get(self.version_key(key)) or 0) != version:
+                    return False
+                pipe.multi()
+                pipe.delete(self.key(key))
+                pipe.rpush(self.key(key), *items)
+                pipe.expire(self.key(key), self.ttl)
+                await pipe.execute()
+                return True
+            except WatchError:
+                return False
+
+    async def append(self, key: Conversation, entry: dict):
+        async with self.client.pipeline() as pipe:
+            pipe.incr(self.version_key(key))
+            pipe.expire(self.version_key(key), self.ttl)
+            # LPUSHX: only conversations already read through get the message
+            pipe.lpushx(self.key(key), json.dumps(entry))
+            pipe.ltrim(self.key(key), 0, self.capacity - 1)
+            await pipe.execute()
+
+    async def invalidate(self, key: Conversation):
+        async with self.client.pipeline() as pipe:
+            pipe.incr(self.version_key(key))
+            pipe.expire(self.version_key(key), self.ttl)
+            pipe.delete(self.key(key))
+            await pipe.execute()
+
+
+store = MemoryChatStore()
+
+
+def configure(redis_client=None):
+    global store
+    store = RedisChatStore(redis_client) if redis_client is not None else MemoryChatStore()
+
+
+async def append(message: models.ChatMessage):
+    await store.append(conversation(message.sender_id, message.receiver_id), to_entry(message))
+
+
+async def invalidate(user_a: int, user_b: int):
+    await store.invalidate(conversation(user_a, user_b))
+
+
+def conversation_query(key: Conversation):
+    return shaped_select(schemas.ChatMessage).where(models.ChatMessage.user_low == key[0], models.ChatMessage.user_high == key[1])
+
+
+async def cached_entries(db: AsyncSession, key: Conversation, build: bool):
+    """The conversation's cached newest messages, read through from the database when build is set"""
+    cached = await store.get(key)
+    if cached is not None or not build:
+        return cached
+    version = await store.version(key)
+    rows = (await db.execute(conversation_query(key).order_by(*[column.desc() for column in HISTORY_KEY]).limit(store.capacity))).scalars().all()
+    entries = [to_entry(row) for row in rows]
+    complete = len(entries) < store.capacity
+    await store.replace(key, entries, complete, version)
+    return entries, complete
+
+
+async def history(db: AsyncSession, user_a: int, user_b: int, response: Response, cursor: Optional[str] = None, skip: int = 0, limit: int = 50) -> list:
+    """One page of a conversation, newest first: from the cache when it covers the page, else the database"""
+    key = conversation(user_a, user_b)
+    if not skip or cursor:
+        try:
+            cached = await cached_entries(db, key, build=not cursor)
+        except Exception as e:
+            print(f"Chat cache error: {e}")
+            cached = None
+        if cached is not None:
+            entries, complete = cached
+            entries.sort(key=sort_key, reverse=True)
+            if cursor:
+                before = tuple(decode_cursor(cursor, HISTORY_KEY))
+                entries = [entry for entry in entries if sort_key(entry) < before]
+            if complete or len(entries) > limit:
+                if len(entries) > limit:
+                    entries = entries[:limit]
+                    response.headers[NEXT_CURSOR_HEADER] = encode_cursor(sort_key(entries[-1]))
+                return entries
+    return await paginate(db, conversation_query(key), HISTORY_KEY, response, cursor, skip, limit)
+
+
+# Read flags and deletes go through the ORM; drop the affected conversations once they commit
+@event.listens_for(models.ChatMessage, "after_update")
+def _track_updated_message(mapper, connection, target):
+    if inspect(target).attrs.is_read.history.has_changes():
+        Session.object_session(target).info.setdefault("chat_invalidate", set()).add(conversation(target.sender_id, target.receiver_id))
+
+
+@event.listens_for(models.ChatMessage, "after_delete")
+def _track_deleted_message(mapper, connection, target):
+    Session.object_session(target).info.setdefault("chat_invalidate", set()).add(conversation(target.sender_id, target.receiver_id))
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session):
+    keys = session.info.pop("chat_invalidate", None)
+    if not keys:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        print(f"Chat cache not invalidated outside the event loop: {sorted(keys)}")
+        return
+    for key in keys:
+        loop.create_task(store.invalidate(key))
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back(session):
+    session.info.pop("chat_invalidate", None)
+
+
+def add_conversation_columns():
+    """Add and backfill user_low/user_high on a chat_messages table created before they existed"""
+    existing = {column["name"] for column in inspect(engine).get_columns("chat_messages")}
+    with engine.begin() as conn:
+        for name in ("user_low", "user_high"):
+            if name not in existing:
+                conn.execute(text(f"ALTER TABLE chat_messages ADD COLUMN {name} INTEGER"))
+                print(f"Added chat_messages.{name}")
+        for index in models.ChatMessage.__table__.indexes:
+            if {column.name for column in index.columns} <= {"sender_id", "receiver_id", "user_low", "user_high", "created_at", "id"}:
+                index.create(conn, checkfirst=True)
+
+
+def backfill_conversations(db: Session) -> int:
+    low = models.ChatMessage.sender_id < models.ChatMessage.receiver_id
+    result = db.execute(
+        update(models.ChatMessage)
+        .where(models.ChatMessage.user_low.is_(None) | models.ChatMessage.user_high.is_(None))
+        .values(
+            user_low=case((low, models.ChatMessage.sender_id), else_=models.ChatMessage.receiver_id),
+            user_high=case((low, models.ChatMessage.receiver_id), else_=models.ChatMessage.sender_id),
+        ),
+        execution_options={"synchronize_session": False},
+    )
+    db.commit()
+    return result.rowcount
+
+
+if __name__ == "__main__":
+    add_conversation_columns()
+    db = SessionLocal()
+    try:
+        print(f"Backfilled conversation keys on {backfill_conversations(db)} messages")
+    finally:
+        db.close()
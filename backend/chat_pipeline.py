@@ -0,0 +1,177 @@
+import asyncio
+import os
+import uuid
+from datetime import datetime
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from database import AsyncSessionLocal
+from connections import manager
+from ttl_cache import TTLCache
+import chat_cache
+import conversations
+import jobs
+import models, schemas
+
+CHAT_BATCH_SIZE = int(os.getenv("CHAT_BATCH_SIZE", 200))
+CHAT_FLUSH_INTERVAL_MS = int(os.getenv("CHAT_FLUSH_INTERVAL_MS", 50))
+# Senders wait once this many messages are waiting to be written
+CHAT_WRITE_QUEUE_SIZE = int(os.getenv("CHAT_WRITE_QUEUE_SIZE", 10000))
+CHAT_FLUSH_ATTEMPTS = 3
+CHAT_KNOWN_USERS_TTL = float(os.getenv("CHAT_KNOWN_USERS_TTL", 300))
+
+# receivers seen to exist; one deleted within the TTL only costs its own message at flush time
+known_users = TTLCache(10000, CHAT_KNOWN_USERS_TTL)
+
+
+class ChatWriter:
+    """Group-commits chat messages in the background, flushing on batch size or interval"""
+
+    def __init__(self, batch_size: int = CHAT_BATCH_SIZE, flush_interval: float = CHAT_FLUSH_INTERVAL_MS / 1000, max_pending: int = CHAT_WRITE_QUEUE_SIZE):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.queue = None
+        self._task = None
+        self.written = 0
+        self.batches = 0
+        self.failed = 0
+
+    async def start(self):
+        self.queue = asyncio.Queue(self.max_pending)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush everything accepted so far, then stop"""
+        if self._task is None:
+            return
+        await self.queue.join()
+        self._task.cancel()
+        self._task = None
+
+    async def submit(self, values: dict):
+        await self.queue.put(values)
+
+    async def _next_batch(self) -> list:
+        batch = [await self.queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self.flush(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def write(self, batch: list) -> list:
+        rows = [models.ChatMessage(**values) for values in batch]
+        async with AsyncSessionLocal() as db:
+            db.add_all(rows)
+            await db.flush()
+            await conversations.record_messages(db, rows)
+            await db.commit()
+        return rows
+
+    async def flush(self, batch: list):
+        rows = None
+        for attempt in range(1, CHAT_FLUSH_ATTEMPTS + 1):
+            try:
+                rows = await self.write(batch)
+                break
+            except IntegrityError as e:
+                # one bad row fails the whole insert, and would again on every retry
+                print(f"Chat writer batch rejected, writing its {len(batch)} messages one at a time: {e.orig}")
+                break
+            except Exception as e:
+                print(f"Chat writer flush failed ({attempt}/{CHAT_FLUSH_ATTEMPTS}): {e}")
+                await asyncio.sleep(0.1 * 2 ** attempt)
+        if rows is None:
+            rows = []
+            for values in batch:
+                try:
+                    rows += await self.write([values])
+                except Exception as e:
+                    print(f"Chat message {values['client_id']} from {values['sender_id']} to {values['receiver_id']} dropped: {getattr(e, 'orig', None) or e}")
+                    self.failed += 1
+        if not rows:
+            return
+        self.written += len(rows)
+        self.batches += 1
+        # one lane keeps batches in order; the writer moves on without waiting for Redis
+        jobs.runner.submit(mirror, rows, lane="chat-cache", attempts=1)
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.queue.qsize() if self.queue else 0,
+            "written": self.written,
+            "batches": self.batches,
+            "failed": self.failed,
+            "avg_batch": round(self.written / self.batches, 2) if self.batches else 0.0,
+        }
+
+
+async def mirror(rows: list):
+    for row in rows:
+        try:
+            await chat_cache.append(row)
+        except Exception as e:
+            print(f"Redis error: {e}")
+
+
+writer = ChatWriter()
+
+
+async def user_exists(user_id: int) -> bool:
+    if known_users.get(user_id):
+        return True
+    async with AsyncSessionLocal() as db:
+        found = await db.scalar(select(models.User.id).where(models.User.id == user_id, models.User.deleted_at.is_(None))) is not None
+    if found:
+        known_users.set(user_id, True)
+    return found
+
+
+async def ingest(sender: schemas.UserSnapshot, message_data: dict) -> dict:
+    """Deliver a chat message right away and queue it for persistence"""
+    # clients may send their own id to match the echo against; otherwise the server assigns one
+    client_id = str(message_data.get("client_id") or uuid.uuid4().hex)[:64]
+    try:
+        receiver_id = int(message_data["receiver_id"])
+    except (KeyError, TypeError, ValueError):
+        receiver_id = None
+    if receiver_id is None or not await user_exists(receiver_id):
+        error = {"error": "Unknown receiver", "client_id": client_id}
+        await manager.send_personal_message(error, sender.id)
+        return error
+    created_at = datetime.utcnow()
+    response_data = {
+        # the row id is assigned when the writer commits; client_id identifies the message until then and in history
+        "id": None,
+        "client_id": client_id,
+        "sender_id": sender.id,
+        "receiver_id": receiver_id,
+        "message": message_data["message"],
+        "created_at": created_at.isoformat(),
+        "sender_username": sender.username,
+        "sender_full_name": sender.full_name
+    }
+    await manager.send_personal_message(response_data, receiver_id)
+    await manager.send_personal_message(response_data, sender.id)
+    await writer.submit({"sender_id": sender.id, "receiver_id": receiver_id, "message": message_data["message"], "created_at": created_at, "client_id": client_id})
+    return response_data
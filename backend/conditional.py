@@ -0,0 +1,54 @@
+import hashlib
+import json
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+
+def etag_for(payload) -> str:
+    body = json.dumps(jsonable_encoder(payload), separators=(",", ":"), sort_keys=True, default=str)
+    return f'W/"{hashlib.sha1(body.encode()).hexdigest()}"'
+
+
+def _utc_seconds(value: datetime) -> datetime:
+    # naive datetimes in this codebase are UTC
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).replace(microsecond=0)
+
+
+def http_date(value: datetime) -> str:
+    return format_datetime(_utc_seconds(value), usegmt=True)
+
+
+def _weak(tag: str) -> str:
+    return tag.strip().removeprefix("W/")
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime] = None) -> bool:
+    """If-None-Match wins when present, as RFC 9110 asks; If-Modified-Since is only a fallback"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {_weak(tag) for tag in if_none_match.split(",")}
+        return "*" in tags or _weak(etag) in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            return _utc_seconds(last_modified) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def conditional(request: Request, response: Response, etag: str, last_modified: Optional[datetime] = None) -> Optional[Response]:
+    """Put ETag/Last-Modified on response; return a 304 to send instead when the client's copy is current"""
+    validators = {"ETag": etag, "Cache-Control": "no-cache"}
+    if last_modified is not None:
+        validators["Last-Modified"] = http_date(last_modified)
+    if is_not_modified(request, validators["ETag"], last_modified):
+        headers = {name: value for name, value in response.headers.items() if name != "content-length"}
+        return Response(status_code=304, headers={**headers, **validators})
+    response.headers.update(validators)
+    return None
@@ -0,0 +1,156 @@
+import asyncio
+import os
+from typing import Dict
+from fastapi import WebSocket
+import message_bus
+
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", 256))
+# Close code for a consumer that fell too far behind: "try again later"
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+
+class Connection:
+    """A socket plus its bounded outbox, drained by a dedicated sender task"""
+
+    def __init__(self, websocket: WebSocket, queue_size: int = WS_SEND_QUEUE_SIZE):
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(queue_size)
+        self.dropped = False
+        self.sender = asyncio.create_task(self._send_loop())
+
+    async def _send_loop(self):
+        while True:
+            message = await self.queue.get()
+            try:
+                await self.websocket.send_json(message)
+            except Exception as e:
+                print(f"WebSocket send error: {e}")
+                return
+
+    def offer(self, message: dict) -> bool:
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def close(self, code: int):
+        self.sender.cancel()
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
+
+class ConnectionManager:
+    """Sockets connected to this worker; messages for users elsewhere travel over the message bus.
+
+    Delivery only enqueues onto each socket's outbox, so one slow client never holds up
+    the others; a client whose outbox is full is disconnected instead.
+    """
+
+    def __init__(self, queue_size: int = WS_SEND_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.active_connections: Dict[int, Connection] = {}
+        self.dropped = 0
+        self._heartbeat = None
+
+    async def start(self):
+        await message_bus.bus.start(self.deliver)
+        self._heartbeat = asyncio.create_task(self.heartbeat())
+
+    async def stop(self):
+        if self._heartbeat:
+            self._heartbeat.cancel()
+            self._heartbeat = None
+        await message_bus.bus.stop()
+
+    async def rebind(self, previous):
+        """Move from previous to the bus message_bus.configure() just installed, keeping connected users subscribed"""
+        if self._heartbeat is None:
+            return
+        await previous.stop()
+        await message_bus.bus.start(self.deliver)
+        try:
+            for user_id in list(self.active_connections):
+                await message_bus.bus.subscribe(user_id)
+            await message_bus.presence.heartbeat(list(self.active_connections))
+        except Exception as e:
+            print(f"Message bus error: {e}")
+
+    async def heartbeat(self):
+        while True:
+            await asyncio.sleep(message_bus.PRESENCE_TTL_SECONDS / 3)
+            try:
+                await message_bus.presence.heartbeat(list(self.active_connections))
+            except Exception as e:
+                print(f"Presence heartbeat error: {e}")
+
+    async def connect(self, user_id: int, websocket: WebSocket):
+        await websocket.accept()
+        previous = self.active_connections.get(user_id)
+        if previous:
+            previous.sender.cancel()
+        self.active_connections[user_id] = Connection(websocket, self.queue_size)
+        try:
+            await message_bus.bus.subscribe(user_id)
+            await message_bus.presence.add(user_id)
+        except Exception as e:
+            print(f"Message bus error: {e}")
+        print(f"User {user_id} connected via WebSocket")
+
+    async def disconnect(self, user_id: int, websocket: WebSocket):
+        # a newer socket for the same user may already have replaced this one
+        connection = self.active_connections.get(user_id)
+        if connection is None or connection.websocket is not websocket:
+            return
+        del self.active_connections[user_id]
+        connection.sender.cancel()
+        try:
+            await message_bus.bus.unsubscribe(user_id)
+            await message_bus.presence.remove(user_id)
+        except Exception as e:
+            print(f"Message bus error: {e}")
+        print(f"User {user_id} disconnected")
+
+    async def drop(self, user_id: int, connection: Connection):
+        print(f"Dropping slow WebSocket consumer {user_id}")
+        await self.disconnect(user_id, connection.websocket)
+        await connection.close(SLOW_CONSUMER_CLOSE_CODE)
+
+    async def deliver(self, message: dict, user_id: int = None):
+        """Queue for sockets on this worker only; user_id None means everyone here"""
+        if user_id is None:
+            targets = list(self.active_connections.items())
+        else:
+            connection = self.active_connections.get(user_id)
+            targets = [(user_id, connection)] if connection else []
+        for target_id, connection in targets:
+            if not connection.dropped and not connection.offer(message):
+                connection.dropped = True
+                self.dropped += 1
+                asyncio.create_task(self.drop(target_id, connection))
+
+    async def send_personal_message(self, message: dict, user_id: int):
+        await self.deliver(message, user_id)
+        try:
+            await message_bus.bus.publish(message, user_id)
+        except Exception as e:
+            print(f"Message bus error: {e}")
+
+    async def broadcast(self, message: dict):
+        await self.deliver(message)
+        try:
+            await message_bus.bus.publish(message)
+        except Exception as e:
+            print(f"Message bus error: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "connections": len(self.active_connections),
+            "queued": sum(connection.queue.qsize() for connection in self.active_connections.values()),
+            "dropped_slow_consumers": self.dropped,
+        }
+
+
+manager = ConnectionManager()
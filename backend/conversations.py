@@ -0,0 +1,102 @@
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import and_, case, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from database import DIALECT_INSERTS, SessionLocal
+import models, schemas
+from serializers import row_select
+
+INBOX_KEY = (models.ConversationSummary.last_message_at, models.ConversationSummary.peer_id)
+
+
+def summary_values(messages) -> List[dict]:
+    """Per-side summary changes for a batch of messages: the newest message and how many the side has not read"""
+    sides: Dict[Tuple[int, int], dict] = {}
+    for message in sorted(messages, key=lambda message: (message.created_at, message.id)):
+        for owner, peer, unread in ((message.sender_id, message.receiver_id, 0), (message.receiver_id, message.sender_id, 1)):
+            side = sides.setdefault((owner, peer), {"owner_id": owner, "peer_id": peer, "unread_count": 0})
+            side.update(
+                last_message_id=message.id,
+                last_sender_id=message.sender_id,
+                last_message=message.message,
+                last_message_at=message.created_at,
+            )
+            side["unread_count"] += unread
+    return list(sides.values())
+
+
+async def record_messages(db: AsyncSession, messages):
+    """Fold newly flushed messages into both participants' summaries, in the same transaction"""
+    values = summary_values(messages)
+    if not values:
+        return
+    table = models.ConversationSummary.__table__
+    statement = DIALECT_INSERTS[db.bind.dialect.name](table).values(values)
+    # batches from other workers may commit out of order, so only a newer message replaces the last one
+    newer = statement.excluded.last_message_at >= table.c.last_message_at
+    await db.execute(statement.on_conflict_do_update(
+        index_elements=[table.c.owner_id, table.c.peer_id],
+        set_={
+            **{name: case((newer | table.c.last_message_at.is_(None), statement.excluded[name]), else_=table.c[name])
+               for name in ("last_message_id", "last_sender_id", "last_message", "last_message_at")},
+            "unread_count": table.c.unread_count + statement.excluded.unread_count,
+        },
+    ))
+
+
+async def mark_read(db: AsyncSession, owner_id: int, peer_id: int, up_to_id: Optional[int] = None) -> int:
+    """Flag peer's messages to owner as read in one UPDATE and take them off the unread count"""
+    condition = and_(
+        models.ChatMessage.sender_id == peer_id,
+        models.ChatMessage.receiver_id == owner_id,
+        models.ChatMessage.is_read.is_(False),
+    )
+    if up_to_id is not None:
+        condition = condition & (models.ChatMessage.id <= up_to_id)
+    result = await db.execute(
+        update(models.ChatMessage).where(condition).values(is_read=True),
+        execution_options={"synchronize_session": False},
+    )
+    marked = result.rowcount
+    if marked:
+        # a decrement rather than a reset, so messages written meanwhile stay unread
+        unread = models.ConversationSummary.unread_count
+        await db.execute(
+            update(models.ConversationSummary)
+            .where(models.ConversationSummary.owner_id == owner_id, models.ConversationSummary.peer_id == peer_id)
+            .values(unread_count=case((unread > marked, unread - marked), else_=0)),
+            execution_options={"synchronize_session": False},
+        )
+    return marked
+
+
+def inbox_query(owner_id: int):
+    return row_select(schemas.ConversationSummary).where(models.ConversationSummary.owner_id == owner_id)
+
+
+def rebuild_summaries(db: Session) -> int:
+    """Recompute every summary from chat_messages, for data written before the table existed"""
+    message = models.ChatMessage
+    latest = select(func.max(message.id)).group_by(message.user_low, message.user_high)
+    last_messages = db.execute(select(message).where(message.id.in_(latest))).scalars().all()
+    unread = dict(
+        ((receiver, sender), count) for receiver, sender, count in db.execute(
+            select(message.receiver_id, message.sender_id, func.count()).where(message.is_read.is_(False)).group_by(message.receiver_id, message.sender_id)
+        )
+    )
+    rows = summary_values(last_messages)
+    for row in rows:
+        row["unread_count"] = unread.get((row["owner_id"], row["peer_id"]), 0)
+    db.query(models.ConversationSummary).delete()
+    if rows:
+        db.execute(models.ConversationSummary.__table__.insert(), rows)
+    db.commit()
+    return len(rows)
+
+
+if __name__ == "__main__":
+    db = SessionLocal()
+    try:
+        print(f"Rebuilt {rebuild_summaries(db)} conversation summaries")
+    finally:
+        db.close()
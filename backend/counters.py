@@ -0,0 +1,83 @@
+from sqlalchemy import func, inspect, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from database import SessionLocal, engine
+import models
+
+COUNTER_COLUMNS = {
+    "posts": ("likes_count", "comments_count"),
+    "users": ("followers_count", "following_count", "posts_count"),
+}
+
+
+async def adjust_counts(db: AsyncSession, model, row_id: int, **deltas):
+    """Apply relative changes to a row's counter columns inside the caller's transaction"""
+    values = {name: getattr(model, name) + delta for name, delta in deltas.items() if delta}
+    if values:
+        await db.execute(
+            update(model).where(model.id == row_id).values(**values),
+            execution_options={"synchronize_session": False},
+        )
+
+
+async def adjust_post_counts(db: AsyncSession, post_id: int, likes: int = 0, comments: int = 0):
+    await adjust_counts(db, models.Post, post_id, likes_count=likes, comments_count=comments)
+
+
+async def adjust_user_counts(db: AsyncSession, user_id: int, followers: int = 0, following: int = 0, posts: int = 0):
+    await adjust_counts(db, models.User, user_id, followers_count=followers, following_count=following, posts_count=posts)
+
+
+def reconcile_post_counts(db: Session) -> int:
+    """Rebuild post counters from the likes and comments tables, returns rows fixed"""
+    likes = select(func.count(models.Like.id)).where(models.Like.post_id == models.Post.id).scalar_subquery()
+    comments = select(func.count(models.Comment.id)).where(models.Comment.post_id == models.Post.id).scalar_subquery()
+    result = db.execute(
+        update(models.Post)
+        .where((models.Post.likes_count != likes) | (models.Post.comments_count != comments))
+        .values(likes_count=likes, comments_count=comments),
+        execution_options={"synchronize_session": False},
+    )
+    db.commit()
+    return result.rowcount
+
+
+def reconcile_user_counts(db: Session) -> int:
+    """Rebuild user counters from the followers and posts tables, returns rows fixed"""
+    followers = select(func.count()).select_from(models.followers).where(models.followers.c.following_id == models.User.id).scalar_subquery()
+    following = select(func.count()).select_from(models.followers).where(models.followers.c.follower_id == models.User.id).scalar_subquery()
+    posts = select(func.count(models.Post.id)).where(models.Post.author_id == models.User.id, models.Post.deleted_at.is_(None)).scalar_subquery()
+    result = db.execute(
+        update(models.User)
+        .where((models.User.followers_count != followers) | (models.User.following_count != following) | (models.User.posts_count != posts))
+        .values(followers_count=followers, following_count=following, posts_count=posts),
+        execution_options={"synchronize_session": False},
+    )
+    db.commit()
+    return result.rowcount
+
+
+def add_missing_columns():
+    """Add counter columns and indexes to tables created before they existed"""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table, columns in COUNTER_COLUMNS.items():
+            existing = {column["name"] for column in inspector.get_columns(table)}
+            for name in columns:
+                if name not in existing:
+                    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} INTEGER NOT NULL DEFAULT 0"))
+                    print(f"Added {table}.{name}")
+        for index in models.followers.indexes:
+            index.create(conn, checkfirst=True)
+
+
+if __name__ == "__main__":
+    add_missing_columns()
+    db = SessionLocal()
+    try:
+        fixed = reconcile_post_counts(db)
+        print(f"Reconciled counters on {fixed} posts")
+        fixed = reconcile_user_counts(db)
+        print(f"Reconciled counters on {fixed} users")
+    finally:
+        db.close()
@@ -1,16 +1,70 @@
 from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
 from dotenv import load_dotenv
+from instrumentation import instrument_engine, metrics_for, timed_pool
 load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL")
-engine = create_engine(DATABASE_URL)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "postgres": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+# insert() with on_conflict_do_nothing/do_update, per dialect name
+DIALECT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+def to_async_url(url: str):
+    """Map a sync DATABASE_URL onto the matching asyncio driver"""
+    url = make_url(url)
+    backend = url.drivername.split("+")[0]
+    url = url.set(drivername=ASYNC_DRIVERS.get(backend, url.drivername))
+    if backend in ("postgresql", "postgres") and "sslmode" in url.query:
+        # asyncpg spells libpq's sslmode as ssl
+        query = dict(url.query)
+        query["ssl"] = query.pop("sslmode")
+        url = url.set(query=query)
+    return url
+
+def pool_options(url, name: str, base):
+    """Pool settings from the environment; in-memory SQLite keeps its single-connection pool"""
+    url = make_url(url)
+    options = {"pool_pre_ping": DB_POOL_PRE_PING}
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return options
+    options.update(
+        poolclass=timed_pool(base, metrics_for(name)),
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+    )
+    return options
+
+def make_engines(url, name: str, async_url=None):
+    """Sync and async engines for one database, both instrumented under name"""
+    sync_engine = create_engine(url, **pool_options(url, name, QueuePool))
+    async_url = async_url or to_async_url(url)
+    async_engine = create_async_engine(async_url, **pool_options(async_url, f"{name}_async", AsyncAdaptedQueuePool))
+    instrument_engine(sync_engine, name)
+    instrument_engine(async_engine.sync_engine, f"{name}_async")
+    return sync_engine, async_engine
+
+engine, async_engine = make_engines(DATABASE_URL, "primary", os.getenv("ASYNC_DATABASE_URL"))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()  
\ No newline at end of file
+        db.close()
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
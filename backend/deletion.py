@@ -0,0 +1,110 @@
+"""Job handlers removing a post or a user with everything hanging off them.
+
+The routes mark the post or account deleted_at in the request, which hides it
+from reads and logins at once, and leave the rest to these jobs. Each table is cleared with one set-based DELETE instead of the ORM's
+cascade="all, delete-orphan", which loads every like and comment and deletes
+them one by one. Counters on other rows are adjusted with relative UPDATEs in
+the same transaction. Running a handler twice is harmless.
+"""
+from sqlalchemy import delete, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from auth import invalidate_principal
+from counters import reconcile_post_counts, reconcile_user_counts
+from jobs import job, runner
+from response_cache import invalidate
+import chat_cache
+import event_cache
+import follow_graph
+import models
+import search
+import timeline
+
+SET_BASED = {"synchronize_session": False}
+
+
+async def delete_post_rows(db: AsyncSession, post_ids) -> None:
+    """Likes, comments and the posts themselves for post_ids, a list or a subquery"""
+    await db.execute(delete(models.Like).where(models.Like.post_id.in_(post_ids)), execution_options=SET_BASED)
+    await db.execute(delete(models.Comment).where(models.Comment.post_id.in_(post_ids)), execution_options=SET_BASED)
+    await db.execute(delete(models.Post).where(models.Post.id.in_(post_ids)), execution_options=SET_BASED)
+
+
+@job("posts.delete")
+async def delete_post(db: AsyncSession, post_id: int, author_id: int):
+    """Likes, comments and the row of a post the route already hid, unindexed and retracted"""
+    if not await db.scalar(select(func.count()).where(models.Post.id == post_id)):
+        return
+    await delete_post_rows(db, [post_id])
+    await db.commit()
+
+
+def decrement_by_group(model, counter, child, child_key, owner_column, owner_id: int):
+    """UPDATE model SET counter = counter - (owner's rows of child pointing at it), for every row it points at"""
+    owned = select(func.count()).select_from(child).where(child_key == model.id, owner_column == owner_id).scalar_subquery()
+    return (
+        update(model)
+        .where(model.id.in_(select(child_key).where(owner_column == owner_id)))
+        .values({counter: getattr(model, counter) - owned})
+    )
+
+
+@job("users.delete")
+async def delete_user(db: AsyncSession, user_id: int):
+    user = await db.get(models.User, user_id)
+    if user is None:
+        return
+    edges, messages, summaries = models.followers.c, models.ChatMessage, models.ConversationSummary
+    post_ids = (await db.scalars(select(models.Post.id).where(models.Post.author_id == user_id))).all()
+    event_ids = (await db.scalars(select(models.Event.id).where(models.Event.creator_id == user_id))).all()
+    following = (await db.scalars(select(edges.following_id).where(edges.follower_id == user_id))).all()
+    followers = (await db.scalars(select(edges.follower_id).where(edges.following_id == user_id))).all()
+    peers = (await db.scalars(select(summaries.peer_id).where(summaries.owner_id == user_id))).all()
+    # other people's posts whose counters drop with this user's likes and comments
+    reacted = (await db.scalars(
+        select(models.Like.post_id).where(models.Like.user_id == user_id)
+        .union(select(models.Comment.post_id).where(models.Comment.author_id == user_id))
+    )).all()
+
+    # counters on other people's rows first, while the rows they count still exist
+    await db.execute(decrement_by_group(models.Post, "likes_count", models.Like, models.Like.post_id, models.Like.user_id, user_id), execution_options=SET_BASED)
+    await db.execute(decrement_by_group(models.Post, "comments_count", models.Comment, models.Comment.post_id, models.Comment.author_id, user_id), execution_options=SET_BASED)
+    followed_ids = select(edges.following_id).where(edges.follower_id == user_id)
+    follower_ids = select(edges.follower_id).where(edges.following_id == user_id)
+    await db.execute(update(models.User).where(models.User.id.in_(followed_ids)).values(followers_count=models.User.followers_count - 1), execution_options=SET_BASED)
+    await db.execute(update(models.User).where(models.User.id.in_(follower_ids)).values(following_count=models.User.following_count - 1), execution_options=SET_BASED)
+
+    await db.execute(delete(models.Like).where(models.Like.user_id == user_id), execution_options=SET_BASED)
+    await db.execute(delete(models.Comment).where(models.Comment.author_id == user_id), execution_options=SET_BASED)
+    await delete_post_rows(db, select(models.Post.id).where(models.Post.author_id == user_id))
+    await db.execute(delete(models.Event).where(models.Event.creator_id == user_id), execution_options=SET_BASED)
+    await db.execute(delete(models.followers).where(or_(edges.follower_id == user_id, edges.following_id == user_id)), execution_options=SET_BASED)
+    await db.execute(delete(summaries).where(or_(summaries.owner_id == user_id, summaries.peer_id == user_id)), execution_options=SET_BASED)
+    await db.execute(delete(messages).where(or_(messages.sender_id == user_id, messages.receiver_id == user_id)), execution_options=SET_BASED)
+    await db.execute(delete(models.User).where(models.User.id == user_id), execution_options=SET_BASED)
+    await search.unindex_many(db, "post", post_ids)
+    await search.unindex_many(db, "event", event_ids)
+    await search.unindex(db, "user", user_id)
+    await db.commit()
+
+    invalidate_principal(user.username)
+    for other in following:
+        follow_graph.graph.unfollow(user_id, other)
+    for other in followers:
+        follow_graph.graph.unfollow(other, user_id)
+    if event_ids:
+        event_cache.invalidate()
+    await invalidate(
+        "posts", f"user:{user_id}", f"followers:{user_id}", f"following:{user_id}",
+        *(f"post:{post_id}" for post_id in {*post_ids, *reacted}),
+        *(tag for other in following for tag in (f"user:{other}", f"followers:{other}")),
+        *(tag for other in followers for tag in (f"user:{other}", f"following:{other}")),
+    )
+    runner.submit(timeline.retract_author, user_id, list(followers), list(post_ids))
+    for peer in peers:
+        runner.submit(chat_cache.invalidate, user_id, peer)
+
+
+@job("counters.reconcile", executor="thread")
+def reconcile_counters(db: Session):
+    print(f"Reconciled counters on {reconcile_post_counts(db)} posts and {reconcile_user_counts(db)} users")
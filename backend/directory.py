@@ -0,0 +1,319 @@
+"""Bulk import and streaming export of the alumni directory.
+
+    python directory.py import-users alumni.csv [errors.jsonl]
+    python directory.py import-follows follows.jsonl [errors.jsonl]
+    python directory.py export users|posts|follows [out.csv|out.jsonl]
+
+Input is read and output written a row at a time, so a whole graduating class or
+a full directory export never sits in memory. Files ending in .csv are CSV with a
+header row, anything else is one JSON object per line; "-" is stdin/stdout.
+Rejected rows are reported one JSON line each with their line number.
+"""
+import csv
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from collections import Counter
+from datetime import datetime
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, Tuple
+from pydantic import ValidationError
+from sqlalchemy import bindparam, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+from database import DIALECT_INSERTS, engine
+import hashing
+import models, schemas
+import search
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", 500))
+IMPORT_HASH_WORKERS = int(os.getenv("IMPORT_HASH_WORKERS", os.cpu_count() or 2))
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+# Optional users columns accepted beside the schemas.UserCreate fields
+USER_EXTRAS = ("bio", "profile_pic")
+
+Record = Tuple[int, Optional[dict], Optional[str]]
+
+
+def file_format(path: str) -> str:
+    return "csv" if path.lower().endswith(".csv") else "jsonl"
+
+
+def read_records(stream, fmt: str) -> Iterator[Record]:
+    """(line, record, error) per row; empty CSV cells are dropped so schema defaults apply"""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, {name: value for name, value in record.items() if name and value not in (None, "")}, None
+        return
+    for line, raw in enumerate(stream, start=1):
+        if not raw.strip():
+            continue
+        try:
+            record = json.loads(raw)
+        except ValueError as e:
+            yield line, None, f"invalid JSON: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield line, None, "expected a JSON object"
+            continue
+        yield line, record, None
+
+
+def chunked(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def validation_messages(error: ValidationError) -> List[str]:
+    return [f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}" for item in error.errors()]
+
+
+class ImportReport:
+    """Running counts, with each rejected row written to errors as soon as it is known"""
+
+    def __init__(self, errors=None):
+        self.errors = errors
+        self.imported = 0
+        self.skipped = 0
+        self.failed = 0
+
+    def fail(self, line: int, *messages: str):
+        self.failed += 1
+        if self.errors is not None:
+            self.errors.write(json.dumps({"line": line, "errors": list(messages)}) + "\n")
+
+    def summary(self) -> dict:
+        return {"imported": self.imported, "skipped": self.skipped, "failed": self.failed}
+
+
+def hash_executor():
+    if hashing.HASH_POOL_KIND == "process":
+        return ProcessPoolExecutor(IMPORT_HASH_WORKERS)
+    return ThreadPoolExecutor(IMPORT_HASH_WORKERS, thread_name_prefix="bcrypt")
+
+
+def validate_users(batch: List[Record], report: ImportReport) -> list:
+    users = []
+    for line, record, error in batch:
+        if error:
+            report.fail(line, error)
+            continue
+        try:
+            user = schemas.UserCreate(**record)
+        except ValidationError as e:
+            report.fail(line, *validation_messages(e))
+            continue
+        users.append((line, user, {name: record.get(name) for name in USER_EXTRAS}))
+    return users
+
+
+def drop_taken(users: list, report: ImportReport) -> list:
+    """Two queries per batch for emails and usernames already registered, then duplicates within the batch"""
+    table = models.User.__table__
+    with engine.connect() as conn:
+        emails = set(conn.scalars(select(table.c.email).where(table.c.email.in_({user.email for _, user, _ in users}))))
+        usernames = set(conn.scalars(select(table.c.username).where(table.c.username.in_({user.username for _, user, _ in users}))))
+    kept = []
+    for line, user, extras in users:
+        if user.email in emails:
+            report.fail(line, "email: Email already registered")
+        elif user.username in usernames:
+            report.fail(line, "username: Username already taken")
+        else:
+            emails.add(user.email)
+            usernames.add(user.username)
+            kept.append((line, user, extras))
+    return kept
+
+
+def insert_users(lines: List[int], rows: List[dict], report: ImportReport):
+    table = models.User.__table__
+    statement = insert(table).returning(table.c.id, *search.SOURCES["user"][1])
+    try:
+        with engine.begin() as conn:
+            # executemany with RETURNING is sent as multi-row INSERT ... VALUES statements
+            inserted = conn.execute(statement, rows).all()
+            search.index_rows(conn, "user", inserted)
+        report.imported += len(inserted)
+        return
+    except IntegrityError:
+        pass
+    # someone registered one of these since the uniqueness check; go row by row to find out who
+    for line, row in zip(lines, rows):
+        try:
+            with engine.begin() as conn:
+                search.index_rows(conn, "user", conn.execute(statement, [row]).all())
+            report.imported += 1
+        except IntegrityError:
+            report.fail(line, "email or username already registered")
+
+
+def import_users(records: Iterable[Record], report: ImportReport, batch_size: int = IMPORT_BATCH_SIZE) -> ImportReport:
+    """Validate, dedupe, hash in parallel and insert users batch by batch"""
+    with hash_executor() as executor:
+        for batch in chunked(records, batch_size):
+            users = validate_users(batch, report)
+            users = drop_taken(users, report) if users else users
+            if not users:
+                continue
+            hashes = executor.map(hashing.hash_password_sync, [user.password for _, user, _ in users])
+            rows = [
+                {
+                    "email": user.email,
+                    "username": user.username,
+                    "full_name": user.full_name,
+                    "is_alumni": user.is_alumni,
+                    "hashed_password": hashed_password,
+                    **extras,
+                }
+                for (_, user, extras), hashed_password in zip(users, hashes)
+            ]
+            insert_users([line for line, _, _ in users], rows, report)
+    return report
+
+
+def parse_edges(batch: List[Record], report: ImportReport) -> list:
+    edges = []
+    for line, record, error in batch:
+        if error:
+            report.fail(line, error)
+            continue
+        follower, following = record.get("follower"), record.get("following")
+        if not follower or not following:
+            report.fail(line, "follower and following usernames are required")
+            continue
+        if follower == following:
+            report.fail(line, "users cannot follow themselves")
+            continue
+        created_at = record.get("created_at")
+        try:
+            created_at = datetime.fromisoformat(created_at) if created_at else datetime.utcnow()
+        except (TypeError, ValueError):
+            report.fail(line, f"created_at: not an ISO timestamp: {created_at}")
+            continue
+        edges.append((line, str(follower), str(following), created_at))
+    return edges
+
+
+def import_follows(records: Iterable[Record], report: ImportReport, batch_size: int = IMPORT_BATCH_SIZE) -> ImportReport:
+    """Insert follow edges by username, skipping ones that exist, and bump both users' counters"""
+    users = models.User.__table__
+    table = models.followers
+    for batch in chunked(records, batch_size):
+        edges = parse_edges(batch, report)
+        if not edges:
+            continue
+        with engine.begin() as conn:
+            names = {name for _, follower, following, _ in edges for name in (follower, following)}
+            ids = dict(conn.execute(select(users.c.username, users.c.id).where(users.c.username.in_(names))).all())
+            rows, resolved = {}, 0
+            for line, follower, following, created_at in edges:
+                unknown = [name for name in (follower, following) if name not in ids]
+                if unknown:
+                    report.fail(line, *(f"unknown user: {name}" for name in unknown))
+                    continue
+                resolved += 1
+                rows.setdefault((ids[follower], ids[following]), created_at)
+            if not rows:
+                continue
+            statement = DIALECT_INSERTS[conn.dialect.name](table).values([
+                {"follower_id": follower_id, "following_id": following_id, "created_at": created_at}
+                for (follower_id, following_id), created_at in rows.items()
+            ])
+            inserted = conn.execute(statement.on_conflict_do_nothing().returning(table.c.follower_id, table.c.following_id)).all()
+            report.imported += len(inserted)
+            # edges already present, or repeated in the file, are not errors
+            report.skipped += resolved - len(inserted)
+            deltas = Counter()
+            for follower_id, following_id in inserted:
+                deltas[(follower_id, "following_count")] += 1
+                deltas[(following_id, "followers_count")] += 1
+            for column in ("following_count", "followers_count"):
+                params = [{"user_id": user_id, "delta": delta} for (user_id, name), delta in deltas.items() if name == column]
+                if params:
+                    conn.execute(
+                        update(users).where(users.c.id == bindparam("user_id")).values({column: users.c[column] + bindparam("delta")}),
+                        params,
+                    )
+    return report
+
+
+def export_query(kind: str):
+    user, post = models.User, models.Post
+    if kind == "users":
+        return select(user.id, user.email, user.username, user.full_name, user.is_alumni, user.bio, user.profile_pic, user.created_at).order_by(user.id)
+    if kind == "posts":
+        return (
+            select(post.id, user.username.label("author"), post.content, post.media_url, post.created_at, post.likes_count, post.comments_count)
+            .join(user, post.author_id == user.id)
+            .where(post.deleted_at.is_(None))
+            .order_by(post.id)
+        )
+    if kind == "follows":
+        follower, following = aliased(user), aliased(user)
+        edges = models.followers
+        return (
+            select(follower.username.label("follower"), following.username.label("following"), edges.c.created_at)
+            .join(follower, edges.c.follower_id == follower.id)
+            .join(following, edges.c.following_id == following.id)
+            .order_by(edges.c.follower_id, edges.c.following_id)
+        )
+    raise ValueError(f"Unknown export {kind!r}, expected users, posts or follows")
+
+
+def export_rows(kind: str) -> Iterator[dict]:
+    """Rows of one export as dicts, fetched EXPORT_BATCH_SIZE at a time from a server-side cursor"""
+    with engine.connect() as conn:
+        result = conn.execution_options(yield_per=EXPORT_BATCH_SIZE).execute(export_query(kind))
+        for row in result.mappings():
+            yield {name: value.isoformat() if isinstance(value, datetime) else value for name, value in row.items()}
+
+
+def write_export(kind: str, stream, fmt: str = "jsonl") -> int:
+    written = 0
+    writer = None
+    for row in export_rows(kind):
+        if fmt == "csv":
+            if writer is None:
+                writer = csv.DictWriter(stream, fieldnames=list(row))
+                writer.writeheader()
+            writer.writerow(row)
+        else:
+            stream.write(json.dumps(row) + "\n")
+        written += 1
+    if fmt == "csv" and writer is None:
+        csv.writer(stream).writerow([column.name for column in export_query(kind).selected_columns])
+    return written
+
+
+def open_path(path: str, mode: str):
+    if path == "-":
+        return sys.stdin if "r" in mode else sys.stdout
+    return open(path, mode, newline="", encoding="utf-8")
+
+
+IMPORTS = {"import-users": import_users, "import-follows": import_follows}
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command in IMPORTS and len(sys.argv) > 2:
+        search.configure(engine)
+        source = open_path(sys.argv[2], "r")
+        errors = open_path(sys.argv[3], "w") if len(sys.argv) > 3 else sys.stderr
+        report = IMPORTS[command](read_records(source, file_format(sys.argv[2])), ImportReport(errors))
+        print(json.dumps(report.summary()), file=sys.stderr if errors is sys.stdout else sys.stdout)
+    elif command == "export" and len(sys.argv) > 2:
+        path = sys.argv[3] if len(sys.argv) > 3 else "-"
+        output = open_path(path, "w")
+        count = write_export(sys.argv[2], output, file_format(path))
+        output.flush()
+        print(f"Exported {count} {sys.argv[2]}", file=sys.stderr)
+    else:
+        print(__doc__, file=sys.stderr)
+        sys.exit(2)
@@ -0,0 +1,98 @@
+import bisect
+import hashlib
+import os
+import time
+from datetime import datetime
+from typing import List, Optional, Tuple
+from fastapi import Response
+from sqlalchemy.ext.asyncio import AsyncSession
+import models, schemas
+from conditional import etag_for
+from loaders import shaped_select
+from pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
+
+UPCOMING_WINDOW_SIZE = int(os.getenv("UPCOMING_WINDOW_SIZE", 200))
+# Bounds staleness on other workers, which never see this worker's invalidations
+UPCOMING_WINDOW_TTL_SECONDS = float(os.getenv("UPCOMING_WINDOW_TTL_SECONDS", 30))
+SORT_KEY = (models.Event.event_date, models.Event.id)
+
+
+class UpcomingWindow:
+    """The next UPCOMING_WINDOW_SIZE events from built_at on, validated once and shared by every request"""
+
+    def __init__(self, events: List[schemas.Event], complete: bool, built_at: datetime):
+        self.events = events
+        self.keys = [(event.event_date, event.id) for event in events]
+        self.complete = complete
+        self.built_at = built_at
+        self.loaded = time.monotonic()
+        self.digest = etag_for(events)
+        self.modified_at = built_at
+
+    def page_etag(self, start: int, stop: int) -> str:
+        """Tag for events[start:stop], from the window's digest rather than hashing the page again"""
+        return f'W/"{hashlib.sha1(f"{self.digest}:{start}:{stop}".encode()).hexdigest()}"'
+
+
+window: Optional[UpcomingWindow] = None
+generation = 0
+hits = 0
+misses = 0
+
+
+def invalidate():
+    global window, generation
+    window = None
+    generation += 1
+
+
+async def load(db: AsyncSession) -> UpcomingWindow:
+    global window
+    started = generation
+    built_at = datetime.utcnow()
+    query = shaped_select(schemas.Event).where(models.Event.event_date >= built_at).order_by(*SORT_KEY).limit(UPCOMING_WINDOW_SIZE + 1)
+    rows = (await db.execute(query)).scalars().all()
+    loaded = UpcomingWindow([schemas.Event.model_validate(row) for row in rows[:UPCOMING_WINDOW_SIZE]], len(rows) <= UPCOMING_WINDOW_SIZE, built_at)
+    previous = window
+    # a reload that finds the same events keeps the old Last-Modified, so If-Modified-Since still matches
+    if previous is not None and previous.digest == loaded.digest:
+        loaded.modified_at = previous.modified_at
+    # an event created or deleted while this query ran makes the result stale before it is stored
+    if generation == started:
+        window = loaded
+    return loaded
+
+
+async def upcoming(db: AsyncSession, response: Response, cursor: Optional[str] = None, skip: int = 0, limit: int = 20) -> Optional[Tuple[List[schemas.Event], str, datetime]]:
+    """(page, ETag, last modified) of upcoming events served from memory, or None when the page reaches past the window"""
+    global hits, misses
+    current = window
+    if current is None or time.monotonic() - current.loaded > UPCOMING_WINDOW_TTL_SECONDS:
+        misses += 1
+        current = await load(db)
+    else:
+        hits += 1
+    # events that have started since the window was built drop off the front
+    start = bisect.bisect_left(current.keys, (datetime.utcnow(), 0))
+    if cursor:
+        start = max(start, bisect.bisect_right(current.keys, tuple(decode_cursor(cursor, SORT_KEY))))
+    else:
+        start += skip
+    page = current.events[start:start + limit + 1]
+    if len(page) <= limit and not current.complete:
+        return None
+    if len(page) > limit:
+        page = page[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(current.keys[start + limit - 1])
+    return page, current.page_etag(start, start + len(page)), current.modified_at
+
+
+def stats() -> dict:
+    lookups = hits + misses
+    return {
+        "size": len(window.events) if window is not None else 0,
+        "complete": window.complete if window is not None else False,
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+    }
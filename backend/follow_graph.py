@@ -0,0 +1,323 @@
+import asyncio
+import bisect
+import heapq
+import os
+import time
+from array import array
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+from sqlalchemy import case, exists, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+import models
+
+try:
+    import numpy
+except ImportError:  # sorted array('i') rows and bisect still work, suggestions are just counted in Python
+    numpy = None
+
+FOLLOW_GRAPH_ENABLED = os.getenv("FOLLOW_GRAPH_ENABLED", "1").lower() in ("1", "true", "yes")
+# Bounds staleness on other workers, which only see their own follows between reloads
+FOLLOW_GRAPH_REFRESH_SECONDS = float(os.getenv("FOLLOW_GRAPH_REFRESH_SECONDS", 300))
+FOLLOW_GRAPH_LOAD_CHUNK = 100000
+# Followees expanded per suggestion request, mutual follows first, so celebrity-heavy users stay cheap
+SUGGESTION_FANOUT = int(os.getenv("SUGGESTION_FANOUT", 200))
+SUGGESTION_ALUMNI_WEIGHT = float(os.getenv("SUGGESTION_ALUMNI_WEIGHT", 1.5))
+SUGGESTION_FOLLOWS_YOU_WEIGHT = 2.0
+
+# (user id, score, mutual count, follows you)
+Suggestion = Tuple[int, float, int, bool]
+
+
+def as_row(values) -> "array":
+    values = sorted(values)
+    return numpy.array(values, dtype=numpy.int32) if numpy is not None else array("i", values)
+
+
+class Adjacency:
+    """Compressed sparse rows: the neighbours of id i, sorted, are targets[offsets[i]:offsets[i + 1]].
+
+    Two flat integer arrays, about 4 bytes per edge, instead of a Python set per user.
+    """
+
+    def __init__(self, offsets, targets):
+        self.offsets = offsets
+        self.targets = targets
+
+    @property
+    def size(self) -> int:
+        return len(self.offsets) - 1
+
+    @classmethod
+    def build(cls, sources: "array", targets: "array", size: int) -> "Adjacency":
+        if numpy is not None:
+            sources = numpy.frombuffer(sources, dtype=numpy.int32) if isinstance(sources, array) else sources
+            targets = numpy.frombuffer(targets, dtype=numpy.int32) if isinstance(targets, array) else targets
+            # one sort of (source, target) packed into int64 orders every row at once
+            keys = (sources.astype(numpy.int64) << 32) | targets.astype(numpy.int64)
+            keys.sort()
+            offsets = numpy.zeros(size + 1, dtype=numpy.int64)
+            numpy.cumsum(numpy.bincount(sources, minlength=size), out=offsets[1:])
+            return cls(offsets, (keys & 0xFFFFFFFF).astype(numpy.int32))
+        offsets = array("q", bytes(8 * (size + 1)))
+        for source in sources:
+            offsets[source + 1] += 1
+        for i in range(size):
+            offsets[i + 1] += offsets[i]
+        fill = array("q", offsets)
+        rows = array("i", bytes(4 * len(targets)))
+        for source, target in zip(sources, targets):
+            rows[fill[source]] = target
+            fill[source] += 1
+        for i in range(size):
+            start, end = offsets[i], offsets[i + 1]
+            if end - start > 1:
+                rows[start:end] = array("i", sorted(rows[start:end]))
+        return cls(offsets, rows)
+
+    @classmethod
+    def empty(cls) -> "Adjacency":
+        return cls.build(array("i"), array("i"), 0)
+
+    def row(self, i: int):
+        if i >= self.size:
+            return self.targets[:0]
+        return self.targets[self.offsets[i]:self.offsets[i + 1]]
+
+    def contains(self, i: int, j: int) -> bool:
+        if i >= self.size:
+            return False
+        lo, hi = int(self.offsets[i]), int(self.offsets[i + 1])
+        if numpy is not None:
+            row = self.targets[lo:hi]
+            k = int(row.searchsorted(j))
+            return k < len(row) and int(row[k]) == j
+        k = bisect.bisect_left(self.targets, j, lo, hi)
+        return k < hi and self.targets[k] == j
+
+
+def load(engine) -> Tuple[Adjacency, Adjacency, bytearray, int]:
+    """Both directions of the followers table and the alumni flags, read in chunks on a sync connection"""
+    sources, targets = array("i"), array("i")
+    with engine.connect() as conn:
+        size = (conn.scalar(select(func.max(models.User.id))) or 0) + 1
+        alumni = bytearray(size)
+        for (user_id,) in conn.execute(select(models.User.id).where(models.User.is_alumni.is_(True))):
+            alumni[user_id] = 1
+        edges = select(models.followers.c.follower_id, models.followers.c.following_id)
+        result = conn.execution_options(stream_results=True, yield_per=FOLLOW_GRAPH_LOAD_CHUNK).execute(edges)
+        for chunk in result.partitions():
+            sources.extend(row[0] for row in chunk)
+            targets.extend(row[1] for row in chunk)
+    size = max([size, *(max(ids) + 1 for ids in (sources, targets) if ids)])
+    alumni.extend(bytes(size - len(alumni)))
+    return Adjacency.build(sources, targets, size), Adjacency.build(targets, sources, size), alumni, len(sources)
+
+
+class FollowGraph:
+    """Who follows whom, in memory, for friends-of-friends suggestions.
+
+    The base adjacency is rebuilt from the followers table every
+    FOLLOW_GRAPH_REFRESH_SECONDS. Follows and unfollows made by this worker are
+    applied straight away to small per-user overlays; they are idempotent, so
+    changes made while a reload is running are replayed onto the new base.
+    """
+
+    def __init__(self):
+        self.following = Adjacency.empty()
+        self.followers = Adjacency.empty()
+        self.alumni = bytearray()
+        self.edges = 0
+        self.ready = False
+        self.loaded_at = 0.0
+        self.load_seconds = 0.0
+        self._reset_overlay()
+        self._replay: Optional[List[Tuple[bool, int, int]]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _reset_overlay(self):
+        self.added_out: Dict[int, Set[int]] = {}
+        self.added_in: Dict[int, Set[int]] = {}
+        self.removed_out: Dict[int, Set[int]] = {}
+        self.removed_in: Dict[int, Set[int]] = {}
+
+    def swap(self, following: Adjacency, followers: Adjacency, alumni: bytearray, edges: int):
+        self.following, self.followers, self.alumni, self.edges = following, followers, alumni, edges
+        self._reset_overlay()
+        self.ready = True
+
+    async def reload(self, engine):
+        self._replay = []
+        started = time.perf_counter()
+        try:
+            loaded = await asyncio.to_thread(load, engine)
+        except Exception:
+            self._replay = None
+            raise
+        replay, self._replay = self._replay, None
+        self.swap(*loaded)
+        for followed, follower_id, following_id in replay:
+            self._apply(followed, follower_id, following_id)
+        self.loaded_at = time.time()
+        self.load_seconds = time.perf_counter() - started
+
+    async def _run(self, engine):
+        while True:
+            try:
+                await self.reload(engine)
+            except Exception as e:
+                print(f"Follow graph load failed: {e}")
+            await asyncio.sleep(FOLLOW_GRAPH_REFRESH_SECONDS)
+
+    def start(self, engine):
+        if FOLLOW_GRAPH_ENABLED and self._task is None:
+            self._task = asyncio.create_task(self._run(engine))
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _apply(self, followed: bool, follower_id: int, following_id: int):
+        if followed:
+            self.removed_out.get(follower_id, set()).discard(following_id)
+            self.removed_in.get(following_id, set()).discard(follower_id)
+            if not self.following.contains(follower_id, following_id):
+                self.added_out.setdefault(follower_id, set()).add(following_id)
+                self.added_in.setdefault(following_id, set()).add(follower_id)
+        else:
+            self.added_out.get(follower_id, set()).discard(following_id)
+            self.added_in.get(following_id, set()).discard(follower_id)
+            if self.following.contains(follower_id, following_id):
+                self.removed_out.setdefault(follower_id, set()).add(following_id)
+                self.removed_in.setdefault(following_id, set()).add(follower_id)
+
+    def follow(self, follower_id: int, following_id: int):
+        self._apply(True, follower_id, following_id)
+        if self._replay is not None:
+            self._replay.append((True, follower_id, following_id))
+
+    def unfollow(self, follower_id: int, following_id: int):
+        self._apply(False, follower_id, following_id)
+        if self._replay is not None:
+            self._replay.append((False, follower_id, following_id))
+
+    def add_user(self, user_id: int, is_alumni: bool):
+        if user_id >= len(self.alumni):
+            self.alumni.extend(bytes(user_id + 1 - len(self.alumni)))
+        self.alumni[user_id] = 1 if is_alumni else 0
+
+    def _neighbours(self, base: Adjacency, added, removed, user_id: int):
+        row = base.row(user_id)
+        if not added.get(user_id) and not removed.get(user_id):
+            return row
+        return as_row((set(row.tolist()) - removed.get(user_id, set())) | added.get(user_id, set()))
+
+    def following_of(self, user_id: int):
+        return self._neighbours(self.following, self.added_out, self.removed_out, user_id)
+
+    def followers_of(self, user_id: int):
+        return self._neighbours(self.followers, self.added_in, self.removed_in, user_id)
+
+    def suggestions(self, user_id: int, limit: int = 20) -> List[Suggestion]:
+        """People followed by the people user_id follows, plus followers not followed back.
+
+        Scores are the number of mutual connections, SUGGESTION_FOLLOWS_YOU_WEIGHT
+        extra for someone who already follows user_id, scaled by
+        SUGGESTION_ALUMNI_WEIGHT for alumni. Best first, ties by lower id.
+        """
+        if numpy is not None:
+            return self._suggestions_numpy(user_id, limit)
+        following, followers = self.following_of(user_id), self.followers_of(user_id)
+        following_set, followers_set = set(following), set(followers)
+        friends = [other for other in following if other in followers_set]
+        expand = (friends + [other for other in following if other not in followers_set])[:SUGGESTION_FANOUT]
+        mutuals = Counter()
+        for other in expand:
+            mutuals.update(self.following_of(other))
+        for other in followers:
+            mutuals[other] += 0
+        scored = []
+        for candidate, count in mutuals.items():
+            if candidate == user_id or candidate in following_set:
+                continue
+            follows_you = candidate in followers_set
+            score = count + SUGGESTION_FOLLOWS_YOU_WEIGHT * follows_you
+            if candidate < len(self.alumni) and self.alumni[candidate]:
+                score *= SUGGESTION_ALUMNI_WEIGHT
+            scored.append((score, -candidate, count, follows_you))
+        return [(-negated, score, count, follows_you) for score, negated, count, follows_you in heapq.nlargest(limit, scored)]
+
+    def _suggestions_numpy(self, user_id: int, limit: int) -> List[Suggestion]:
+        following, followers = self.following_of(user_id), self.followers_of(user_id)
+        friends = numpy.intersect1d(following, followers, assume_unique=True)
+        expand = numpy.concatenate([friends, numpy.setdiff1d(following, friends, assume_unique=True)])[:SUGGESTION_FANOUT]
+        reached = numpy.concatenate([self.following_of(int(other)) for other in expand] or [following[:0]])
+        candidates, mutuals = numpy.unique(numpy.concatenate([reached, followers]), return_counts=True)
+        follows_you = numpy.isin(candidates, followers, assume_unique=True)
+        mutuals = mutuals - follows_you
+        keep = ~numpy.isin(candidates, following, assume_unique=True) & (candidates != user_id)
+        candidates, mutuals, follows_you = candidates[keep], mutuals[keep], follows_you[keep]
+        if not len(candidates):
+            return []
+        flags = numpy.frombuffer(self.alumni, dtype=numpy.uint8)
+        alumni = numpy.zeros(len(candidates), dtype=bool)
+        known = candidates < len(flags)
+        alumni[known] = flags[candidates[known]] != 0
+        scores = (mutuals + SUGGESTION_FOLLOWS_YOU_WEIGHT * follows_you) * numpy.where(alumni, SUGGESTION_ALUMNI_WEIGHT, 1.0)
+        if len(scores) > limit:
+            threshold = numpy.partition(scores, len(scores) - limit)[len(scores) - limit]
+            top = numpy.flatnonzero(scores >= threshold)
+        else:
+            top = numpy.arange(len(scores))
+        top = top[numpy.lexsort((candidates[top], -scores[top]))][:limit]
+        return [(int(candidates[i]), float(scores[i]), int(mutuals[i]), bool(follows_you[i])) for i in top]
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "vectorized": numpy is not None,
+            "users": self.following.size,
+            "edges": self.edges,
+            "overlay_edges": sum(map(len, self.added_out.values())) + sum(map(len, self.removed_out.values())),
+            "load_ms": round(self.load_seconds * 1000, 1),
+            "age_seconds": round(time.time() - self.loaded_at, 1) if self.ready else None,
+        }
+
+
+graph = FollowGraph()
+
+
+async def is_following(db: AsyncSession, follower_id: int, following_id: int) -> bool:
+    """From the database: the graph can lag other workers' follows by a whole refresh"""
+    edge = models.followers.c
+    return bool(await db.scalar(select(exists().where(edge.follower_id == follower_id, edge.following_id == following_id))))
+
+
+async def suggestions(db: AsyncSession, user_id: int, limit: int = 20) -> List[Suggestion]:
+    """From the graph once it is loaded, otherwise the same scoring as one grouped query over friends of friends"""
+    if graph.ready:
+        return graph.suggestions(user_id, limit)
+    edge, reached = models.followers.alias("edge"), models.followers.alias("reached")
+    followed = select(edge.c.following_id).where(edge.c.follower_id == user_id)
+    followers = select(edge.c.follower_id).where(edge.c.following_id == user_id)
+    mutuals = (
+        select(reached.c.following_id.label("candidate"), func.count().label("mutuals"))
+        .where(reached.c.follower_id.in_(followed.limit(SUGGESTION_FANOUT)))
+        .group_by(reached.c.following_id)
+        .subquery()
+    )
+    candidates = select(mutuals.c.candidate).union(followers).subquery()
+    candidate = candidates.c[0]
+    follows_you = candidate.in_(followers)
+    count = func.coalesce(mutuals.c.mutuals, 0)
+    score = (count + case((follows_you, SUGGESTION_FOLLOWS_YOU_WEIGHT), else_=0)) * case((models.User.is_alumni, SUGGESTION_ALUMNI_WEIGHT), else_=1.0)
+    rows = await db.execute(
+        select(candidate, score, count, follows_you)
+        .select_from(candidates)
+        .join(models.User, models.User.id == candidate)
+        .outerjoin(mutuals, mutuals.c.candidate == candidate)
+        .where(candidate != user_id, candidate.not_in(followed))
+        .order_by(score.desc(), candidate)
+        .limit(limit)
+    )
+    return [(candidate_id, float(value), mutual_count, bool(back)) for candidate_id, value, mutual_count, back in rows]
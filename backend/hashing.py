@@ -0,0 +1,129 @@
+import asyncio
+import os
+import re
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+import bcrypt
+from fastapi import HTTPException, status
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+HASH_POOL_KIND = os.getenv("HASH_POOL_KIND", "thread")
+HASH_POOL_WORKERS = int(os.getenv("HASH_POOL_WORKERS", max(1, min(4, (os.cpu_count() or 2) - 1))))
+# Hashing requests allowed in flight (running plus queued) before new ones are turned away
+HASH_POOL_MAX_PENDING = int(os.getenv("HASH_POOL_MAX_PENDING", HASH_POOL_WORKERS * 8))
+HASH_POOL_RETRY_AFTER = os.getenv("HASH_POOL_RETRY_AFTER", "2")
+ROUNDS_PATTERN = re.compile(r"^\$2[abxy]?\$(\d{2})\$")
+
+
+def hash_password_sync(password: str, rounds: int = BCRYPT_ROUNDS) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=rounds)).decode('utf-8')
+
+
+def check_password_sync(password: str, hashed_password: str) -> bool:
+    return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
+
+
+def hash_rounds(hashed_password: str) -> Optional[int]:
+    match = ROUNDS_PATTERN.match(hashed_password or "")
+    return int(match.group(1)) if match else None
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    rounds = hash_rounds(hashed_password)
+    return rounds is not None and rounds < BCRYPT_ROUNDS
+
+
+def _timed_call(fn, *args):
+    # wall clock so the timings line up when the call ran in another process
+    started = time.time()
+    result = fn(*args)
+    return started, time.time(), result
+
+
+class HashPoolBusy(HTTPException):
+    def __init__(self):
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many sign-ins in progress, please retry shortly",
+            headers={"Retry-After": HASH_POOL_RETRY_AFTER},
+        )
+
+
+class HashPool:
+    """Size-limited executor for bcrypt with admission control.
+
+    At most max_pending calls are accepted at a time; beyond that callers get a 503
+    straight away instead of queueing behind a login storm.
+    """
+
+    def __init__(self, workers: int = HASH_POOL_WORKERS, max_pending: int = HASH_POOL_MAX_PENDING, kind: str = HASH_POOL_KIND):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.kind = kind
+        self._executor: Optional[Executor] = None
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.run_seconds = 0.0
+
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    def has_capacity(self) -> bool:
+        return self.pending < self.max_pending
+
+    async def run(self, fn, *args):
+        if not self.has_capacity():
+            self.rejected += 1
+            raise HashPoolBusy()
+        self.pending += 1
+        submitted = time.time()
+        try:
+            started, finished, result = await asyncio.get_running_loop().run_in_executor(self.executor(), _timed_call, fn, *args)
+        finally:
+            self.pending -= 1
+        wait = max(0.0, started - submitted)
+        self.completed += 1
+        self.wait_seconds += wait
+        self.max_wait_seconds = max(self.max_wait_seconds, wait)
+        self.run_seconds += finished - started
+        return result
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        completed = self.completed or 1
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "rounds": BCRYPT_ROUNDS,
+            "in_flight": self.pending,
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.wait_seconds * 1000 / completed, 2),
+            "max_wait_ms": round(self.max_wait_seconds * 1000, 2),
+            "avg_run_ms": round(self.run_seconds * 1000 / completed, 2),
+        }
+
+
+pool = HashPool()
+
+
+async def hash_password(password: str) -> str:
+    return await pool.run(hash_password_sync, password)
+
+
+async def check_password(password: str, hashed_password: str) -> bool:
+    return await pool.run(check_password_sync, password, hashed_password)
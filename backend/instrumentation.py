@@ -0,0 +1,169 @@
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Optional
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+QUERY_BUDGET = int(os.getenv("DB_QUERY_BUDGET", 0))
+QUERY_BUDGET_MODE = os.getenv("DB_QUERY_BUDGET_MODE", "log")
+QUERY_COUNT_HEADER = "X-DB-Query-Count"
+QUERY_TIME_HEADER = "X-DB-Time-Ms"
+
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+
+class PoolMetrics:
+    def __init__(self, name: str):
+        self.name = name
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self._lock = threading.Lock()
+
+    def record_wait(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            self.checkouts += 1
+            self.timeouts += timed_out
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+
+
+def timed_pool(base, metrics: PoolMetrics):
+    """Subclass a QueuePool so every checkout records how long it waited for a connection"""
+
+    class TimedPool(base):
+        def _do_get(self):
+            start = time.perf_counter()
+            try:
+                connection = super()._do_get()
+            except PoolTimeoutError:
+                metrics.record_wait(time.perf_counter() - start, timed_out=True)
+                raise
+            metrics.record_wait(time.perf_counter() - start)
+            return connection
+
+    TimedPool.__name__ = f"Timed{base.__name__}"
+    return TimedPool
+
+
+pool_metrics = {}
+instrumented_engines = {}
+
+
+def metrics_for(name: str) -> PoolMetrics:
+    return pool_metrics.setdefault(name, PoolMetrics(name))
+
+
+def pool_stats() -> dict:
+    stats = {}
+    for name, engine in instrumented_engines.items():
+        pool, metrics = engine.pool, metrics_for(name)
+        stats[name] = {
+            "pool": type(pool).__name__,
+            "size": pool.size() if hasattr(pool, "size") else None,
+            "in_use": pool.checkedout() if hasattr(pool, "checkedout") else None,
+            "idle": pool.checkedin() if hasattr(pool, "checkedin") else None,
+            "overflow": pool.overflow() if hasattr(pool, "overflow") else None,
+            "checkouts": metrics.checkouts,
+            "checkout_timeouts": metrics.timeouts,
+            "checkout_wait_ms_total": round(metrics.wait_seconds_total * 1000, 3),
+            "checkout_wait_ms_max": round(metrics.wait_seconds_max * 1000, 3),
+        }
+    return stats
+
+
+class RequestQueryStats:
+    __slots__ = ("count", "seconds", "budget")
+
+    def __init__(self, budget: int = QUERY_BUDGET):
+        self.count = 0
+        self.seconds = 0.0
+        self.budget = budget
+
+
+current_query_stats: ContextVar[Optional[RequestQueryStats]] = ContextVar("current_query_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["query_start"] = time.perf_counter()
+    stats = current_query_stats.get()
+    if stats is None:
+        return
+    stats.count += 1
+    if stats.budget and stats.count > stats.budget and QUERY_BUDGET_MODE == "raise":
+        raise QueryBudgetExceeded(f"Request exceeded its budget of {stats.budget} queries: {statement[:200]}")
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current_query_stats.get()
+    if stats is not None:
+        stats.seconds += time.perf_counter() - conn.info["query_start"]
+
+
+def instrument_engine(engine, name: str):
+    """Count queries and database time per request on a sync engine (or an async engine's sync_engine)"""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    instrumented_engines[name] = engine
+
+
+class RouteQueryStats:
+    def __init__(self):
+        self.routes = {}
+        self._lock = threading.Lock()
+
+    def record(self, route: str, stats: RequestQueryStats):
+        with self._lock:
+            entry = self.routes.setdefault(route, {"requests": 0, "queries": 0, "max_queries": 0, "db_ms": 0.0, "over_budget": 0})
+            entry["requests"] += 1
+            entry["queries"] += stats.count
+            entry["max_queries"] = max(entry["max_queries"], stats.count)
+            entry["db_ms"] += stats.seconds * 1000
+            entry["over_budget"] += bool(stats.budget and stats.count > stats.budget)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                route: {**entry, "db_ms": round(entry["db_ms"], 3), "avg_queries": round(entry["queries"] / entry["requests"], 2)}
+                for route, entry in self.routes.items()
+            }
+
+
+route_query_stats = RouteQueryStats()
+
+
+class QueryStatsMiddleware:
+    """Reports per-request query count and database time as response headers and /metrics, and enforces DB_QUERY_BUDGET"""
+
+    def __init__(self, app, budget: int = QUERY_BUDGET):
+        self.app = app
+        self.budget = budget
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestQueryStats(self.budget)
+        token = current_query_stats.set(stats)
+
+        async def send_with_stats(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((QUERY_COUNT_HEADER.lower().encode(), str(stats.count).encode()))
+                headers.append((QUERY_TIME_HEADER.lower().encode(), f"{stats.seconds * 1000:.2f}".encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_stats)
+        finally:
+            current_query_stats.reset(token)
+            route = getattr(scope.get("route"), "path", "<unmatched>")
+            route_query_stats.record(f"{scope['method']} {route}", stats)
+            if stats.budget and stats.count > stats.budget:
+                print(f"Query budget exceeded: {scope['method']} {route} ran {stats.count} queries (budget {stats.budget})")
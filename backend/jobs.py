@@ -0,0 +1,323 @@
+"""Background jobs: persisted work with retries, plus best-effort in-process tasks.
+
+    python jobs.py                         run a worker until interrupted
+    python jobs.py enqueue NAME [k=v ...]  queue a job, e.g. counters.reconcile
+
+Handlers are registered with @job and must be idempotent: a job whose worker
+dies mid-run is picked up again once its lease expires.
+"""
+import asyncio
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, NamedTuple, Optional, Set
+from sqlalchemy import delete, event, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import DIALECT_INSERTS, AsyncSessionLocal, SessionLocal
+from message_bus import WORKER_ID
+import models
+
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", 4))
+JOB_THREAD_WORKERS = int(os.getenv("JOB_THREAD_WORKERS", 2))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", 2))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 5))
+# A job still running after this long is assumed abandoned by a dead worker and queued again
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", 300))
+JOB_SHUTDOWN_TIMEOUT = float(os.getenv("JOB_SHUTDOWN_TIMEOUT", 10))
+JOB_RETENTION_HOURS = float(os.getenv("JOB_RETENTION_HOURS", 24))
+HOUSEKEEPING_SECONDS = 60
+
+
+class Handler(NamedTuple):
+    fn: Callable
+    executor: str
+    max_attempts: int
+
+
+handlers: Dict[str, Handler] = {}
+
+
+def job(name: str, executor: str = "asyncio", max_attempts: int = JOB_MAX_ATTEMPTS):
+    """Register a handler for jobs called name.
+
+    "asyncio" handlers are awaited as fn(db: AsyncSession, **payload); "thread"
+    handlers run on the runner's thread pool as fn(db: Session, **payload), for
+    blocking work. Either commits its own session.
+    """
+    if executor not in ("asyncio", "thread"):
+        raise ValueError(f"Unknown executor {executor!r}")
+
+    def register(fn):
+        handlers[name] = Handler(fn, executor, max_attempts)
+        return fn
+    return register
+
+
+async def enqueue(db: AsyncSession, name: str, key: Optional[str] = None, delay: float = 0, **payload):
+    """Queue a job in the caller's transaction, so it exists exactly when that write commits.
+
+    A key already used by another job, pending or finished, makes this a no-op.
+    """
+    if name not in handlers:
+        raise ValueError(f"No handler registered for job {name!r}")
+    table = models.Job.__table__
+    statement = DIALECT_INSERTS[db.bind.dialect.name](table).values(
+        name=name,
+        payload=json.dumps(payload),
+        idempotency_key=key,
+        run_at=datetime.utcnow() + timedelta(seconds=delay),
+    )
+    if key is not None:
+        statement = statement.on_conflict_do_nothing(index_elements=[table.c.idempotency_key])
+    await db.execute(statement)
+    event.listen(db.sync_session, "after_commit", lambda session: runner.wake(), once=True)
+
+
+def backoff(attempts: int) -> timedelta:
+    return timedelta(seconds=min(2 ** attempts, 300))
+
+
+def _run_sync(fn, payload: dict):
+    db = SessionLocal()
+    try:
+        fn(db, **payload)
+    finally:
+        db.close()
+
+
+class JobRunner:
+    """Claims due jobs from the jobs table and runs up to JOB_CONCURRENCY at a time.
+
+    Claims are a conditional UPDATE, so several workers can share one table. stop()
+    lets running jobs finish for JOB_SHUTDOWN_TIMEOUT, then cancels the rest and
+    puts them back in the queue.
+    """
+
+    def __init__(self, concurrency: int = JOB_CONCURRENCY):
+        self.concurrency = concurrency
+        self.running: Set[asyncio.Task] = set()
+        self.background: Set[asyncio.Task] = set()
+        self.lanes: Dict[str, asyncio.Lock] = {}
+        self.wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._housekeeping_at = 0.0
+        self.completed = 0
+        self.retried = 0
+        self.failed = 0
+        self.background_failed = 0
+
+    def threads(self) -> ThreadPoolExecutor:
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(JOB_THREAD_WORKERS, thread_name_prefix="jobs")
+        return self._threads
+
+    async def start(self):
+        self.wakeup = asyncio.Event()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    def wake(self):
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while not self._stopping:
+            try:
+                if loop.time() >= self._housekeeping_at:
+                    self._housekeeping_at = loop.time() + HOUSEKEEPING_SECONDS
+                    await self.housekeeping()
+                claimed = await self.claim(self.concurrency - len(self.running)) if len(self.running) < self.concurrency else []
+            except Exception as e:
+                print(f"Job runner error: {e}")
+                claimed = []
+            for row in claimed:
+                task = asyncio.create_task(self.execute(row))
+                self.running.add(task)
+                task.add_done_callback(self._done)
+            if claimed and len(self.running) < self.concurrency:
+                continue
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), JOB_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    def _done(self, task: asyncio.Task):
+        self.running.discard(task)
+        self.wake()
+
+    async def claim(self, limit: int) -> list:
+        job = models.Job
+        now = datetime.utcnow()
+        async with AsyncSessionLocal() as db:
+            due = select(job.id).where(job.status == "pending", job.run_at <= now).order_by(job.run_at, job.id).limit(limit)
+            ids = (await db.scalars(due)).all()
+            if not ids:
+                return []
+            # only rows still pending are taken, so a job claimed by another worker meanwhile is skipped
+            claimed = (await db.execute(
+                update(job)
+                .where(job.id.in_(ids), job.status == "pending")
+                .values(status="running", attempts=job.attempts + 1, locked_by=WORKER_ID, locked_at=now)
+                .returning(job.id, job.name, job.payload, job.attempts),
+                execution_options={"synchronize_session": False},
+            )).all()
+            await db.commit()
+            return claimed
+
+    async def execute(self, row):
+        handler = handlers.get(row.name)
+        try:
+            if handler is None:
+                raise LookupError(f"No handler registered for job {row.name!r}")
+            payload = json.loads(row.payload)
+            if handler.executor == "thread":
+                await asyncio.get_running_loop().run_in_executor(self.threads(), _run_sync, handler.fn, payload)
+            else:
+                async with AsyncSessionLocal() as db:
+                    await handler.fn(db, **payload)
+        except asyncio.CancelledError:
+            await self.finish(row.id, status="pending", attempts=models.Job.attempts - 1, run_at=datetime.utcnow())
+            raise
+        except Exception as e:
+            max_attempts = handler.max_attempts if handler else 1
+            if row.attempts < max_attempts:
+                self.retried += 1
+                await self.finish(row.id, status="pending", last_error=repr(e), run_at=datetime.utcnow() + backoff(row.attempts))
+            else:
+                self.failed += 1
+                print(f"Job {row.name} #{row.id} failed after {row.attempts} attempts: {e}")
+                await self.finish(row.id, status="failed", last_error=repr(e), finished_at=datetime.utcnow())
+        else:
+            self.completed += 1
+            await self.finish(row.id, status="done", last_error=None, finished_at=datetime.utcnow())
+
+    async def finish(self, job_id: int, **values):
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(models.Job).where(models.Job.id == job_id).values(locked_by=None, locked_at=None, **values),
+                    execution_options={"synchronize_session": False},
+                )
+                await db.commit()
+        except Exception as e:
+            # the lease runs out and the job is retried, which handlers are written to tolerate
+            print(f"Could not record job #{job_id} as {values.get('status')}: {e}")
+
+    async def housekeeping(self):
+        """Requeue jobs whose worker died and drop finished ones past JOB_RETENTION_HOURS"""
+        job = models.Job
+        now = datetime.utcnow()
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(job)
+                .where(job.status == "running", job.locked_at < now - timedelta(seconds=JOB_LEASE_SECONDS))
+                .values(status="pending", locked_by=None, locked_at=None),
+                execution_options={"synchronize_session": False},
+            )
+            await db.execute(
+                delete(job).where(job.status == "done", job.finished_at < now - timedelta(hours=JOB_RETENTION_HOURS)),
+                execution_options={"synchronize_session": False},
+            )
+            await db.commit()
+
+    def submit(self, fn, *args, lane: Optional[str] = None, attempts: int = 3):
+        """Run coroutine function fn(*args) in the background with retries, without persisting it.
+
+        For best-effort side effects such as cache writes. Calls sharing a lane run
+        one at a time in submission order.
+        """
+        task = asyncio.create_task(self._background(fn, args, lane, attempts))
+        self.background.add(task)
+        task.add_done_callback(self.background.discard)
+        return task
+
+    async def _background(self, fn, args, lane, attempts):
+        lock = self.lanes.setdefault(lane, asyncio.Lock()) if lane else None
+        if lock:
+            await lock.acquire()
+        try:
+            for attempt in range(1, attempts + 1):
+                try:
+                    return await fn(*args)
+                except Exception as e:
+                    if attempt == attempts:
+                        self.background_failed += 1
+                        print(f"Background {getattr(fn, '__name__', fn)} failed after {attempts} attempts: {e}")
+                        return None
+                    await asyncio.sleep(0.1 * 2 ** attempt)
+        finally:
+            if lock:
+                lock.release()
+
+    async def run_pending(self):
+        """Run every due job to completion in the calling task, for scripts and one-off workers"""
+        while True:
+            claimed = await self.claim(self.concurrency)
+            if not claimed:
+                return
+            await asyncio.gather(*(self.execute(row) for row in claimed))
+
+    async def stop(self, timeout: float = JOB_SHUTDOWN_TIMEOUT):
+        if self._task is not None:
+            # wait_for can swallow the cancel when a wake() lands at the same moment; the flag still ends the loop
+            self._stopping = True
+            self.wake()
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        tasks = self.running | self.background
+        if tasks:
+            _, unfinished = await asyncio.wait(tasks, timeout=timeout)
+            for task in unfinished:
+                task.cancel()
+            await asyncio.gather(*unfinished, return_exceptions=True)
+        if self._threads is not None:
+            self._threads.shutdown(wait=False, cancel_futures=True)
+            self._threads = None
+        self.wakeup = None
+
+    def stats(self) -> dict:
+        return {
+            "running": len(self.running),
+            "background": len(self.background),
+            "completed": self.completed,
+            "retried": self.retried,
+            "failed": self.failed,
+            "background_failed": self.background_failed,
+        }
+
+
+runner = JobRunner()
+
+
+async def work():
+    import deletion  # noqa: F401  registers the handlers
+    await runner.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.stop()
+
+
+async def enqueue_command(name: str, payload: dict):
+    import deletion  # noqa: F401
+    async with AsyncSessionLocal() as db:
+        await enqueue(db, name, **payload)
+        await db.commit()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "enqueue":
+        asyncio.run(enqueue_command(sys.argv[2], dict(arg.split("=", 1) for arg in sys.argv[3:])))
+        print(f"Queued {sys.argv[2]}")
+    else:
+        try:
+            asyncio.run(work())
+        except KeyboardInterrupt:
+            pass
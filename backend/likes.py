@@ -0,0 +1,285 @@
+"""Likes: one idempotent statement per tap, or buffered and written in batches.
+
+By default a like is a single INSERT ... SELECT ... ON CONFLICT DO NOTHING
+against the unique (post_id, user_id) index and an unlike a single DELETE, so a
+double-tap can neither add a second like nor count one twice.
+
+With LIKES_WRITE_BEHIND a tap only records the caller's latest intent for the
+post in a buffer: in process, or a Redis hash shared by every worker once Redis
+is up. The writer applies whatever is pending every LIKE_FLUSH_INTERVAL_MS with
+a few set-based statements and one counter update per post touched, so a viral
+post's row is written once per flush instead of once per tap. Counts lag by up
+to a flush; taps a worker had buffered in process are lost if it dies.
+"""
+import asyncio
+import os
+import uuid
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from redis.exceptions import ResponseError
+from sqlalchemy import bindparam, delete, literal, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from counters import adjust_post_counts
+from database import DIALECT_INSERTS, AsyncSessionLocal
+from response_cache import invalidate
+import models
+
+LIKES_WRITE_BEHIND = os.getenv("LIKES_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+LIKE_FLUSH_INTERVAL_MS = int(os.getenv("LIKE_FLUSH_INTERVAL_MS", 200))
+# rows per INSERT or DELETE statement in a flush
+LIKE_FLUSH_CHUNK = int(os.getenv("LIKE_FLUSH_CHUNK", 500))
+
+likes = models.Like.__table__
+posts = models.Post.__table__
+Key = Tuple[int, int]
+
+
+async def like(db: AsyncSession, post_id: int, user_id: int) -> Optional[bool]:
+    """True if this tap added the like, False if it was already there, None if there is no such post"""
+    if LIKES_WRITE_BEHIND:
+        if await db.scalar(select(models.Post.id).where(models.Post.id == post_id, models.Post.deleted_at.is_(None))) is None:
+            return None
+        await buffer.put(post_id, user_id, True)
+        return True
+    source = select(posts.c.id, literal(user_id), literal(datetime.utcnow(), models.Like.created_at.type)).where(posts.c.id == post_id, posts.c.deleted_at.is_(None))
+    statement = DIALECT_INSERTS[db.bind.dialect.name](likes).from_select(["post_id", "user_id", "created_at"], source)
+    statement = statement.on_conflict_do_nothing(index_elements=["post_id", "user_id"])
+    if (await db.execute(statement.returning(likes.c.id))).first() is None:
+        return False if await db.scalar(select(models.Post.id).where(models.Post.id == post_id, models.Post.deleted_at.is_(None))) else None
+    await adjust_post_counts(db, post_id, likes=1)
+    await db.commit()
+    await invalidate("posts", f"post:{post_id}")
+    return True
+
+
+async def unlike(db: AsyncSession, post_id: int, user_id: int) -> bool:
+    """True if this tap removed a like, False if there was none to remove"""
+    if LIKES_WRITE_BEHIND:
+        await buffer.put(post_id, user_id, False)
+        return True
+    statement = delete(likes).where(likes.c.post_id == post_id, likes.c.user_id == user_id)
+    if (await db.execute(statement.returning(likes.c.id))).first() is None:
+        return False
+    await adjust_post_counts(db, post_id, likes=-1)
+    await db.commit()
+    await invalidate("posts", f"post:{post_id}")
+    return True
+
+
+async def liked_post_ids(db: AsyncSession, user_id: int, post_ids: Iterable[int]) -> List[int]:
+    """Which of post_ids user_id likes, in one query; taps still waiting for the writer count"""
+    post_ids = list(dict.fromkeys(post_ids))
+    if not post_ids:
+        return []
+    liked = set(await db.scalars(select(likes.c.post_id).where(likes.c.user_id == user_id, likes.c.post_id.in_(post_ids))))
+    if LIKES_WRITE_BEHIND:
+        for store in [*retired, buffer]:
+            for post_id, state in (await store.pending_for(user_id, post_ids)).items():
+                (liked.add if state else liked.discard)(post_id)
+    return [post_id for post_id in post_ids if post_id in liked]
+
+
+class MemoryLikeBuffer:
+    """Latest like state per (post, user) since the last flush, in this process"""
+
+    name = "memory"
+
+    def __init__(self):
+        self.intents: Dict[Key, bool] = {}
+
+    async def put(self, post_id: int, user_id: int, liked: bool):
+        self.intents[(post_id, user_id)] = liked
+
+    async def take(self) -> Dict[Key, bool]:
+        intents, self.intents = self.intents, {}
+        return intents
+
+    async def restore(self, intents: Dict[Key, bool]):
+        # taps made since the failed flush are newer and win
+        for key, liked in intents.items():
+            self.intents.setdefault(key, liked)
+
+    async def pending_for(self, user_id: int, post_ids: List[int]) -> Dict[int, bool]:
+        return {post_id: self.intents[(post_id, user_id)] for post_id in post_ids if (post_id, user_id) in self.intents}
+
+    def size(self) -> Optional[int]:
+        return len(self.intents)
+
+
+class RedisLikeBuffer:
+    """Pending intents in one Redis hash of "post:user" -> 1/0, shared by every worker.
+
+    A flush renames the hash away before reading it, so taps landing meanwhile go
+    to a fresh hash and two workers never apply the same intents.
+    """
+
+    name = "redis"
+    KEY = "likes:pending"
+
+    def __init__(self, client):
+        self.client = client
+
+    @staticmethod
+    def field(post_id: int, user_id: int) -> str:
+        return f"{post_id}:{user_id}"
+
+    async def put(self, post_id: int, user_id: int, liked: bool):
+        await self.client.hset(self.KEY, self.field(post_id, user_id), int(liked))
+
+    async def take(self) -> Dict[Key, bool]:
+        flushing = f"likes:flushing:{uuid.uuid4().hex}"
+        try:
+            await self.client.rename(self.KEY, flushing)
+        except ResponseError:
+            # nothing pending
+            return {}
+        entries = await self.client.hgetall(flushing)
+        await self.client.delete(flushing)
+        intents = {}
+        for field, value in entries.items():
+            post_id, user_id = field.split(b":")
+            intents[(int(post_id), int(user_id))] = value == b"1"
+        return intents
+
+    async def restore(self, intents: Dict[Key, bool]):
+        async with self.client.pipeline(transaction=False) as pipe:
+            for (post_id, user_id), liked in intents.items():
+                pipe.hsetnx(self.KEY, self.field(post_id, user_id), int(liked))
+            await pipe.execute()
+
+    async def pending_for(self, user_id: int, post_ids: List[int]) -> Dict[int, bool]:
+        values = await self.client.hmget(self.KEY, [self.field(post_id, user_id) for post_id in post_ids])
+        return {post_id: value == b"1" for post_id, value in zip(post_ids, values) if value is not None}
+
+    def size(self) -> Optional[int]:
+        return None
+
+
+buffer = MemoryLikeBuffer()
+# buffers replaced by configure(), drained by the next flush
+retired: list = []
+
+
+def configure(redis_client=None):
+    global buffer
+    retired.append(buffer)
+    buffer = RedisLikeBuffer(redis_client) if redis_client is not None else MemoryLikeBuffer()
+
+
+def chunks(items: list, size: int = LIKE_FLUSH_CHUNK):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+async def apply(intents: Dict[Key, bool]) -> Counter:
+    """Write intents in one transaction, returns the net like change per post"""
+    deltas = Counter()
+    async with AsyncSessionLocal() as db:
+        dialect = db.bind.dialect.name
+        post_ids = {post_id for post_id, _ in intents}
+        user_ids = {user_id for _, user_id in intents}
+        # posts and users deleted since the tap; their likes went with them
+        live_posts = set(await db.scalars(select(posts.c.id).where(posts.c.id.in_(post_ids), posts.c.deleted_at.is_(None))))
+        live_users = set(await db.scalars(select(models.User.id).where(models.User.id.in_(user_ids))))
+        # sorted, so concurrent flushes from other workers lock rows in the same order
+        wanted = sorted(key for key, liked in intents.items() if liked and key[0] in live_posts and key[1] in live_users)
+        unwanted = sorted(key for key, liked in intents.items() if not liked)
+        now = datetime.utcnow()
+        for chunk in chunks(wanted):
+            rows = [{"post_id": post_id, "user_id": user_id, "created_at": now} for post_id, user_id in chunk]
+            statement = DIALECT_INSERTS[dialect](likes).values(rows).on_conflict_do_nothing(index_elements=["post_id", "user_id"])
+            deltas.update(await db.scalars(statement.returning(likes.c.post_id)))
+        for chunk in chunks(unwanted):
+            statement = delete(likes).where(tuple_(likes.c.post_id, likes.c.user_id).in_(chunk))
+            deltas.subtract(await db.scalars(statement.returning(likes.c.post_id)))
+        params = [{"post_id": post_id, "delta": delta} for post_id, delta in sorted(deltas.items()) if delta]
+        if params:
+            await db.execute(update(posts).where(posts.c.id == bindparam("post_id")).values(likes_count=posts.c.likes_count + bindparam("delta")), params)
+        await db.commit()
+    return deltas
+
+
+class LikeWriter:
+    """Flushes buffered likes every interval, and once more on stop"""
+
+    def __init__(self, flush_interval: float = LIKE_FLUSH_INTERVAL_MS / 1000):
+        self.flush_interval = flush_interval
+        self.flushed = 0
+        self.batches = 0
+        self.changed = 0
+        self.failed = 0
+        self._stopping: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._stopping = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stopping.set()
+        await self._task
+        self._task = None
+
+    async def _run(self):
+        last = False
+        while not last:
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            # checked before flushing, so taps made during a flush that stop() interrupted get one more
+            last = self._stopping.is_set()
+            await self.flush()
+
+    async def flush(self):
+        try:
+            intents = {}
+            while retired:
+                intents.update(await retired[0].take())
+                retired.pop(0)
+            intents.update(await buffer.take())
+        except Exception as e:
+            print(f"Like buffer error: {e}")
+            return
+        if not intents:
+            return
+        try:
+            deltas = await apply(intents)
+        except IntegrityError as e:
+            # a post or user deleted mid-flush; retrying the same batch would fail again
+            print(f"Like flush dropped {len(intents)} taps: {e.orig}")
+            self.failed += len(intents)
+            return
+        except Exception as e:
+            print(f"Like flush failed, retrying next interval: {e}")
+            try:
+                await buffer.restore(intents)
+            except Exception as e:
+                print(f"Like buffer error, {len(intents)} taps lost: {e}")
+                self.failed += len(intents)
+            return
+        self.flushed += len(intents)
+        self.batches += 1
+        self.changed += sum(abs(delta) for delta in deltas.values())
+        touched = [f"post:{post_id}" for post_id, delta in deltas.items() if delta]
+        if touched:
+            await invalidate("posts", *touched)
+
+    def stats(self) -> dict:
+        return {
+            "write_behind": LIKES_WRITE_BEHIND,
+            "buffer": buffer.name,
+            "pending": buffer.size(),
+            "flushed": self.flushed,
+            "batches": self.batches,
+            "rows_changed": self.changed,
+            "failed": self.failed,
+            "avg_batch": round(self.flushed / self.batches, 2) if self.batches else 0.0,
+        }
+
+
+writer = LikeWriter()
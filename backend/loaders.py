@@ -0,0 +1,36 @@
+from sqlalchemy import select
+from sqlalchemy.orm import configure_mappers, joinedload, selectinload
+import models, schemas
+
+# Relationships each response schema serializes, and how to load them up front.
+# Many-to-one parents ride along in the same query ("joined"); collections get one
+# extra IN query per page ("selectin"). Anything not listed here must not be touched
+# during serialization, since lazy loads are not allowed on an AsyncSession.
+RESPONSE_SHAPES = {
+    schemas.Post: (models.Post, {"author": "joined"}),
+    schemas.Comment: (models.Comment, {"author": "joined"}),
+    schemas.Event: (models.Event, {"creator": "joined"}),
+    schemas.User: (models.User, {}),
+    # counts come from counter columns on users, never from the collections
+    schemas.UserWithStats: (models.User, {}),
+    schemas.ChatMessage: (models.ChatMessage, {}),
+    schemas.ConversationSummary: (models.ConversationSummary, {"peer": "joined"}),
+}
+STRATEGIES = {"joined": joinedload, "selectin": selectinload}
+
+
+def load_options(schema) -> list:
+    # backrefs such as User.followers only exist once the mappers are configured
+    configure_mappers()
+    model, relationships = RESPONSE_SHAPES[schema]
+    return [STRATEGIES[strategy](getattr(model, name)) for name, strategy in relationships.items()]
+
+
+def shaped_select(schema):
+    """select() of the schema's model with everything it serializes eagerly loaded"""
+    model, _ = RESPONSE_SHAPES[schema]
+    return select(model).options(*load_options(schema))
+
+
+def relationship_names(schema) -> list:
+    return list(RESPONSE_SHAPES[schema][1])
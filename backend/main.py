@@ -1,88 +1,192 @@
-from fastapi import FastAPI, Depends, HTTPException, status, WebSocket, WebSocketDisconnect
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, HTTPException, Request, status, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordRequestForm
-from fastapi.staticfiles import StaticFiles  
-from fastapi.responses import FileResponse  
-from sqlalchemy.orm import Session
+from fastapi.responses import JSONResponse
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
-from typing import Dict
+import asyncio
 import json
-import redis
 import os
 PORT = int(os.getenv("PORT", 8000))
-from dotenv import load_dotenv
-from database import engine, get_db, Base
+from database import engine, async_engine, get_async_db, AsyncSessionLocal
 import models, schemas
-from auth import authenticate_user, create_access_token, get_password_hash, get_current_user, ACCESS_TOKEN_EXPIRE_MINUTES
-from routes import users, posts, events, chat
-load_dotenv()
-Base.metadata.create_all(bind=engine)
-app = FastAPI(title="Alumni-Student Network")
+from instrumentation import QueryStatsMiddleware, pool_stats, route_query_stats
+from auth import authenticate_user, create_access_token, decode_token, load_principal, principal_cache_stats, ACCESS_TOKEN_EXPIRE_MINUTES
+from routes import users, posts, events, chat, search as search_routes
+from connections import manager
+import assets
+import chat_cache
+import chat_pipeline
+import event_cache
+import follow_graph
+import hashing
+import jobs
+import likes
+import message_bus
+import migrations
+import redis_link
+import replicas
+import response_cache
+import search
+import timeline
+READINESS_DB_TIMEOUT = float(os.getenv("READINESS_DB_TIMEOUT", 2))
+# what /health/ready reports on, filled in by lifespan
+startup_state = {"started": False, "pending_migrations": None}
+
+async def use_redis(client):
+    """Move every Redis-backed store off its in-memory fallback, the first time Redis answers"""
+    previous_bus = message_bus.bus
+    timeline.configure(client)
+    chat_cache.configure(client)
+    message_bus.configure(client)
+    response_cache.configure(client)
+    likes.configure(client)
+    await manager.rebind(previous_bus)
+
+redis_link.link.on_connect(use_redis)
+
+async def prepare_database():
+    """Apply or check migrations, then set up search and warm the pool and the upcoming events window"""
+    if migrations.MIGRATE_ON_STARTUP:
+        await asyncio.to_thread(migrations.upgrade)
+    pending = await asyncio.to_thread(migrations.pending)
+    startup_state["pending_migrations"] = [migration.version for migration in pending]
+    if pending:
+        print(f"Schema is {len(pending)} migrations behind, run python migrations.py")
+        return
+    await asyncio.to_thread(search.configure, engine)
+    async with AsyncSessionLocal() as db:
+        await event_cache.load(db)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # none waits on the others; Redis gets one attempt bounded by REDIS_CONNECT_TIMEOUT
+    await asyncio.gather(prepare_database(), redis_link.link.start(), replicas.replica_set.start(), asyncio.to_thread(assets.frontend.load))
+    await manager.start()
+    await chat_pipeline.writer.start()
+    await likes.writer.start()
+    await jobs.runner.start()
+    follow_graph.graph.start(engine)
+    startup_state["started"] = True
+    try:
+        yield
+    finally:
+        startup_state["started"] = False
+        await chat_pipeline.writer.stop()
+        await likes.writer.stop()
+        await manager.stop()
+        await jobs.runner.stop()
+        hashing.pool.shutdown()
+        follow_graph.graph.stop()
+        await redis_link.link.stop()
+        await replicas.replica_set.stop()
+        # aiosqlite's connection threads are not daemons and would keep the process alive
+        await async_engine.dispose()
+        engine.dispose()
+
+app = FastAPI(title="Alumni-Student Network", lifespan=lifespan)
+app.add_middleware(response_cache.ResponseCacheMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-DB-Query-Count", "X-DB-Time-Ms", "X-Cache", "ETag", "Last-Modified"],
 )
+app.add_middleware(QueryStatsMiddleware)
+app.add_middleware(replicas.ReadYourWritesMiddleware)
 
-try:
-    redis_client = redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379"))
-    redis_client.ping()
-    print("Redis connected successfully")
-except Exception as e:
-    print(f"Redis connection failed: {e}")
-    redis_client = None
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[int, WebSocket] = {}
-
-    async def connect(self, user_id: int, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections[user_id] = websocket
-        print(f"User {user_id} connected via WebSocket")
-    def disconnect(self, user_id: int):
-        if user_id in self.active_connections:
-            del self.active_connections[user_id]
-            print(f"User {user_id} disconnected")
-    async def send_personal_message(self, message: dict, user_id: int):
-        if user_id in self.active_connections:
-            await self.active_connections[user_id].send_json(message)
-    async def broadcast(self, message: dict):
-        for connection in self.active_connections.values():
-            await connection.send_json(message)
-manager = ConnectionManager()
 app.include_router(users.router)
 app.include_router(posts.router)
 app.include_router(events.router)
 app.include_router(chat.router)
-@app.get("/")
-async def serve_frontend():
+app.include_router(search_routes.router)
+@app.api_route("/", methods=["GET", "HEAD"])
+async def serve_frontend(request: Request):
     """Serve the frontend HTML file"""
-    import os
-    frontend_path = os.path.join(os.path.dirname(__file__), "..", "frontend", "index.html")
-    return FileResponse(frontend_path)
+    return await serve_static(request, assets.frontend.INDEX)
 
-@app.get("/")
-async def serve_frontend():
-    """Serve the frontend HTML file"""
-    import os
-    frontend_path = os.path.join(os.path.dirname(__file__), "..", "frontend", "index.html")
-    return FileResponse(frontend_path)
+@app.api_route("/static/{name:path}", methods=["GET", "HEAD"])
+async def serve_static(request: Request, name: str):
+    """Frontend files, immutable under their content-hashed names"""
+    asset, cache_control = assets.frontend.get(name)
+    if asset is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    return assets.serve(request, asset, cache_control)
+
+@app.api_route("/media/{name:path}", methods=["GET", "HEAD"])
+async def serve_media(request: Request, name: str):
+    """Uploaded files that media_url and profile_pic point at"""
+    asset = await assets.media_asset(name)
+    if asset is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    return assets.serve(request, asset, assets.media_cache_control())
 
 @app.get("/health")
 def health_check():
     """API health check endpoint"""
     return {"message": "Alumni-Student Network API", "status": "running"}   
+
+@app.get("/health/live")
+def liveness():
+    """The process is up and serving; checks no dependencies, so a database outage does not get workers restarted"""
+    return {"status": "alive"}
+
+async def database_reachable():
+    async with async_engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+@app.get("/health/ready")
+async def readiness():
+    """Whether this worker should receive traffic: started, schema current, database answering, Redis when REDIS_REQUIRED"""
+    pending = startup_state["pending_migrations"]
+    checks = {
+        "started": startup_state["started"],
+        "schema": pending == [],
+        "database": True,
+        "redis": redis_link.link.connected,
+    }
+    try:
+        await asyncio.wait_for(database_reachable(), READINESS_DB_TIMEOUT)
+    except Exception as e:
+        checks["database"] = False
+        print(f"Readiness database check failed: {e or type(e).__name__}")
+    required = [name for name in checks if name != "redis" or redis_link.REDIS_REQUIRED]
+    ready = all(checks[name] for name in required)
+    body = {"status": "ready" if ready else "not ready", "checks": checks, "pending_migrations": pending}
+    return JSONResponse(body, status_code=200 if ready else 503)
+
+@app.get("/metrics")
+def metrics():
+    """In-process cache and performance counters"""
+    return {
+        "auth_cache": principal_cache_stats(),
+        "db_pool": pool_stats(),
+        "db_queries": route_query_stats.snapshot(),
+        "websockets": manager.stats(),
+        "chat_writer": chat_pipeline.writer.stats(),
+        "likes": likes.writer.stats(),
+        "password_hashing": hashing.pool.stats(),
+        "upcoming_events": event_cache.stats(),
+        "response_cache": response_cache.stats(),
+        "follow_graph": follow_graph.graph.stats(),
+        "jobs": jobs.runner.stats(),
+        "redis": redis_link.link.stats(),
+        "read_replicas": replicas.replica_set.stats(),
+        "static": assets.stats(),
+    }
 @app.post("/register", response_model=schemas.User)
-def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(models.User).filter(models.User.email == user.email).first()
+async def register(user: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
+    db_user = (await db.execute(select(models.User).where(models.User.email == user.email))).scalars().first()
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
-    db_user = db.query(models.User).filter(models.User.username == user.username).first()
+    db_user = (await db.execute(select(models.User).where(models.User.username == user.username))).scalars().first()
     if db_user:
         raise HTTPException(status_code=400, detail="Username already taken")
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await hashing.hash_password(user.password)
     db_user = models.User(
         email=user.email,
         username=user.username,
@@ -91,13 +195,15 @@ def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
         hashed_password=hashed_password
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.flush()
+    await search.index(db, "user", db_user)
+    await db.commit()
+    follow_graph.graph.add_user(db_user.id, db_user.is_alumni)
     return db_user
 
 @app.post("/token", response_model=schemas.Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = authenticate_user(db, form_data.username, form_data.password)
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -111,12 +217,11 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.websocket("/ws/{token}")
-async def websocket_endpoint(websocket: WebSocket, token: str, db: Session = Depends(get_db)):
+async def websocket_endpoint(websocket: WebSocket, token: str):
     try:
-        from jose import jwt, JWTError
-        from auth import SECRET_KEY, ALGORITHM
+        from jose import JWTError
         try:
-            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            payload = decode_token(token)
             username: str = payload.get("sub")
             if username is None:
                 await websocket.close(code=1008)
@@ -124,7 +229,8 @@ async def websocket_endpoint(websocket: WebSocket, token: str, db: Session = Dep
         except JWTError:
             await websocket.close(code=1008)
             return
-        user = db.query(models.User).filter(models.User.username == username).first()
+        async with AsyncSessionLocal() as db:
+            user = await load_principal(db, username)
         if not user:
             await websocket.close(code=1008)
             return
@@ -134,46 +240,12 @@ async def websocket_endpoint(websocket: WebSocket, token: str, db: Session = Dep
                 
                 data = await websocket.receive_text()
                 message_data = json.loads(data)
-                
-                # Save message to database
-                chat_message = models.ChatMessage(
-                    sender_id=user.id,
-                    receiver_id=message_data["receiver_id"],
-                    message=message_data["message"]
-                )
-                db.add(chat_message)
-                db.commit()
-                db.refresh(chat_message)
-                if redis_client:
-                    try:
-                        chat_key = f"chat:{min(user.id, message_data['receiver_id'])}:{max(user.id, message_data['receiver_id'])}"
-                        redis_client.lpush(chat_key, json.dumps({
-                            "id": chat_message.id,
-                            "sender_id": user.id,
-                            "receiver_id": message_data["receiver_id"],
-                            "message": message_data["message"],
-                            "created_at": chat_message.created_at.isoformat()
-                        }))
-                        redis_client.ltrim(chat_key, 0, 99)  
-                    except Exception as e:
-                        print(f"Redis error: {e}")
-                response_data = {
-                    "id": chat_message.id,
-                    "sender_id": user.id,
-                    "receiver_id": message_data["receiver_id"],
-                    "message": message_data["message"],
-                    "created_at": chat_message.created_at.isoformat(),
-                    "sender_username": user.username,
-                    "sender_full_name": user.full_name
-                }
-                
-                await manager.send_personal_message(response_data, message_data["receiver_id"])
-                await manager.send_personal_message(response_data, user.id)
+                await chat_pipeline.ingest(user, message_data)
         except WebSocketDisconnect:
-            manager.disconnect(user.id)
+            await manager.disconnect(user.id, websocket)
         except Exception as e:
             print(f"WebSocket error: {e}")
-            manager.disconnect(user.id)
+            await manager.disconnect(user.id, websocket)
     except Exception as e:
         print(f"WebSocket connection error: {e}")
         await websocket.close(code=1011)
@@ -0,0 +1,208 @@
+import asyncio
+import json
+import os
+import socket
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+# Identifies this process on the bus and in the presence registry
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+PRESENCE_TTL_SECONDS = int(os.getenv("PRESENCE_TTL_SECONDS", 60))
+BROADCAST_CHANNEL = "ws:broadcast"
+INVALIDATION_CHANNEL = "cache:invalidate"
+
+Handler = Callable[[dict, Optional[int]], Awaitable[None]]
+# cache name -> drops keys from that in-process cache when another worker announces them
+invalidators: Dict[str, Callable[[List[str]], None]] = {}
+
+
+def user_channel(user_id: int) -> str:
+    return f"ws:user:{user_id}"
+
+
+class MemoryBus:
+    """Single-process bus: the publishing worker has already delivered locally, so there is nobody else to tell"""
+
+    async def start(self, handler: Handler):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def subscribe(self, user_id: int):
+        pass
+
+    async def unsubscribe(self, user_id: int):
+        pass
+
+    async def publish(self, message: dict, user_id: Optional[int] = None):
+        pass
+
+    async def announce(self, cache: str, keys: List[str]):
+        pass
+
+
+class RedisBus:
+    """Redis pub/sub with a channel per connected user plus one broadcast channel.
+
+    A worker subscribes to a user's channel while that user has a socket on it, so
+    messages only travel to workers that can deliver them. Envelopes carry the
+    publishing worker's id and are skipped when they come back to it. Cache
+    invalidations travel on their own channel to every worker.
+    """
+
+    def __init__(self, client, worker_id: str = WORKER_ID):
+        self.client = client
+        self.worker_id = worker_id
+        self.pubsub = None
+        self.loop = None
+        self._listener = None
+
+    async def start(self, handler: Handler):
+        self.handler = handler
+        self.loop = asyncio.get_running_loop()
+        self.pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        await self.pubsub.subscribe(BROADCAST_CHANNEL, INVALIDATION_CHANNEL)
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._listener:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+        if self.pubsub:
+            await self.pubsub.aclose()
+
+    async def _listen(self):
+        while True:
+            try:
+                received = await self.pubsub.get_message(timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Message bus error: {e}")
+                await asyncio.sleep(1)
+                continue
+            if received is None:
+                continue
+            envelope = json.loads(received["data"])
+            if envelope["origin"] == self.worker_id:
+                continue
+            try:
+                if "cache" in envelope:
+                    invalidators[envelope["cache"]](envelope["keys"])
+                    continue
+                await self.handler(envelope["message"], envelope["user_id"])
+            except Exception as e:
+                print(f"Message bus delivery error: {e}")
+
+    async def subscribe(self, user_id: int):
+        await self.pubsub.subscribe(user_channel(user_id))
+
+    async def unsubscribe(self, user_id: int):
+        await self.pubsub.unsubscribe(user_channel(user_id))
+
+    async def publish(self, message: dict, user_id: Optional[int] = None):
+        channel = BROADCAST_CHANNEL if user_id is None else user_channel(user_id)
+        await self.client.publish(channel, json.dumps({"origin": self.worker_id, "user_id": user_id, "message": message}))
+
+    async def announce(self, cache: str, keys: List[str]):
+        try:
+            await self.client.publish(INVALIDATION_CHANNEL, json.dumps({"origin": self.worker_id, "cache": cache, "keys": keys}))
+        except Exception as e:
+            # the other workers' entries still expire with their TTL
+            print(f"Message bus error: {e}")
+
+
+class MemoryPresence:
+    def __init__(self):
+        self._users: Set[int] = set()
+
+    async def add(self, user_id: int):
+        self._users.add(user_id)
+
+    async def remove(self, user_id: int):
+        self._users.discard(user_id)
+
+    async def heartbeat(self, user_ids: Iterable[int]):
+        pass
+
+    async def online(self, user_ids: Iterable[int]) -> Set[int]:
+        return {user_id for user_id in user_ids if user_id in self._users}
+
+
+class RedisPresence:
+    """Per-user sorted set of workers holding a socket, scored by their last heartbeat.
+
+    A worker that dies without cleaning up simply stops refreshing its score and
+    ages out after PRESENCE_TTL_SECONDS.
+    """
+
+    def __init__(self, client, worker_id: str = WORKER_ID, ttl: int = PRESENCE_TTL_SECONDS):
+        self.client = client
+        self.worker_id = worker_id
+        self.ttl = ttl
+
+    @staticmethod
+    def key(user_id: int) -> str:
+        return f"presence:{user_id}"
+
+    async def add(self, user_id: int):
+        await self.heartbeat([user_id])
+
+    async def remove(self, user_id: int):
+        await self.client.zrem(self.key(user_id), self.worker_id)
+
+    async def heartbeat(self, user_ids: Iterable[int]):
+        now = time.time()
+        async with self.client.pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                pipe.zadd(self.key(user_id), {self.worker_id: now})
+                pipe.expire(self.key(user_id), self.ttl)
+            await pipe.execute()
+
+    async def online(self, user_ids: Iterable[int]) -> Set[int]:
+        user_ids = list(user_ids)
+        cutoff = time.time() - self.ttl
+        async with self.client.pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                pipe.zcount(self.key(user_id), cutoff, "+inf")
+            counts = await pipe.execute()
+        return {user_id for user_id, count in zip(user_ids, counts) if count}
+
+
+bus = MemoryBus()
+presence = MemoryPresence()
+_announcing: Set[asyncio.Future] = set()
+
+
+def configure(redis_client=None):
+    global bus, presence
+    if redis_client is not None:
+        bus, presence = RedisBus(redis_client), RedisPresence(redis_client)
+    else:
+        bus, presence = MemoryBus(), MemoryPresence()
+
+
+def get_presence():
+    return presence
+
+
+def announce(cache: str, keys: List[str]):
+    """Have every other worker drop keys from its in-process cache; fire and forget, safe from sync code and threads"""
+    loop = getattr(bus, "loop", None)
+    if loop is None or not keys:
+        return
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        future = loop.create_task(bus.announce(cache, keys))
+        _announcing.add(future)
+        future.add_done_callback(_announcing.discard)
+    else:
+        asyncio.run_coroutine_threadsafe(bus.announce(cache, keys), loop)
@@ -0,0 +1,172 @@
+"""Versioned schema changes, applied in order and recorded in schema_migrations.
+
+    python migrations.py          apply pending migrations
+    python migrations.py status   list applied and pending ones
+
+Run it as a deploy step before starting the app; with MIGRATE_ON_STARTUP the app
+also applies pending ones during startup. Every migration is safe to run on a
+database that already has its change, so the first run against a database
+created before this table existed simply records them all.
+"""
+import os
+import sys
+from datetime import datetime
+from typing import Callable, List, NamedTuple
+from sqlalchemy import delete, func, inspect, select, text
+from database import Base, SessionLocal, engine
+import chat_cache
+import conversations
+import counters
+import models
+import search
+
+MIGRATE_ON_STARTUP = os.getenv("MIGRATE_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+# arbitrary key for pg_advisory_lock, so concurrent deploys migrate one at a time
+LOCK_KEY = 7268301
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    apply: Callable[[], None]
+
+
+def create_tables():
+    Base.metadata.create_all(bind=engine)
+
+
+def counter_columns():
+    counters.add_missing_columns()
+    db = SessionLocal()
+    try:
+        counters.reconcile_post_counts(db)
+        counters.reconcile_user_counts(db)
+    finally:
+        db.close()
+
+
+def conversation_keys():
+    chat_cache.add_conversation_columns()
+    db = SessionLocal()
+    try:
+        chat_cache.backfill_conversations(db)
+    finally:
+        db.close()
+
+
+def conversation_summaries():
+    db = SessionLocal()
+    try:
+        conversations.rebuild_summaries(db)
+    finally:
+        db.close()
+
+
+def search_index():
+    with engine.begin() as conn:
+        search.configure(engine).rebuild(conn)
+
+
+def create_indexes(table, *names: str):
+    """create_all skips indexes on tables that already exist, so new ones get a migration"""
+    with engine.begin() as conn:
+        for index in table.indexes:
+            if index.name in names:
+                index.create(conn, checkfirst=True)
+
+
+def unique_likes():
+    likes = models.Like.__table__
+    with engine.begin() as conn:
+        # double-taps raced past the old check-then-insert; keep the first like of each pair
+        first = select(func.min(likes.c.id)).group_by(likes.c.post_id, likes.c.user_id)
+        conn.execute(delete(likes).where(likes.c.id.not_in(first)))
+    create_indexes(likes, "ix_likes_post_id_user_id")
+    db = SessionLocal()
+    try:
+        counters.reconcile_post_counts(db)
+    finally:
+        db.close()
+
+
+def chat_client_ids():
+    if "client_id" not in {column["name"] for column in inspect(engine).get_columns("chat_messages")}:
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE chat_messages ADD COLUMN client_id VARCHAR(64)"))
+    create_indexes(models.ChatMessage.__table__, "ix_chat_messages_sender_id_client_id")
+
+
+def pagination_indexes():
+    create_indexes(models.Post.__table__, "ix_posts_created_at_id", "ix_posts_author_id_created_at_id")
+    create_indexes(models.Comment.__table__, "ix_comments_post_id_created_at_id")
+    create_indexes(models.User.__table__, "ix_users_created_at_id")
+
+
+def event_date_index():
+    create_indexes(models.Event.__table__, "ix_events_event_date_id")
+
+
+def deleted_at_columns():
+    for table in ("posts", "users"):
+        if "deleted_at" not in {column["name"] for column in inspect(engine).get_columns(table)}:
+            with engine.begin() as conn:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN deleted_at TIMESTAMP"))
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "create tables", create_tables),
+    Migration(2, "counter columns", counter_columns),
+    Migration(3, "conversation keys on chat messages", conversation_keys),
+    Migration(4, "conversation summaries", conversation_summaries),
+    Migration(5, "search index", search_index),
+    Migration(6, "unique likes per user and post", unique_likes),
+    Migration(7, "client ids on chat messages", chat_client_ids),
+    Migration(8, "keyset pagination indexes", pagination_indexes),
+    Migration(9, "upcoming events index", event_date_index),
+    Migration(10, "deleted_at on posts and users", deleted_at_columns),
+]
+
+
+def applied_versions() -> set:
+    if not inspect(engine).has_table(models.schema_migrations.name):
+        return set()
+    with engine.connect() as conn:
+        return set(conn.scalars(select(models.schema_migrations.c.version)))
+
+
+def pending() -> List[Migration]:
+    done = applied_versions()
+    return [migration for migration in MIGRATIONS if migration.version not in done]
+
+
+def upgrade(verbose: bool = True) -> List[Migration]:
+    """Apply pending migrations in order, returns those applied"""
+    lock = engine.connect() if engine.dialect.name == "postgresql" else None
+    if lock is not None:
+        lock.execute(text("SELECT pg_advisory_lock(:key)"), {"key": LOCK_KEY})
+    try:
+        # another process may have applied some while this one waited for the lock
+        todo = pending()
+        if todo:
+            models.schema_migrations.create(engine, checkfirst=True)
+        for migration in todo:
+            if verbose:
+                print(f"Applying migration {migration.version}: {migration.name}")
+            migration.apply()
+            with engine.begin() as conn:
+                conn.execute(models.schema_migrations.insert().values(version=migration.version, name=migration.name, applied_at=datetime.utcnow()))
+        return todo
+    finally:
+        if lock is not None:
+            lock.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": LOCK_KEY})
+            lock.close()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["status"]:
+        done = applied_versions()
+        for migration in MIGRATIONS:
+            print(f"{migration.version:3d} {'applied' if migration.version in done else 'pending':8} {migration.name}")
+    else:
+        applied = upgrade()
+        print(f"Applied {len(applied)} migrations" if applied else "Schema is up to date")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean, Table
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean, Table, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
@@ -7,7 +7,9 @@ followers = Table(
     Base.metadata,
     Column('follower_id', Integer, ForeignKey('users.id'), primary_key=True),
     Column('following_id', Integer, ForeignKey('users.id'), primary_key=True),
-    Column('created_at', DateTime, default=datetime.utcnow)
+    Column('created_at', DateTime, default=datetime.utcnow),
+    Index("ix_followers_following_id_created_at", "following_id", "created_at", "follower_id"),
+    Index("ix_followers_follower_id_created_at", "follower_id", "created_at", "following_id"),
 )
 class User(Base):
     __tablename__ = "users"
@@ -20,6 +22,11 @@ class User(Base):
     bio = Column(Text, nullable=True)
     profile_pic = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    followers_count = Column(Integer, default=0, server_default="0", nullable=False)
+    following_count = Column(Integer, default=0, server_default="0", nullable=False)
+    posts_count = Column(Integer, default=0, server_default="0", nullable=False)
+    # set when the account is deleted; the rows go once the users.delete job runs
+    deleted_at = Column(DateTime, nullable=True)
     posts = relationship("Post", back_populates="author", cascade="all, delete-orphan")
     comments = relationship("Comment", back_populates="author", cascade="all, delete-orphan")
     likes = relationship("Like", back_populates="user", cascade="all, delete-orphan")
@@ -31,6 +38,9 @@ class User(Base):
         secondaryjoin=id == followers.c.following_id,
         backref="followers"
     )
+    __table_args__ = (
+        Index("ix_users_created_at_id", "created_at", "id"),
+    )
 class Post(Base):
     __tablename__ = "posts"
     id = Column(Integer, primary_key=True, index=True)
@@ -38,9 +48,17 @@ class Post(Base):
     media_url = Column(String, nullable=True)
     author_id = Column(Integer, ForeignKey("users.id"))
     created_at = Column(DateTime, default=datetime.utcnow)
+    likes_count = Column(Integer, default=0, server_default="0", nullable=False)
+    comments_count = Column(Integer, default=0, server_default="0", nullable=False)
+    # set when the post is deleted; reads skip it and the posts.delete job removes it
+    deleted_at = Column(DateTime, nullable=True)
     author = relationship("User", back_populates="posts")
     comments = relationship("Comment", back_populates="post", cascade="all, delete-orphan")
     likes = relationship("Like", back_populates="post", cascade="all, delete-orphan")
+    __table_args__ = (
+        Index("ix_posts_created_at_id", "created_at", "id"),
+        Index("ix_posts_author_id_created_at_id", "author_id", "created_at", "id"),
+    )
 class Comment(Base):
     __tablename__ = "comments"
     id = Column(Integer, primary_key=True, index=True)
@@ -50,6 +68,9 @@ class Comment(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     post = relationship("Post", back_populates="comments")
     author = relationship("User", back_populates="comments")
+    __table_args__ = (
+        Index("ix_comments_post_id_created_at_id", "post_id", "created_at", "id"),
+    )
 class Like(Base):
     __tablename__ = "likes"
     id = Column(Integer, primary_key=True, index=True)
@@ -58,6 +79,9 @@ class Like(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     post = relationship("Post", back_populates="likes")
     user = relationship("User", back_populates="likes")
+    __table_args__ = (
+        Index("ix_likes_post_id_user_id", "post_id", "user_id", unique=True),
+    )
 class Event(Base):
     __tablename__ = "events"
     id = Column(Integer, primary_key=True, index=True)
@@ -68,11 +92,68 @@ class Event(Base):
     creator_id = Column(Integer, ForeignKey("users.id"))
     created_at = Column(DateTime, default=datetime.utcnow)
     creator = relationship("User", back_populates="events_created")
+    __table_args__ = (
+        Index("ix_events_event_date_id", "event_date", "id"),
+    )
+def conversation_user(pick):
+    """Column default filling the canonical (low, high) participant pair from sender and receiver"""
+    def default(context):
+        params = context.get_current_parameters()
+        return pick(params["sender_id"], params["receiver_id"])
+    return default
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
     id = Column(Integer, primary_key=True, index=True)
     sender_id = Column(Integer, ForeignKey("users.id"))
     receiver_id = Column(Integer, ForeignKey("users.id"))
+    user_low = Column(Integer, default=conversation_user(min))
+    user_high = Column(Integer, default=conversation_user(max))
     message = Column(Text)
     is_read = Column(Boolean, default=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    created_at = Column(DateTime, default=datetime.utcnow)
+    # set at ingest, before the row exists; unique per sender so a resent message is stored once
+    client_id = Column(String(64), nullable=True)
+    __table_args__ = (
+        Index("ix_chat_messages_sender_receiver_created_at_id", "sender_id", "receiver_id", "created_at", "id"),
+        Index("ix_chat_messages_conversation_created_at_id", "user_low", "user_high", "created_at", "id"),
+        Index("ix_chat_messages_sender_id_client_id", "sender_id", "client_id", unique=True),
+    )
+class ConversationSummary(Base):
+    """A conversation as one participant's inbox shows it; every pair of users has a row per side"""
+    __tablename__ = "conversation_summaries"
+    owner_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    peer_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    last_message_id = Column(Integer)
+    last_sender_id = Column(Integer)
+    last_message = Column(Text)
+    last_message_at = Column(DateTime)
+    unread_count = Column(Integer, default=0, server_default="0", nullable=False)
+    peer = relationship("User", foreign_keys=[peer_id])
+    __table_args__ = (
+        Index("ix_conversation_summaries_owner_id_last_message_at", "owner_id", "last_message_at", "peer_id"),
+    )
+class Job(Base):
+    """Background work queued by jobs.enqueue, kept until done so restarts and retries pick it up"""
+    __tablename__ = "jobs"
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, nullable=False)
+    payload = Column(Text, nullable=False, default="{}")
+    idempotency_key = Column(String, unique=True, nullable=True)
+    status = Column(String, nullable=False, default="pending")
+    attempts = Column(Integer, default=0, server_default="0", nullable=False)
+    run_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    locked_by = Column(String, nullable=True)
+    locked_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+    __table_args__ = (
+        Index("ix_jobs_status_run_at", "status", "run_at"),
+    )
+schema_migrations = Table(
+    'schema_migrations',
+    Base.metadata,
+    Column('version', Integer, primary_key=True),
+    Column('name', String, nullable=False),
+    Column('applied_at', DateTime, default=datetime.utcnow),
+)
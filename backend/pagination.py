@@ -0,0 +1,53 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Optional
+from fastapi import HTTPException, Response
+from sqlalchemy import tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(values) -> str:
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, columns) -> list:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(payload, list) or len(payload) != len(columns):
+            raise ValueError("cursor does not match sort key")
+        return [
+            datetime.fromisoformat(value) if column.type.python_type is datetime else column.type.python_type(value)
+            for column, value in zip(columns, payload)
+        ]
+    except (ValueError, TypeError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def paginate(db: AsyncSession, query, columns, response: Response, cursor: Optional[str] = None, skip: int = 0, limit: int = 20, descending: bool = True, entities: bool = True):
+    """Keyset pagination over a unique sort key such as (created_at, id).
+
+    Without a cursor the legacy offset is honoured so older clients keep working.
+    The cursor for the following page is returned in the X-Next-Cursor header.
+    Returns the first selected entity of each row, or with entities=False the
+    selected columns as tuples.
+    """
+    if cursor:
+        values = decode_cursor(cursor, columns)
+        key = tuple_(*columns)
+        query = query.where(key < tuple_(*values) if descending else key > tuple_(*values))
+    query = query.order_by(*[column.desc() if descending else column.asc() for column in columns])
+    if skip and not cursor:
+        query = query.offset(skip)
+    # sort key columns ride along so the key may live on a joined table
+    rows = (await db.execute(query.add_columns(*columns).limit(limit + 1))).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(tuple(rows[-1])[-len(columns):])
+    if entities:
+        return [row[0] for row in rows]
+    return [tuple(row)[:-len(columns)] for row in rows]
@@ -0,0 +1,98 @@
+"""The Redis connection, kept up in the background so startup never waits on it.
+
+Modules that use Redis take a client through configure() and run on in-memory
+stores until then. start() makes one attempt bounded by REDIS_CONNECT_TIMEOUT
+and returns either way. While Redis is unreachable the link keeps pinging with
+exponential backoff, and hands the client over on the first successful ping.
+Once handed over, the client stays: redis-py reconnects on the next command
+after an outage, and callers already handle errors around each call.
+Entries written to the in-memory stores before the switch are not copied over.
+"""
+import asyncio
+import os
+import random
+from typing import Awaitable, Callable, List, Optional
+import redis.asyncio as redis
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", 1))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", 5))
+REDIS_HEALTH_SECONDS = float(os.getenv("REDIS_HEALTH_SECONDS", 10))
+REDIS_BACKOFF_MAX_SECONDS = float(os.getenv("REDIS_BACKOFF_MAX_SECONDS", 60))
+REDIS_REQUIRED = os.getenv("REDIS_REQUIRED", "false").lower() in ("1", "true", "yes")
+
+
+class RedisLink:
+    def __init__(self, url: str = REDIS_URL):
+        self.url = url
+        self.client = None
+        self.connected = False
+        self.handed_over = False
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self.listeners: List[Callable[[object], Awaitable[None]]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def on_connect(self, listener: Callable[[object], Awaitable[None]]):
+        """Await listener(client) once, the first time Redis answers"""
+        self.listeners.append(listener)
+
+    async def ping(self) -> bool:
+        try:
+            # until Redis has answered, a stalled server costs no more than a refused connection
+            await asyncio.wait_for(self.client.ping(), REDIS_SOCKET_TIMEOUT if self.connected else REDIS_CONNECT_TIMEOUT)
+        except Exception as e:
+            if self.connected or not self.failures:
+                print(f"Redis unavailable: {e or type(e).__name__}")
+            self.connected = False
+            self.failures += 1
+            self.last_error = str(e) or type(e).__name__
+            return False
+        if not self.connected:
+            print("Redis connected successfully")
+        self.connected = True
+        self.failures = 0
+        if not self.handed_over:
+            self.handed_over = True
+            for listener in self.listeners:
+                try:
+                    await listener(self.client)
+                except Exception as e:
+                    print(f"Switching to Redis failed in {getattr(listener, '__name__', listener)}: {e}")
+        return True
+
+    def delay(self) -> float:
+        if self.connected:
+            return REDIS_HEALTH_SECONDS
+        # full jitter, so workers that lost Redis together do not retry in step
+        return random.uniform(0, min(REDIS_BACKOFF_MAX_SECONDS, 2 ** self.failures))
+
+    async def start(self):
+        self.connected, self.handed_over, self.failures = False, False, 0
+        self.client = redis.from_url(self.url, socket_connect_timeout=REDIS_CONNECT_TIMEOUT, socket_timeout=REDIS_SOCKET_TIMEOUT)
+        await self.ping()
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.delay())
+            await self.ping()
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.client is not None:
+            await self.client.aclose()
+
+    def stats(self) -> dict:
+        return {
+            "connected": self.connected,
+            "in_use": self.handed_over,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
+
+
+link = RedisLink()
@@ -0,0 +1,215 @@
+"""Read replicas: read-only routes take get_read_db, which spreads them over DATABASE_REPLICA_URLS.
+
+A caller who has just written is pinned to the primary for
+DB_READ_YOUR_WRITES_SECONDS, so they see their own change whatever the
+replication lag. The pin is remembered per bearer token on this worker and as a
+short-lived cookie, which browsers carry to every worker. A replica leaves
+rotation when a health check or a request fails on it, and returns after a
+passing check. Checks run every DB_REPLICA_CHECK_SECONDS: the replica must
+answer, have every migration applied and, on Postgres, lag by less than
+DB_REPLICA_MAX_LAG_SECONDS. With no replica in rotation reads go to the primary.
+
+Routes whose reads fill long-lived shared caches (chat history, the upcoming
+events window, timeline builds) stay on the primary, or a lagging replica could
+put stale rows back into a cache right after a write invalidated it.
+"""
+import asyncio
+import os
+import time
+from contextvars import ContextVar
+from http.cookies import SimpleCookie
+from typing import List, Optional
+from sqlalchemy import select, text
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from database import AsyncSessionLocal, pool_options, to_async_url
+from instrumentation import instrument_engine
+from ttl_cache import TTLCache
+import migrations
+import models
+
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+# round_robin or least_connections
+DB_REPLICA_BALANCE = os.getenv("DB_REPLICA_BALANCE", "round_robin")
+DB_READ_YOUR_WRITES_SECONDS = float(os.getenv("DB_READ_YOUR_WRITES_SECONDS", 5))
+DB_REPLICA_CHECK_SECONDS = float(os.getenv("DB_REPLICA_CHECK_SECONDS", 5))
+DB_REPLICA_CHECK_TIMEOUT = float(os.getenv("DB_REPLICA_CHECK_TIMEOUT", 2))
+DB_REPLICA_MAX_LAG_SECONDS = float(os.getenv("DB_REPLICA_MAX_LAG_SECONDS", 10))
+PIN_COOKIE = "db_pin"
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+POSTGRES_LAG = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+# bearer tokens that wrote recently, and whether the current request reads from the primary
+pins = TTLCache(10000, DB_READ_YOUR_WRITES_SECONDS)
+pinned: ContextVar[bool] = ContextVar("pinned", default=False)
+
+
+class Replica:
+    def __init__(self, name: str, url: str):
+        self.name = name
+        async_url = to_async_url(url)
+        self.engine = create_async_engine(async_url, **pool_options(async_url, name, AsyncAdaptedQueuePool))
+        instrument_engine(self.engine.sync_engine, name)
+        self.sessions = async_sessionmaker(self.engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+        self.healthy = True
+        self.in_flight = 0
+        self.served = 0
+        self.failures = 0
+        self.lag_seconds: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+
+class ReplicaSet:
+    def __init__(self, urls: List[str], balance: str = DB_REPLICA_BALANCE):
+        if balance not in ("round_robin", "least_connections"):
+            raise ValueError(f"Unknown DB_REPLICA_BALANCE {balance!r}")
+        self.replicas = [Replica(f"replica{n}", url) for n, url in enumerate(urls, start=1)]
+        self.balance = balance
+        self.turn = 0
+        self.primary_reads = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def pick(self) -> Optional[Replica]:
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return None
+        if self.balance == "least_connections":
+            return min(healthy, key=lambda replica: (replica.in_flight, replica.served))
+        self.turn += 1
+        return healthy[self.turn % len(healthy)]
+
+    def mark_down(self, replica: Replica, error: str):
+        if replica.healthy:
+            print(f"Read replica {replica.name} out of rotation: {error}")
+        replica.healthy = False
+        replica.failures += 1
+        replica.last_error = error
+
+    async def probe(self, replica: Replica):
+        async with replica.engine.connect() as conn:
+            version = await conn.scalar(select(models.schema_migrations.c.version).order_by(models.schema_migrations.c.version.desc()).limit(1))
+            if version != migrations.MIGRATIONS[-1].version:
+                raise RuntimeError(f"schema at migration {version}, expected {migrations.MIGRATIONS[-1].version}")
+            lag = float(await conn.scalar(POSTGRES_LAG) or 0) if conn.dialect.name == "postgresql" else 0.0
+        replica.lag_seconds = lag
+        if lag > DB_REPLICA_MAX_LAG_SECONDS:
+            raise RuntimeError(f"{lag:.1f} s behind the primary")
+
+    async def check(self, replica: Replica):
+        try:
+            await asyncio.wait_for(self.probe(replica), DB_REPLICA_CHECK_TIMEOUT)
+        except Exception as e:
+            self.mark_down(replica, str(getattr(e, "orig", None) or e) or type(e).__name__)
+            return
+        if not replica.healthy:
+            print(f"Read replica {replica.name} back in rotation")
+        replica.healthy = True
+
+    async def check_all(self):
+        await asyncio.gather(*(self.check(replica) for replica in self.replicas))
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(DB_REPLICA_CHECK_SECONDS)
+            await self.check_all()
+
+    async def start(self):
+        if self.replicas:
+            await self.check_all()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+    def stats(self) -> dict:
+        return {
+            "balance": self.balance,
+            "primary_reads": self.primary_reads,
+            "replicas": {
+                replica.name: {
+                    "healthy": replica.healthy,
+                    "in_flight": replica.in_flight,
+                    "served": replica.served,
+                    "failures": replica.failures,
+                    "lag_seconds": replica.lag_seconds,
+                    "last_error": replica.last_error,
+                }
+                for replica in self.replicas
+            },
+        }
+
+
+replica_set = ReplicaSet(DATABASE_REPLICA_URLS)
+
+
+async def get_read_db():
+    """Session for a read-only route: a replica, or the primary when pinned or none is healthy"""
+    replica = None if pinned.get() else replica_set.pick()
+    if replica is None:
+        replica_set.primary_reads += bool(replica_set.replicas)
+        async with AsyncSessionLocal() as db:
+            yield db
+        return
+    replica.in_flight += 1
+    replica.served += 1
+    try:
+        async with replica.sessions() as db:
+            yield db
+    except DBAPIError as e:
+        # lost connections and missing tables; constraint and data errors are the query's fault
+        if e.connection_invalidated or isinstance(e, (OperationalError, InterfaceError)):
+            replica_set.mark_down(replica, str(e.orig))
+        raise
+    finally:
+        replica.in_flight -= 1
+
+
+def bearer(scope) -> Optional[bytes]:
+    for name, value in scope.get("headers", []):
+        if name == b"authorization":
+            return value
+    return None
+
+
+def has_pin_cookie(scope) -> bool:
+    for name, value in scope.get("headers", []):
+        if name == b"cookie" and PIN_COOKIE in SimpleCookie(value.decode("latin-1")):
+            return True
+    return False
+
+
+class ReadYourWritesMiddleware:
+    """Pins callers to the primary for a while after a successful write; add it outermost, so caches see the pin"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not replica_set.replicas:
+            await self.app(scope, receive, send)
+            return
+        token = bearer(scope)
+        writing = scope["method"] in WRITE_METHODS and DB_READ_YOUR_WRITES_SECONDS > 0
+        reset = pinned.set(writing or has_pin_cookie(scope) or (token is not None and pins.get(token) is not None))
+
+        async def send_with_pin(message):
+            if writing and message["type"] == "http.response.start" and message["status"] < 400:
+                if token is not None:
+                    pins.set(token, time.monotonic())
+                cookie = f"{PIN_COOKIE}=1; Max-Age={int(DB_READ_YOUR_WRITES_SECONDS)}; Path=/; HttpOnly; SameSite=Lax"
+                message = {**message, "headers": list(message.get("headers", [])) + [(b"set-cookie", cookie.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_pin)
+        finally:
+            pinned.reset(reset)
@@ -0,0 +1,285 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qsl, urlencode
+from starlette.requests import Request
+from starlette.routing import Match
+from conditional import is_not_modified
+import replicas
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1") == "1"
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", 4096))
+RESPONSE_CACHE_MAX_BODY = int(os.getenv("RESPONSE_CACHE_MAX_BODY", 256 * 1024))
+# Outlives any cached entry, so an expired tag version can never make a stale entry look current
+TAG_VERSION_TTL_SECONDS = 24 * 3600
+CACHE_STATUS_HEADER = "X-Cache"
+
+
+class CachePolicy:
+    def __init__(self, ttl: float, tags: Sequence[str]):
+        self.ttl = ttl
+        self.tags = tags
+
+    def tags_for(self, path_params: dict) -> List[str]:
+        return [tag.format(**path_params) for tag in self.tags]
+
+
+def cached(ttl: float, tags: Sequence[str] = ()):
+    """Cache a public GET route's 200 responses as bytes for ttl seconds.
+
+    tags are formatted with the path parameters, e.g. "post:{post_id}"; mutating
+    routes call invalidate() with the same tags. Put it below the @router.get line.
+    """
+    def decorate(endpoint):
+        endpoint.cache_policy = CachePolicy(ttl, tags)
+        return endpoint
+    return decorate
+
+
+class CachedResponse:
+    def __init__(self, headers: List[Tuple[bytes, bytes]], body: bytes, etag: str, versions: Optional[List[int]] = None):
+        self.headers = headers
+        self.body = body
+        self.etag = etag
+        self.versions = versions or []
+
+    def pack(self) -> bytes:
+        meta = {"headers": [[name.decode("latin-1"), value.decode("latin-1")] for name, value in self.headers], "etag": self.etag, "versions": self.versions}
+        return json.dumps(meta, separators=(",", ":")).encode() + b"\n" + self.body
+
+    @classmethod
+    def unpack(cls, data: bytes) -> "CachedResponse":
+        meta, body = data.split(b"\n", 1)
+        meta = json.loads(meta)
+        headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in meta["headers"]]
+        return cls(headers, body, meta["etag"], meta["versions"])
+
+
+class MemoryResponseStore:
+    """Per-process LRU with a tag index; invalidation drops the tagged entries at once.
+
+    Fills carry the generation they started in, and one that raced an invalidation is not stored.
+    """
+
+    name = "memory"
+
+    def __init__(self, maxsize: int = RESPONSE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.tagged: Dict[str, set] = {}
+        self.generation = 0
+
+    def _drop(self, key: str):
+        item = self.entries.pop(key, None)
+        if item is None:
+            return
+        for tag in item[2]:
+            keys = self.tagged.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tagged[tag]
+
+    async def get(self, key: str, tags: List[str]):
+        item = self.entries.get(key)
+        if item is not None and item[0] > time.monotonic():
+            self.entries.move_to_end(key)
+            return item[1], self.generation
+        self._drop(key)
+        return None, self.generation
+
+    async def set(self, key: str, entry: CachedResponse, ttl: float, tags: List[str], token):
+        if token != self.generation:
+            return
+        self._drop(key)
+        self.entries[key] = (time.monotonic() + ttl, entry, tags)
+        for tag in tags:
+            self.tagged.setdefault(tag, set()).add(key)
+        while len(self.entries) > self.maxsize:
+            self._drop(next(iter(self.entries)))
+
+    async def invalidate(self, tags: Sequence[str]):
+        self.generation += 1
+        for tag in tags:
+            for key in list(self.tagged.get(tag, ())):
+                self._drop(key)
+
+    def size(self) -> int:
+        return len(self.entries)
+
+
+class RedisResponseStore:
+    """Entries shared by every worker. Each tag has a version counter and an entry is current
+    only while the versions it was filled under still hold, so invalidating is one INCR per tag."""
+
+    name = "redis"
+    PREFIX = "http:cache:"
+    TAG_PREFIX = "http:cache-tag:"
+
+    def __init__(self, client):
+        self.client = client
+
+    async def get(self, key: str, tags: List[str]):
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.get(self.PREFIX + key)
+            for tag in tags:
+                pipe.get(self.TAG_PREFIX + tag)
+            data, *raw_versions = await pipe.execute()
+        versions = [int(version or 0) for version in raw_versions]
+        entry = CachedResponse.unpack(data) if data else None
+        if entry is not None and entry.versions != versions:
+            entry = None
+        return entry, versions
+
+    async def set(self, key: str, entry: CachedResponse, ttl: float, tags: List[str], token):
+        entry.versions = token
+        await self.client.set(self.PREFIX + key, entry.pack(), px=int(ttl * 1000))
+
+    async def invalidate(self, tags: Sequence[str]):
+        async with self.client.pipeline(transaction=False) as pipe:
+            for tag in tags:
+                pipe.incr(self.TAG_PREFIX + tag)
+                pipe.expire(self.TAG_PREFIX + tag, TAG_VERSION_TTL_SECONDS)
+            await pipe.execute()
+
+    def size(self) -> Optional[int]:
+        return None
+
+
+store = MemoryResponseStore()
+route_stats: Dict[str, dict] = {}
+invalidations = 0
+
+
+def configure(redis_client=None):
+    global store
+    store = RedisResponseStore(redis_client) if redis_client is not None else MemoryResponseStore()
+
+
+async def invalidate(*tags: str):
+    """Drop cached responses carrying any of tags; call after the commit that changed them"""
+    global invalidations
+    invalidations += 1
+    try:
+        await store.invalidate(tags)
+    except Exception as e:
+        print(f"Response cache invalidation error: {e}")
+
+
+def cache_key(scope) -> str:
+    query = sorted(parse_qsl(scope.get("query_string", b"").decode("latin-1"), keep_blank_values=True))
+    return f"{scope['path']}?{urlencode(query)}"
+
+
+def match_policy(scope):
+    """The cache policy of the route the router would pick for scope, with its path parameters"""
+    for route in scope["app"].router.routes:
+        match, child_scope = route.matches(scope)
+        if match == Match.FULL:
+            policy = getattr(child_scope.get("endpoint"), "cache_policy", None)
+            return (route.path, policy, child_scope.get("path_params", {})) if policy else None
+    return None
+
+
+def _record(route: str, outcome: str):
+    entry = route_stats.setdefault(route, {"hits": 0, "misses": 0, "coalesced": 0, "not_modified": 0})
+    entry[outcome] += 1
+
+
+def stats() -> dict:
+    routes = {}
+    for route, entry in route_stats.items():
+        served = entry["hits"] + entry["coalesced"]
+        lookups = served + entry["misses"]
+        routes[route] = {**entry, "hit_ratio": round(served / lookups, 4) if lookups else 0.0}
+    return {"backend": store.name, "size": store.size(), "invalidations": invalidations, "routes": routes}
+
+
+class ResponseCacheMiddleware:
+    """Serves routes marked with @cached from stored bytes, skipping the handler and serialization.
+
+    Concurrent misses for the same key are coalesced: one request runs the handler and the
+    rest wait for its result. Add it before CORSMiddleware so that sits outside the cache.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.inflight: Dict[str, asyncio.Future] = {}
+
+    async def __call__(self, scope, receive, send):
+        # callers pinned to the primary after a write skip entries a lagging replica may have filled
+        if not RESPONSE_CACHE_ENABLED or scope["type"] != "http" or scope["method"] != "GET" or replicas.pinned.get():
+            await self.app(scope, receive, send)
+            return
+        matched = match_policy(scope)
+        if matched is None:
+            await self.app(scope, receive, send)
+            return
+        route, policy, path_params = matched
+        key = cache_key(scope)
+        tags = policy.tags_for(path_params)
+        try:
+            entry, token = await store.get(key, tags)
+        except Exception as e:
+            print(f"Response cache error: {e}")
+            await self.app(scope, receive, send)
+            return
+        if entry is not None:
+            _record(route, "hits")
+            await self.send_entry(scope, send, entry, route, "HIT")
+            return
+        waiter = self.inflight.get(key)
+        if waiter is not None:
+            entry = await asyncio.shield(waiter)
+            if entry is not None:
+                _record(route, "coalesced")
+                await self.send_entry(scope, send, entry, route, "HIT")
+                return
+        _record(route, "misses")
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[key] = future
+        entry = None
+        try:
+            entry = await self.fill(scope, receive, send, key, tags, token, policy, route)
+        finally:
+            if self.inflight.get(key) is future:
+                del self.inflight[key]
+            future.set_result(entry)
+
+    async def fill(self, scope, receive, send, key, tags, token, policy, route) -> Optional[CachedResponse]:
+        messages = []
+
+        async def capture(message):
+            messages.append(message)
+
+        await self.app(scope, receive, capture)
+        start = messages[0] if messages else None
+        body = b"".join(message.get("body", b"") for message in messages[1:])
+        if start is None or start["status"] != 200 or len(body) > RESPONSE_CACHE_MAX_BODY:
+            for message in messages:
+                await send(message)
+            return None
+        headers = [(name, value) for name, value in start.get("headers", []) if name.lower() not in (b"content-length", b"etag")]
+        entry = CachedResponse(headers, body, f'W/"{hashlib.sha1(body).hexdigest()}"')
+        try:
+            await store.set(key, entry, policy.ttl, tags, token)
+        except Exception as e:
+            print(f"Response cache error: {e}")
+        await self.send_entry(scope, send, entry, route, "MISS")
+        return entry
+
+    async def send_entry(self, scope, send, entry: CachedResponse, route: str, status: str):
+        validators = [(b"etag", entry.etag.encode()), (b"cache-control", b"no-cache"), (CACHE_STATUS_HEADER.lower().encode(), status.encode())]
+        if is_not_modified(Request(scope), entry.etag):
+            _record(route, "not_modified")
+            headers = [(name, value) for name, value in entry.headers if name.lower() != b"content-type"]
+            await send({"type": "http.response.start", "status": 304, "headers": headers + validators})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        headers = entry.headers + validators + [(b"content-length", str(len(entry.body)).encode())]
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        await send({"type": "http.response.body", "body": entry.body})
@@ -1,21 +1,38 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
-from database import get_db
-import models, schemas
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from database import get_async_db
+from replicas import get_read_db
+import schemas
 from auth import get_current_user
+import chat_cache
+import conversations
+import message_bus
+from pagination import paginate
+from serializers import json_response
 router = APIRouter(prefix="/chat", tags=["chat"])
 @router.get("/history/{user_id}", response_model=List[schemas.ChatMessage])
-def get_chat_history(user_id: int, skip: int = 0, limit: int = 50, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    messages = db.query(models.ChatMessage).filter(
-        ((models.ChatMessage.sender_id == current_user.id) & (models.ChatMessage.receiver_id == user_id)) |
-        ((models.ChatMessage.sender_id == user_id) & (models.ChatMessage.receiver_id == current_user.id))
-    ).order_by(models.ChatMessage.created_at.desc()).offset(skip).limit(limit).all()
-    return messages[::-1] 
-@router.get("/conversations")
-def get_conversations(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    sent = db.query(models.ChatMessage.receiver_id).filter(models.ChatMessage.sender_id == current_user.id).distinct()
-    received = db.query(models.ChatMessage.sender_id).filter(models.ChatMessage.receiver_id == current_user.id).distinct()
-    user_ids = set([r[0] for r in sent] + [r[0] for r in received])
-    users = db.query(models.User).filter(models.User.id.in_(user_ids)).all()
-    return users
\ No newline at end of file
+async def get_chat_history(user_id: int, response: Response, skip: int = 0, limit: int = 50, cursor: Optional[str] = None, current_user: schemas.UserSnapshot = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    messages = await chat_cache.history(db, current_user.id, user_id, response, cursor, skip, limit)
+    return messages[::-1]
+@router.get("/conversations", response_model=List[schemas.ConversationSummary])
+async def get_conversations(response: Response, limit: int = 50, cursor: Optional[str] = None, current_user: schemas.UserSnapshot = Depends(get_current_user), db: AsyncSession = Depends(get_read_db)):
+    """The inbox, most recently active first, with the last message and unread count of each conversation"""
+    rows = await paginate(db, conversations.inbox_query(current_user.id), conversations.INBOX_KEY, response, cursor, 0, limit, entities=False)
+    return json_response(schemas.ConversationSummary, rows, response)
+@router.post("/read/{user_id}")
+async def mark_read(user_id: int, up_to_id: Optional[int] = None, current_user: schemas.UserSnapshot = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    """Mark messages from user_id as read, all of them or those up to up_to_id"""
+    marked = await conversations.mark_read(db, current_user.id, user_id, up_to_id)
+    await db.commit()
+    if marked:
+        # a bulk UPDATE skips the ORM hooks that normally drop cached history
+        try:
+            await chat_cache.invalidate(current_user.id, user_id)
+        except Exception as e:
+            print(f"Chat cache error: {e}")
+    return {"marked_read": marked}
+@router.get("/online", response_model=List[int])
+async def get_online_users(user_ids: List[int] = Query(...), current_user: schemas.UserSnapshot = Depends(get_current_user)):
+    """Which of the given users have a live websocket on any worker"""
+    return sorted(await message_bus.get_presence().online(user_ids[:200]))
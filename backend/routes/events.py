@@ -1,34 +1,64 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
-from database import get_db
+from datetime import datetime, timezone
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from database import get_async_db
+from replicas import get_read_db
 import models, schemas
 from auth import get_current_user
+from conditional import conditional, etag_for
+import event_cache
+from loaders import load_options, relationship_names, shaped_select
+from pagination import paginate
+from response_cache import cached, invalidate
+import search
 router = APIRouter(prefix="/events", tags=["events"])
+def utc_naive(value: datetime) -> datetime:
+    return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
 @router.post("/", response_model=schemas.Event)
-def create_event(event: schemas.EventCreate, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def create_event(event: schemas.EventCreate, current_user: schemas.UserSnapshot = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
     db_event = models.Event(**event.dict(), creator_id=current_user.id)
     db.add(db_event)
-    db.commit()
-    db.refresh(db_event)
+    await db.flush()
+    await search.index(db, "event", db_event)
+    await db.commit()
+    event_cache.invalidate()
+    await db.refresh(db_event, relationship_names(schemas.Event))
     return db_event
 @router.get("/", response_model=List[schemas.Event])
-def get_events(skip: int = 0, limit: int = 20, db: Session = Depends(get_db)):
-    events = db.query(models.Event).order_by(models.Event.event_date).offset(skip).limit(limit).all()
-    return events
+async def get_events(request: Request, response: Response, skip: int = 0, limit: int = 20, cursor: Optional[str] = None, start: Optional[datetime] = Query(None, alias="from"), end: Optional[datetime] = Query(None, alias="to"), db: AsyncSession = Depends(get_async_db)):
+    """Events in [from, to) by date; without a window, the upcoming ones"""
+    cached = None
+    if start is None and end is None:
+        cached = await event_cache.upcoming(db, response, cursor, skip, limit)
+    if cached is not None:
+        events, etag, last_modified = cached
+    else:
+        query = shaped_select(schemas.Event).where(models.Event.event_date >= (utc_naive(start) if start else datetime.utcnow()))
+        if end is not None:
+            query = query.where(models.Event.event_date < utc_naive(end))
+        rows = await paginate(db, query, event_cache.SORT_KEY, response, cursor, skip, limit, descending=False)
+        events, last_modified = [schemas.Event.model_validate(row) for row in rows], None
+        etag = etag_for(events)
+    not_modified = conditional(request, response, etag, last_modified)
+    return not_modified or events
 @router.get("/{event_id}", response_model=schemas.Event)
-def get_event(event_id: int, db: Session = Depends(get_db)):
-    event = db.query(models.Event).filter(models.Event.id == event_id).first()
+@cached(ttl=60, tags=("event:{event_id}",))
+async def get_event(event_id: int, db: AsyncSession = Depends(get_read_db)):
+    event = await db.get(models.Event, event_id, options=load_options(schemas.Event))
     if not event:
         raise HTTPException(status_code=404, detail="Event not found")
     return event
 @router.delete("/{event_id}")
-def delete_event(event_id: int, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    event = db.query(models.Event).filter(models.Event.id == event_id).first()
+async def delete_event(event_id: int, current_user: schemas.UserSnapshot = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    event = await db.get(models.Event, event_id)
     if not event:
         raise HTTPException(status_code=404, detail="Event not found")
     if event.creator_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to delete this event")
-    db.delete(event)
-    db.commit()
-    return {"message": "Event deleted successfully"}
\ No newline at end of file
+    await db.delete(event)
+    await search.unindex(db, "event", event_id)
+    await db.commit()
+    event_cache.invalidate()
+    await invalidate(f"event:{event_id}")
+    return {"message": "Event deleted successfully"}
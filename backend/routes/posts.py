@@ -1,91 +1,111 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
-from database import get_db
+from datetime import datetime
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from database import get_async_db
+from replicas import get_read_db
 import models, schemas
 from auth import get_current_user
+from counters import adjust_post_counts, adjust_user_counts
+from loaders import load_options, relationship_names
+from pagination import decode_cursor, paginate
+from response_cache import cached, invalidate
+from serializers import json_response, row_select
+import deletion  # noqa: F401  registers the delete jobs
+import jobs
+import likes
+import search
+import timeline
 router = APIRouter(prefix="/posts", tags=["posts"])
 @router.post("/", response_model=schemas.Post)
-def create_post(post: schemas.PostCreate, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def create_post(post: schemas.PostCreate, background_tasks: BackgroundTasks, current_user: schemas.UserSnapshot = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
     db_post = models.Post(**post.dict(), author_id=current_user.id)
     db.add(db_post)
-    db.commit()
-    db.refresh(db_post)
-    db_post.likes_count = 0
-    db_post.comments_count = 0
+    await db.flush()
+    await search.index(db, "post", db_post)
+    await adjust_user_counts(db, current_user.id, posts=1)
+    await db.commit()
+    await db.refresh(db_post, relationship_names(schemas.Post))
+    await invalidate("posts", f"user:{current_user.id}")
+    background_tasks.add_task(timeline.fan_out_post, db_post.id, db_post.author_id, db_post.created_at)
     return db_post
 
 @router.get("/", response_model=List[schemas.Post])
-def get_posts(skip: int = 0, limit: int = 20, db: Session = Depends(get_db)):
-    posts = db.query(models.Post).order_by(models.Post.created_at.desc()).offset(skip).limit(limit).all()
-    for post in posts:
-        post.likes_count = len(post.likes)
-        post.comments_count = len(post.comments)
-    return posts
+@cached(ttl=5, tags=("posts",))
+async def get_posts(response: Response, skip: int = 0, limit: int = 20, cursor: Optional[str] = None, db: AsyncSession = Depends(get_read_db)):
+    query = row_select(schemas.Post).where(models.Post.deleted_at.is_(None))
+    rows = await paginate(db, query, (models.Post.created_at, models.Post.id), response, cursor, skip, limit, entities=False)
+    return json_response(schemas.Post, rows, response)
 @router.get("/feed", response_model=List[schemas.Post])
-def get_feed(skip: int = 0, limit: int = 20, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    following_ids = [user.id for user in current_user.following]
-    following_ids.append(current_user.id)
-    posts = db.query(models.Post).filter(models.Post.author_id.in_(following_ids)).order_by(models.Post.created_at.desc()).offset(skip).limit(limit).all()
-    for post in posts:
-        post.likes_count = len(post.likes)
-        post.comments_count = len(post.comments)
-    return posts
+async def get_feed(response: Response, skip: int = 0, limit: int = 20, cursor: Optional[str] = None, current_user: schemas.UserSnapshot = Depends(get_current_user), db: AsyncSession = Depends(get_read_db)):
+    columns = (models.Post.created_at, models.Post.id)
+    post_ids = None
+    if cursor or not skip:
+        before = None
+        if cursor:
+            created_at, post_id = decode_cursor(cursor, columns)
+            before = (timeline.to_score(created_at), post_id)
+        post_ids = await timeline.feed_post_ids(db, current_user.id, before, limit + 1)
+    if post_ids is None:
+        source = models.Post.author_id.in_(timeline.followed_authors(current_user.id)) | (models.Post.author_id == current_user.id)
+    else:
+        source = models.Post.id.in_(post_ids) | models.Post.author_id.in_(timeline.pull_authors(current_user.id))
+    # timelines may still hold a post deleted a moment ago
+    query = row_select(schemas.Post).where(source, models.Post.deleted_at.is_(None))
+    rows = await paginate(db, query, columns, response, cursor, skip, limit, entities=False)
+    return json_response(schemas.Post, rows, response)
+@router.get("/liked", response_model=List[int])
+async def get_liked(post_ids: List[int] = Query(default=[], max_length=200), current_user: schemas.UserSnapshot = Depends(get_current_user), db: AsyncSession = Depends(get_read_db)):
+    """Which of post_ids the current user likes, so a page of posts can mark them"""
+    return await likes.liked_post_ids(db, current_user.id, post_ids)
 @router.get("/{post_id}", response_model=schemas.Post)
-def get_post(post_id: int, db: Session = Depends(get_db)):
-    post = db.query(models.Post).filter(models.Post.id == post_id).first()
-    if not post:
+@cached(ttl=30, tags=("post:{post_id}",))
+async def get_post(post_id: int, db: AsyncSession = Depends(get_read_db)):
+    post = await db.get(models.Post, post_id, options=load_options(schemas.Post))
+    if not post or post.deleted_at:
         raise HTTPException(status_code=404, detail="Post not found")
-    post.likes_count = len(post.likes)
-    post.comments_count = len(post.comments)
     return post
-@router.delete("/{post_id}")
-def delete_post(post_id: int, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    post = db.query(models.Post).filter(models.Post.id == post_id).first()
-    if not post:
+@router.delete("/{post_id}", status_code=202)
+async def delete_post(post_id: int, current_user: schemas.UserSnapshot = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    """Hide the post at once; its likes and comments go in the posts.delete job"""
+    post = await db.get(models.Post, post_id)
+    if not post or post.deleted_at:
         raise HTTPException(status_code=404, detail="Post not found")
     if post.author_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to delete this post")
-    db.delete(post)
-    db.commit()
-    return {"message": "Post deleted successfully"}
+    post.deleted_at = datetime.utcnow()
+    await search.unindex(db, "post", post_id)
+    await adjust_user_counts(db, current_user.id, posts=-1)
+    await jobs.enqueue(db, "posts.delete", key=f"posts.delete:{post_id}:{post.created_at.isoformat()}", post_id=post_id, author_id=current_user.id)
+    await db.commit()
+    await invalidate("posts", f"post:{post_id}", f"user:{current_user.id}")
+    jobs.runner.submit(timeline.retract_post, post_id, current_user.id)
+    return {"message": "Post deleted"}
 @router.post("/{post_id}/like")
-def like_post(post_id: int, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    post = db.query(models.Post).filter(models.Post.id == post_id).first()
-    if not post:
+async def like_post(post_id: int, current_user: schemas.UserSnapshot = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    # repeating a like or an unlike is harmless, so a double-tap gets the same answer twice
+    liked = await likes.like(db, post_id, current_user.id)
+    if liked is None:
         raise HTTPException(status_code=404, detail="Post not found")
-    existing_like = db.query(models.Like).filter(
-        models.Like.post_id == post_id,
-        models.Like.user_id == current_user.id
-    ).first()
-    if existing_like:
-        raise HTTPException(status_code=400, detail="Already liked this post")
-    like = models.Like(post_id=post_id, user_id=current_user.id)
-    db.add(like)
-    db.commit()
-    return {"message": "Post liked successfully"}
+    return {"message": "Post liked successfully" if liked else "Post already liked"}
 @router.delete("/{post_id}/like")
-def unlike_post(post_id: int, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    like = db.query(models.Like).filter(
-        models.Like.post_id == post_id,
-        models.Like.user_id == current_user.id
-    ).first()
-    if not like:
-        raise HTTPException(status_code=404, detail="Like not found")
-    db.delete(like)
-    db.commit()
-    return {"message": "Post unliked successfully"}
+async def unlike_post(post_id: int, current_user: schemas.UserSnapshot = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    unliked = await likes.unlike(db, post_id, current_user.id)
+    return {"message": "Post unliked successfully" if unliked else "Post was not liked"}
 @router.post("/{post_id}/comments", response_model=schemas.Comment)
-def create_comment(post_id: int, comment: schemas.CommentCreate, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    post = db.query(models.Post).filter(models.Post.id == post_id).first()
-    if not post:
+async def create_comment(post_id: int, comment: schemas.CommentCreate, current_user: schemas.UserSnapshot = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    post = await db.get(models.Post, post_id)
+    if not post or post.deleted_at:
         raise HTTPException(status_code=404, detail="Post not found")
     db_comment = models.Comment(**comment.dict(), post_id=post_id, author_id=current_user.id)
     db.add(db_comment)
-    db.commit()
-    db.refresh(db_comment)
+    await adjust_post_counts(db, post_id, comments=1)
+    await db.commit()
+    await invalidate("posts", f"post:{post_id}")
+    await db.refresh(db_comment, relationship_names(schemas.Comment))
     return db_comment
 @router.get("/{post_id}/comments", response_model=List[schemas.Comment])
-def get_comments(post_id: int, db: Session = Depends(get_db)):
-    comments = db.query(models.Comment).filter(models.Comment.post_id == post_id).order_by(models.Comment.created_at.desc()).all()
-    return comments
\ No newline at end of file
+async def get_comments(post_id: int, response: Response, skip: int = 0, limit: int = 50, cursor: Optional[str] = None, db: AsyncSession = Depends(get_read_db)):
+    query = row_select(schemas.Comment).join(models.Post, models.Comment.post_id == models.Post.id).where(models.Comment.post_id == post_id, models.Post.deleted_at.is_(None))
+    rows = await paginate(db, query, (models.Comment.created_at, models.Comment.id), response, cursor, skip, limit, entities=False)
+    return json_response(schemas.Comment, rows, response)
@@ -0,0 +1,27 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from replicas import get_read_db
+import schemas
+from loaders import shaped_select
+import search
+router = APIRouter(prefix="/search", tags=["search"])
+RESULT_SCHEMAS = {"post": schemas.Post, "user": schemas.User, "event": schemas.Event}
+@router.get("/", response_model=List[schemas.SearchResult])
+async def search_all(response: Response, q: str = Query(..., min_length=1, max_length=200), type: Optional[List[str]] = Query(None), limit: int = 20, cursor: Optional[str] = None, db: AsyncSession = Depends(get_read_db)):
+    kinds = set(type or search.KINDS)
+    if kinds - set(search.KINDS):
+        raise HTTPException(status_code=400, detail=f"type must be one of {', '.join(search.KINDS)}")
+    hits = await search.search(db, q, kinds, response, cursor, min(limit, 100))
+    loaded = {}
+    for kind in {kind for kind, _, _ in hits}:
+        schema = RESULT_SCHEMAS[kind]
+        model = search.SOURCES[kind][0]
+        ids = [doc_id for hit_kind, doc_id, _ in hits if hit_kind == kind]
+        for obj in (await db.execute(shaped_select(schema).where(model.id.in_(ids)))).scalars():
+            loaded[kind, obj.id] = obj
+    # rows deleted since they were indexed simply drop out
+    return [
+        {"type": kind, "id": doc_id, "score": score, kind: loaded[kind, doc_id]}
+        for kind, doc_id, score in hits if (kind, doc_id) in loaded
+    ]
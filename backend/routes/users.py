@@ -1,67 +1,115 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
-from database import get_db
+from datetime import datetime
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Response, status
+from sqlalchemy import delete, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from database import get_async_db
+from replicas import get_read_db
 import models, schemas
 from auth import get_current_user, get_password_hash
+from counters import adjust_user_counts
+import deletion  # noqa: F401  registers the delete jobs
+import follow_graph
+import jobs
+import search
+from loaders import load_options
+from pagination import paginate
+from response_cache import cached, invalidate
+from serializers import json_response, row_select, serializer
+import timeline
 router = APIRouter(prefix="/users", tags=["users"])
 @router.get("/me", response_model=schemas.UserWithStats)
-def get_current_user_profile(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    return {
-        **current_user.__dict__,
-        "followers_count": len(current_user.followers),
-        "following_count": len(current_user.following),
-        "posts_count": len(current_user.posts)
-    }
+async def get_current_user_profile(current_user: schemas.UserSnapshot = Depends(get_current_user), db: AsyncSession = Depends(get_read_db)):
+    return await db.get(models.User, current_user.id, options=load_options(schemas.UserWithStats))
+@router.delete("/me", status_code=202)
+async def delete_current_user(current_user: schemas.UserSnapshot = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    """Close the account at once; its posts, comments, likes, events, follows and messages go in the users.delete job"""
+    user = await db.get(models.User, current_user.id)
+    user.deleted_at = datetime.utcnow()
+    await search.unindex(db, "user", user.id)
+    await jobs.enqueue(db, "users.delete", key=f"users.delete:{current_user.id}:{current_user.created_at.isoformat()}", user_id=current_user.id)
+    await db.commit()
+    await invalidate(f"user:{current_user.id}")
+    return {"message": "Account deleted"}
+@router.get("/suggestions", response_model=List[schemas.Suggestion])
+async def get_suggestions(limit: int = 20, current_user: schemas.UserSnapshot = Depends(get_current_user), db: AsyncSession = Depends(get_read_db)):
+    """Alumni you may know: friends of friends and followers not followed back, best first"""
+    picks = await follow_graph.suggestions(db, current_user.id, min(limit, 100))
+    rows = await db.execute(row_select(schemas.User).where(models.User.id.in_([user_id for user_id, _, _, _ in picks])))
+    users = {user["id"]: user for user in serializer(schemas.User).to_dicts(rows)}
+    return [
+        {"user": users[user_id], "mutual_count": mutual_count, "follows_you": follows_you}
+        for user_id, _, mutual_count, follows_you in picks if user_id in users
+    ]
 @router.get("/{user_id}", response_model=schemas.UserWithStats)
-def get_user(user_id: int, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.id == user_id).first()
-    if not user:
+@cached(ttl=30, tags=("user:{user_id}",))
+async def get_user(user_id: int, db: AsyncSession = Depends(get_read_db)):
+    user = await db.get(models.User, user_id, options=load_options(schemas.UserWithStats))
+    if not user or user.deleted_at:
         raise HTTPException(status_code=404, detail="User not found")
-    
-    return {
-        **user.__dict__,
-        "followers_count": len(user.followers),
-        "following_count": len(user.following),
-        "posts_count": len(user.posts)
-    }
+
+    return user
 @router.get("/", response_model=List[schemas.User])
-def get_users(skip: int = 0, limit: int = 20, db: Session = Depends(get_db)):
-    users = db.query(models.User).offset(skip).limit(limit).all()
-    return users
+async def get_users(response: Response, skip: int = 0, limit: int = 20, cursor: Optional[str] = None, db: AsyncSession = Depends(get_read_db)):
+    rows = await paginate(db, row_select(schemas.User).where(models.User.deleted_at.is_(None)), (models.User.created_at, models.User.id), response, cursor, skip, limit, descending=False, entities=False)
+    return json_response(schemas.User, rows, response)
 @router.post("/follow/{user_id}")
-def follow_user(user_id: int, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    user_to_follow = db.query(models.User).filter(models.User.id == user_id).first()
-    if not user_to_follow:
+async def follow_user(user_id: int, background_tasks: BackgroundTasks, current_user: schemas.UserSnapshot = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    user_to_follow = await db.get(models.User, user_id)
+    if not user_to_follow or user_to_follow.deleted_at:
         raise HTTPException(status_code=404, detail="User not found")
-    
-    if user_to_follow in current_user.following:
+
+    try:
+        await db.execute(insert(models.followers).values(follower_id=current_user.id, following_id=user_id))
+        await adjust_user_counts(db, current_user.id, following=1)
+        await adjust_user_counts(db, user_id, followers=1)
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
         raise HTTPException(status_code=400, detail="Already following this user")
-    
-    current_user.following.append(user_to_follow)
-    db.commit()
+    await invalidate(f"user:{current_user.id}", f"user:{user_id}", f"following:{current_user.id}", f"followers:{user_id}")
+    follow_graph.graph.follow(current_user.id, user_id)
+    background_tasks.add_task(timeline.on_follow, current_user.id, user_id)
     return {"message": "Successfully followed user"}
 @router.post("/unfollow/{user_id}")
-def unfollow_user(user_id: int, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    user_to_unfollow = db.query(models.User).filter(models.User.id == user_id).first()
+async def unfollow_user(user_id: int, background_tasks: BackgroundTasks, current_user: schemas.UserSnapshot = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    user_to_unfollow = await db.get(models.User, user_id)
     if not user_to_unfollow:
         raise HTTPException(status_code=404, detail="User not found")
-    
-    if user_to_unfollow not in current_user.following:
+
+    result = await db.execute(delete(models.followers).where(
+        models.followers.c.follower_id == current_user.id,
+        models.followers.c.following_id == user_id
+    ))
+    if not result.rowcount:
         raise HTTPException(status_code=400, detail="Not following this user")
-    
-    current_user.following.remove(user_to_unfollow)
-    db.commit()
+
+    await adjust_user_counts(db, current_user.id, following=-1)
+    await adjust_user_counts(db, user_id, followers=-1)
+    await db.commit()
+    await invalidate(f"user:{current_user.id}", f"user:{user_id}", f"following:{current_user.id}", f"followers:{user_id}")
+    follow_graph.graph.unfollow(current_user.id, user_id)
+    background_tasks.add_task(timeline.on_unfollow, current_user.id, user_id)
     return {"message": "Successfully unfollowed user"}
-@router.get("/{user_id}/followers", response_model=List[schemas.User])
-def get_followers(user_id: int, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.id == user_id).first()
-    if not user:
+@router.get("/{user_id}/relationship", response_model=schemas.Relationship)
+async def get_relationship(user_id: int, current_user: schemas.UserSnapshot = Depends(get_current_user), db: AsyncSession = Depends(get_read_db)):
+    return {
+        "following": await follow_graph.is_following(db, current_user.id, user_id),
+        "followed_by": await follow_graph.is_following(db, user_id, current_user.id),
+    }
+async def follow_page(db: AsyncSession, user_id: int, response: Response, cursor, skip, limit, member, owner):
+    """One page of a follow list: users joined through the edge table, newest edge first"""
+    if not await db.get(models.User, user_id):
         raise HTTPException(status_code=404, detail="User not found")
-    return user.followers
+    query = row_select(schemas.User).join(models.followers, member == models.User.id).where(owner == user_id)
+    rows = await paginate(db, query, (models.followers.c.created_at, member), response, cursor, skip, limit, entities=False)
+    return json_response(schemas.User, rows, response)
+@router.get("/{user_id}/followers", response_model=List[schemas.User])
+@cached(ttl=30, tags=("followers:{user_id}",))
+async def get_followers(user_id: int, response: Response, skip: int = 0, limit: int = 50, cursor: Optional[str] = None, db: AsyncSession = Depends(get_read_db)):
+    return await follow_page(db, user_id, response, cursor, skip, limit, models.followers.c.follower_id, models.followers.c.following_id)
 @router.get("/{user_id}/following", response_model=List[schemas.User])
-def get_following(user_id: int, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    return user.following
\ No newline at end of file
+@cached(ttl=30, tags=("following:{user_id}",))
+async def get_following(user_id: int, response: Response, skip: int = 0, limit: int = 50, cursor: Optional[str] = None, db: AsyncSession = Depends(get_read_db)):
+    return await follow_page(db, user_id, response, cursor, skip, limit, models.followers.c.following_id, models.followers.c.follower_id)
@@ -23,11 +23,26 @@ class User(UserBase):
     class Config:
         from_attributes = True
 
+class UserSnapshot(User):
+    """Detached, immutable view of the authenticated user, safe to cache across requests"""
+    class Config:
+        from_attributes = True
+        frozen = True
+
 class UserWithStats(User):
     followers_count: int
     following_count: int
     posts_count: int
 
+class Suggestion(BaseModel):
+    user: User
+    mutual_count: int
+    follows_you: bool
+
+class Relationship(BaseModel):
+    following: bool
+    followed_by: bool
+
 class PostCreate(BaseModel):
     content: str
     media_url: Optional[str] = None
@@ -89,10 +104,31 @@ class ChatMessage(BaseModel):
     message: str
     is_read: bool
     created_at: datetime
+    client_id: Optional[str] = None
     
     class Config:
         from_attributes = True
 
+class ConversationSummary(BaseModel):
+    peer_id: int
+    last_message_id: Optional[int] = None
+    last_sender_id: Optional[int] = None
+    last_message: Optional[str] = None
+    last_message_at: Optional[datetime] = None
+    unread_count: int
+    peer: User
+
+    class Config:
+        from_attributes = True
+
+class SearchResult(BaseModel):
+    type: str
+    id: int
+    score: float
+    post: Optional[Post] = None
+    user: Optional[User] = None
+    event: Optional[Event] = None
+
 
 class Token(BaseModel):
     access_token: str
@@ -0,0 +1,339 @@
+import bisect
+import heapq
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+from fastapi import Response
+from sqlalchemy import BigInteger, Float, bindparam, column, event, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+import models
+from pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
+
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "auto")
+SEARCH_MAX_TERMS = 8
+# Only the newest matches are ranked, so very common terms cost a bounded amount of work
+SEARCH_MAX_CANDIDATES = int(os.getenv("SEARCH_MAX_CANDIDATES", 10000))
+
+# Every document gets one integer key, doc_id * 4 + kind code, so all backends can
+# share a table, filter by kind with key % 4 and page on (score, key).
+KINDS = {"post": 1, "user": 2, "event": 3}
+KIND_NAMES = {code: name for name, code in KINDS.items()}
+SOURCES = {
+    "post": (models.Post, (models.Post.content,)),
+    "user": (models.User, (models.User.full_name, models.User.username, models.User.bio)),
+    "event": (models.Event, (models.Event.title, models.Event.description)),
+}
+CURSOR_COLUMNS = (column("score", Float), column("key", BigInteger))
+TOKEN = re.compile(r"\w+")
+
+Hit = Tuple[float, int]
+
+
+def doc_key(kind: str, doc_id: int) -> int:
+    return doc_id * 4 + KINDS[kind]
+
+
+def split_key(key: int) -> Tuple[str, int]:
+    return KIND_NAMES[key % 4], key // 4
+
+
+def tokenize(value: Optional[str]) -> List[str]:
+    return TOKEN.findall((value or "").lower())
+
+
+def document_text(kind: str, obj) -> str:
+    return " ".join(getattr(obj, source.key) or "" for source in SOURCES[kind][1])
+
+
+class Fts5Backend:
+    """SQLite FTS5 table keyed by rowid; bm25 ranks, prefix indexes serve term* queries"""
+
+    name = "fts5"
+
+    def create(self, conn):
+        conn.execute(text("CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(body, prefix='2 3', tokenize='unicode61 remove_diacritics 2')"))
+
+    def rebuild(self, conn):
+        conn.execute(text("DELETE FROM search_index"))
+        for kind, (model, sources) in SOURCES.items():
+            body = " || ' ' || ".join(f"coalesce({source.key}, '')" for source in sources)
+            conn.execute(text(f"INSERT INTO search_index(rowid, body) SELECT id * 4 + {KINDS[kind]}, {body} FROM {model.__tablename__}"))
+
+    async def add(self, db: AsyncSession, key: int, body: str):
+        await db.execute(text("DELETE FROM search_index WHERE rowid = :key"), {"key": key})
+        await db.execute(text("INSERT INTO search_index(rowid, body) VALUES (:key, :body)"), {"key": key, "body": body})
+
+    def add_many(self, conn, documents: List[dict]):
+        conn.execute(text("DELETE FROM search_index WHERE rowid = :key"), documents)
+        conn.execute(text("INSERT INTO search_index(rowid, body) VALUES (:key, :body)"), documents)
+
+    async def remove(self, db: AsyncSession, key: int):
+        await db.execute(text("DELETE FROM search_index WHERE rowid = :key"), {"key": key})
+
+    async def remove_many(self, db: AsyncSession, keys: List[int]):
+        await db.execute(text("DELETE FROM search_index WHERE rowid = :key"), [{"key": key} for key in keys])
+
+    async def search(self, db: AsyncSession, terms: List[str], codes: List[int], before: Optional[Hit], limit: int) -> List[Hit]:
+        query = " ".join(f'"{term}"*' for term in terms)
+        keyset = "WHERE (score, key) < (:score, :key)" if before else ""
+        statement = text(
+            "SELECT score, key FROM (SELECT -bm25(search_index) AS score, rowid AS key FROM search_index "
+            "WHERE search_index MATCH :query AND rowid % 4 IN :codes ORDER BY rowid DESC LIMIT :candidates) "
+            f"{keyset} ORDER BY score DESC, key DESC LIMIT :limit"
+        ).bindparams(bindparam("codes", expanding=True))
+        params = {"query": query, "codes": codes, "candidates": SEARCH_MAX_CANDIDATES, "limit": limit}
+        if before:
+            params.update(score=before[0], key=before[1])
+        return [tuple(row) for row in await db.execute(statement, params)]
+
+
+class PostgresBackend:
+    """search_documents with a generated tsvector behind a GIN index, ranked by ts_rank_cd"""
+
+    name = "postgres"
+
+    def create(self, conn):
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS search_documents ("
+            "key bigint PRIMARY KEY, body text NOT NULL, "
+            "tsv tsvector GENERATED ALWAYS AS (to_tsvector('simple', body)) STORED)"
+        ))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_search_documents_tsv ON search_documents USING GIN (tsv)"))
+
+    def rebuild(self, conn):
+        conn.execute(text("TRUNCATE search_documents"))
+        for kind, (model, sources) in SOURCES.items():
+            body = ", ".join(source.key for source in sources)
+            conn.execute(text(f"INSERT INTO search_documents(key, body) SELECT id * 4 + {KINDS[kind]}, concat_ws(' ', {body}) FROM {model.__tablename__}"))
+
+    async def add(self, db: AsyncSession, key: int, body: str):
+        await db.execute(
+            text("INSERT INTO search_documents(key, body) VALUES (:key, :body) ON CONFLICT (key) DO UPDATE SET body = EXCLUDED.body"),
+            {"key": key, "body": body},
+        )
+
+    def add_many(self, conn, documents: List[dict]):
+        conn.execute(text("INSERT INTO search_documents(key, body) VALUES (:key, :body) ON CONFLICT (key) DO UPDATE SET body = EXCLUDED.body"), documents)
+
+    async def remove(self, db: AsyncSession, key: int):
+        await db.execute(text("DELETE FROM search_documents WHERE key = :key"), {"key": key})
+
+    async def remove_many(self, db: AsyncSession, keys: List[int]):
+        await db.execute(text("DELETE FROM search_documents WHERE key = ANY(:keys)"), {"keys": keys})
+
+    async def search(self, db: AsyncSession, terms: List[str], codes: List[int], before: Optional[Hit], limit: int) -> List[Hit]:
+        keyset = "WHERE (score, key) < (:score, :key)" if before else ""
+        statement = text(
+            "SELECT score, key FROM (SELECT ts_rank_cd(tsv, to_tsquery('simple', :query))::float8 AS score, key FROM ("
+            "SELECT key, tsv FROM search_documents WHERE tsv @@ to_tsquery('simple', :query) AND key % 4 IN :codes ORDER BY key DESC LIMIT :candidates"
+            f") candidates) ranked {keyset} ORDER BY score DESC, key DESC LIMIT :limit"
+        ).bindparams(bindparam("codes", expanding=True))
+        params = {"query": " & ".join(f"{term}:*" for term in terms), "codes": codes, "candidates": SEARCH_MAX_CANDIDATES, "limit": limit}
+        if before:
+            params.update(score=before[0], key=before[1])
+        return [tuple(row) for row in await db.execute(statement, params)]
+
+
+class MemoryBackend:
+    """In-process inverted index with BM25 ranking, for tests and databases without full-text support.
+
+    Lives only as long as the process; configure() fills it from the database at startup.
+    Changes wait in the session, or on the connection, and only reach the index when
+    that transaction commits, so a rollback leaves nothing behind.
+    """
+
+    name = "memory"
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.terms: List[str] = []
+        self.documents: Dict[int, Counter] = {}
+        self.total_length = 0
+        self._lock = threading.Lock()
+
+    def create(self, conn):
+        pass
+
+    def rebuild(self, conn):
+        with self._lock:
+            self.postings, self.terms, self.documents, self.total_length = {}, [], {}, 0
+        for kind, (model, sources) in SOURCES.items():
+            for row in conn.execute(select(model.id, *sources)):
+                self._add(doc_key(kind, row[0]), " ".join(value or "" for value in row[1:]))
+
+    def _remove(self, key: int):
+        counts = self.documents.pop(key, None)
+        if counts is None:
+            return
+        self.total_length -= sum(counts.values())
+        for token in counts:
+            postings = self.postings[token]
+            del postings[key]
+            if not postings:
+                del self.postings[token]
+                del self.terms[bisect.bisect_left(self.terms, token)]
+
+    def _add(self, key: int, body: str):
+        counts = Counter(tokenize(body))
+        with self._lock:
+            self._remove(key)
+            self.documents[key] = counts
+            self.total_length += sum(counts.values())
+            for token, count in counts.items():
+                if token not in self.postings:
+                    self.postings[token] = {}
+                    bisect.insort(self.terms, token)
+                self.postings[token][key] = count
+
+    def apply(self, changes: List[Tuple[int, Optional[str]]]):
+        """(key, body) pairs in order; a None body removes the document"""
+        for key, body in changes:
+            if body is None:
+                with self._lock:
+                    self._remove(key)
+            else:
+                self._add(key, body)
+
+    async def add(self, db: AsyncSession, key: int, body: str):
+        pending(db.sync_session).append((key, body))
+
+    def add_many(self, conn, documents: List[dict]):
+        # a Connection has no after-commit hook; "commit" fires just before COMMIT, "rollback" skips it
+        changes = [(document["key"], document["body"]) for document in documents]
+        event.listen(conn, "commit", lambda conn: self.apply(changes))
+
+    async def remove(self, db: AsyncSession, key: int):
+        pending(db.sync_session).append((key, None))
+
+    async def remove_many(self, db: AsyncSession, keys: List[int]):
+        pending(db.sync_session).extend((key, None) for key in keys)
+
+    def _prefix_postings(self, term: str) -> Dict[int, int]:
+        start = bisect.bisect_left(self.terms, term)
+        end = bisect.bisect_left(self.terms, term + "￿")
+        merged: Dict[int, int] = {}
+        for token in self.terms[start:end]:
+            for key, count in self.postings[token].items():
+                merged[key] = merged.get(key, 0) + count
+        return merged
+
+    async def search(self, db: AsyncSession, terms: List[str], codes: List[int], before: Optional[Hit], limit: int) -> List[Hit]:
+        with self._lock:
+            total = len(self.documents)
+            if not total:
+                return []
+            average = self.total_length / total
+            scores: Optional[Dict[int, tuple]] = None
+            for term in terms:
+                postings = self._prefix_postings(term)
+                idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+                term_scores = {}
+                for key, count in postings.items():
+                    if key % 4 not in codes or scores is not None and key not in scores:
+                        continue
+                    term_scores[key] = (idf, count)
+                scores = term_scores if scores is None else {key: scores[key] + value for key, value in term_scores.items()}
+            hits = []
+            for key in heapq.nlargest(SEARCH_MAX_CANDIDATES, scores):
+                weights = scores[key]
+                length = sum(self.documents[key].values())
+                norm = self.K1 * (1 - self.B + self.B * length / average)
+                score = sum(idf * count * (self.K1 + 1) / (count + norm) for idf, count in zip(weights[::2], weights[1::2]))
+                if before is None or (score, key) < before:
+                    hits.append((score, key))
+        hits.sort(reverse=True)
+        return hits[:limit]
+
+
+backend = MemoryBackend()
+
+
+def pending(session: Session) -> list:
+    return session.info.setdefault("search_pending", [])
+
+
+@event.listens_for(Session, "after_commit")
+def apply_pending(session: Session):
+    changes = session.info.pop("search_pending", None)
+    if changes and backend.name == "memory":
+        backend.apply(changes)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def drop_pending(session: Session, transaction):
+    # rolled back or closed without a commit
+    if transaction.parent is None:
+        session.info.pop("search_pending", None)
+
+
+def configure(engine):
+    """Pick the backend for this database, create its storage and, for the memory index, load it"""
+    global backend
+    choice = SEARCH_BACKEND
+    if choice == "auto":
+        choice = {"postgresql": "postgres", "sqlite": "fts5"}.get(engine.dialect.name, "memory")
+    backend = {"fts5": Fts5Backend, "postgres": PostgresBackend, "memory": MemoryBackend}[choice]()
+    try:
+        with engine.begin() as conn:
+            backend.create(conn)
+    except Exception as e:
+        if SEARCH_BACKEND != "auto":
+            raise
+        print(f"Search backend {backend.name} unavailable, using the in-memory index: {e}")
+        backend = MemoryBackend()
+    if backend.name == "memory":
+        with engine.connect() as conn:
+            backend.rebuild(conn)
+    return backend
+
+
+async def index(db: AsyncSession, kind: str, obj):
+    """Add or refresh a document; call inside the transaction that writes obj, after a flush.
+
+    The database backends write in that transaction, the memory index once it commits.
+    """
+    await backend.add(db, doc_key(kind, obj.id), document_text(kind, obj))
+
+
+def index_rows(conn, kind: str, rows):
+    """Index freshly bulk-inserted rows, each with id plus the kind's source columns, on a sync connection"""
+    documents = [{"key": doc_key(kind, row.id), "body": document_text(kind, row)} for row in rows]
+    if documents:
+        backend.add_many(conn, documents)
+
+
+async def unindex(db: AsyncSession, kind: str, doc_id: int):
+    await backend.remove(db, doc_key(kind, doc_id))
+
+
+async def unindex_many(db: AsyncSession, kind: str, doc_ids: Iterable[int]):
+    keys = [doc_key(kind, doc_id) for doc_id in doc_ids]
+    if keys:
+        await backend.remove_many(db, keys)
+
+
+async def search(db: AsyncSession, query: str, kinds: Iterable[str], response: Response, cursor: Optional[str] = None, limit: int = 20) -> List[Tuple[str, int, float]]:
+    """Ranked (kind, id, score) matches for every term of query as a prefix, best first"""
+    terms = tokenize(query)[:SEARCH_MAX_TERMS]
+    if not terms:
+        return []
+    before = tuple(decode_cursor(cursor, CURSOR_COLUMNS)) if cursor else None
+    hits = await backend.search(db, terms, sorted(KINDS[kind] for kind in kinds), before, limit + 1)
+    if len(hits) > limit:
+        hits = hits[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(hits[-1])
+    return [(*split_key(key), score) for score, key in hits]
+
+
+if __name__ == "__main__":
+    from database import engine
+    configure(engine)
+    with engine.begin() as conn:
+        backend.rebuild(conn)
+    print(f"Rebuilt the {backend.name} search index")
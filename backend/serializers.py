@@ -0,0 +1,91 @@
+from operator import itemgetter
+from typing import Dict, List
+from fastapi import Response
+from sqlalchemy import inspect, select
+from sqlalchemy.orm import aliased
+from loaders import RESPONSE_SHAPES
+
+try:
+    import orjson
+    from fastapi.responses import ORJSONResponse as FastJSONResponse
+except ImportError:  # plain json still works, only slower
+    orjson = None
+    from fastapi.responses import JSONResponse as FastJSONResponse
+
+
+class RowSerializer:
+    """Builds a response schema's JSON shape straight from selected columns.
+
+    Skips ORM hydration and pydantic validation for list pages. Fields come from
+    the schema, and each many-to-one relationship in RESPONSE_SHAPES is
+    inner-joined as a nested object: those fields are required in the schemas,
+    so a row whose related row is gone is left out rather than sent as null. A
+    nested payload that repeats within a page, such as the author of several
+    posts, is built once and shared.
+    """
+
+    def __init__(self, schema):
+        model, relationships = RESPONSE_SHAPES[schema]
+        self.model = model
+        self.columns = []
+        self.joins = []
+        self.nested = []
+        flat = []
+        for name in schema.model_fields:
+            if name in relationships:
+                relationship = getattr(model, name)
+                if relationship.property.uselist:
+                    raise ValueError(f"{schema.__name__}.{name} is a collection; row serialization only nests many-to-one")
+                target = aliased(relationship.property.mapper.class_)
+                nested_schema = schema.model_fields[name].annotation
+                start = len(self.columns)
+                names = list(nested_schema.model_fields)
+                self.columns.extend(getattr(target, field) for field in names)
+                key = names.index(inspect(target).mapper.primary_key[0].key)
+                self.joins.append((target, relationship.of_type(target)))
+                self.nested.append((name, names, start, start + len(names), start + key))
+            else:
+                flat.append((name, len(self.columns)))
+                self.columns.append(getattr(model, name))
+        self.flat_names = [name for name, _ in flat]
+        self.flat_values = itemgetter(*[index for _, index in flat])
+
+    def select(self):
+        query = select(*self.columns).select_from(self.model)
+        for target, relationship in self.joins:
+            query = query.join(target, relationship)
+        return query
+
+    def to_dicts(self, rows) -> List[dict]:
+        shared: Dict[tuple, dict] = {}
+        items = []
+        for row in rows:
+            values = self.flat_values(row)
+            item = dict(zip(self.flat_names, values if len(self.flat_names) > 1 else (values,)))
+            for name, names, start, stop, key in self.nested:
+                nested = shared.get((name, row[key]))
+                if nested is None:
+                    nested = shared[(name, row[key])] = dict(zip(names, row[start:stop]))
+                item[name] = nested
+            items.append(item)
+        return items
+
+
+serializers: Dict[type, RowSerializer] = {}
+
+
+def serializer(schema) -> RowSerializer:
+    if schema not in serializers:
+        serializers[schema] = RowSerializer(schema)
+    return serializers[schema]
+
+
+def row_select(schema):
+    """select() of exactly the columns schema serializes, for use with paginate(..., entities=False)"""
+    return serializer(schema).select()
+
+
+def json_response(schema, rows, response: Response) -> FastJSONResponse:
+    """Rows from row_select() as a ready-made JSON response, carrying headers already set on response"""
+    headers = {name: value for name, value in response.headers.items() if name != "content-length"}
+    return FastJSONResponse(serializer(schema).to_dicts(rows), headers=headers)
@@ -0,0 +1,260 @@
+import bisect
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import AsyncSessionLocal
+import models
+
+TIMELINE_LENGTH = int(os.getenv("TIMELINE_LENGTH", 800))
+TIMELINE_MEMORY_USERS = int(os.getenv("TIMELINE_MEMORY_USERS", 10000))
+TIMELINE_TTL_SECONDS = int(os.getenv("TIMELINE_TTL_SECONDS", 7 * 24 * 3600))
+# Authors with at least this many followers are merged into feeds at read time instead of fanned out
+FANOUT_FOLLOWER_LIMIT = int(os.getenv("FANOUT_FOLLOWER_LIMIT", 10000))
+FANOUT_CHUNK_SIZE = 1000
+EPOCH = datetime(1970, 1, 1)
+
+Entry = Tuple[float, int]
+
+
+def to_score(created_at: datetime) -> float:
+    return (created_at - EPOCH).total_seconds()
+
+
+class MemoryTimelineStore:
+    """Per-user capped timelines of (score, post_id) kept in process, LRU-evicted by user"""
+
+    def __init__(self, capacity: int = TIMELINE_LENGTH, max_users: int = TIMELINE_MEMORY_USERS):
+        self.capacity = capacity
+        self.max_users = max_users
+        self._timelines: "OrderedDict[int, List[Entry]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def exists(self, user_id: int) -> bool:
+        with self._lock:
+            return user_id in self._timelines
+
+    async def size(self, user_id: int) -> int:
+        with self._lock:
+            return len(self._timelines.get(user_id, ()))
+
+    async def replace(self, user_id: int, entries: Iterable[Entry]):
+        with self._lock:
+            self._timelines[user_id] = sorted(entries)[-self.capacity:]
+            self._timelines.move_to_end(user_id)
+            while len(self._timelines) > self.max_users:
+                self._timelines.popitem(last=False)
+
+    async def add(self, user_ids: Iterable[int], entries: Iterable[Entry]):
+        entries = list(entries)
+        with self._lock:
+            for user_id in user_ids:
+                timeline = self._timelines.get(user_id)
+                if timeline is None:
+                    continue
+                for entry in entries:
+                    index = bisect.bisect_left(timeline, entry)
+                    if index == len(timeline) or timeline[index] != entry:
+                        timeline.insert(index, entry)
+                del timeline[:-self.capacity]
+
+    async def remove(self, user_ids: Iterable[int], post_ids: Iterable[int]):
+        post_ids = set(post_ids)
+        with self._lock:
+            for user_id in user_ids:
+                timeline = self._timelines.get(user_id)
+                if timeline is not None:
+                    timeline[:] = [entry for entry in timeline if entry[1] not in post_ids]
+
+    async def drop(self, user_id: int):
+        with self._lock:
+            self._timelines.pop(user_id, None)
+
+    async def page(self, user_id: int, before: Optional[Entry], limit: int) -> List[Entry]:
+        with self._lock:
+            timeline = self._timelines.get(user_id, [])
+            end = bisect.bisect_left(timeline, before) if before else len(timeline)
+            return timeline[max(0, end - limit):end][::-1]
+
+
+class RedisTimelineStore:
+    """Timelines as Redis sorted sets scored by post timestamp.
+
+    Each set carries a sentinel member at -inf so an empty-but-built timeline
+    can be told apart from one that has never been built.
+    """
+
+    SENTINEL = b"-"
+    ADD_SCRIPT = """
+    for _, key in ipairs(KEYS) do
+        if redis.call('EXISTS', key) == 1 then
+            for i = 2, #ARGV, 2 do
+                redis.call('ZADD', key, ARGV[i], ARGV[i + 1])
+            end
+            redis.call('ZREMRANGEBYRANK', key, 1, -(tonumber(ARGV[1]) + 1))
+        end
+    end
+    """
+
+    def __init__(self, client, capacity: int = TIMELINE_LENGTH, ttl: int = TIMELINE_TTL_SECONDS):
+        self.client = client
+        self.capacity = capacity
+        self.ttl = ttl
+        self._add = client.register_script(self.ADD_SCRIPT)
+
+    @staticmethod
+    def key(user_id: int) -> str:
+        return f"timeline:{user_id}"
+
+    async def exists(self, user_id: int) -> bool:
+        return bool(await self.client.exists(self.key(user_id)))
+
+    async def size(self, user_id: int) -> int:
+        return max(0, await self.client.zcard(self.key(user_id)) - 1)
+
+    async def replace(self, user_id: int, entries: Iterable[Entry]):
+        key = self.key(user_id)
+        mapping = {str(post_id): score for score, post_id in sorted(entries)[-self.capacity:]}
+        mapping[self.SENTINEL] = float("-inf")
+        async with self.client.pipeline() as pipe:
+            pipe.delete(key)
+            pipe.zadd(key, mapping)
+            pipe.expire(key, self.ttl)
+            await pipe.execute()
+
+    async def add(self, user_ids: Iterable[int], entries: Iterable[Entry]):
+        args = [self.capacity]
+        for score, post_id in entries:
+            args.extend([score, post_id])
+        keys = [self.key(user_id) for user_id in user_ids]
+        for start in range(0, len(keys), FANOUT_CHUNK_SIZE):
+            await self._add(keys=keys[start:start + FANOUT_CHUNK_SIZE], args=args)
+
+    async def remove(self, user_ids: Iterable[int], post_ids: Iterable[int]):
+        members = [str(post_id) for post_id in post_ids]
+        if not members:
+            return
+        async with self.client.pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                pipe.zrem(self.key(user_id), *members)
+            await pipe.execute()
+
+    async def drop(self, user_id: int):
+        await self.client.delete(self.key(user_id))
+
+    async def page(self, user_id: int, before: Optional[Entry], limit: int) -> List[Entry]:
+        key = self.key(user_id)
+        # Fetch a little extra so posts sharing the cursor's timestamp can be filtered out
+        rows = await self.client.zrevrangebyscore(key, before[0] if before else "+inf", "-inf", start=0, num=limit + 10, withscores=True)
+        await self.client.expire(key, self.ttl)
+        entries = [(score, int(member)) for member, score in rows if member != self.SENTINEL]
+        if before:
+            entries = [entry for entry in entries if entry < before]
+        return entries[:limit]
+
+
+store = MemoryTimelineStore()
+
+
+def configure(redis_client=None):
+    global store
+    store = RedisTimelineStore(redis_client) if redis_client is not None else MemoryTimelineStore()
+
+
+def get_store():
+    return store
+
+
+async def is_fanout_author(db: AsyncSession, user_id: int) -> bool:
+    count = await db.scalar(select(models.User.followers_count).where(models.User.id == user_id))
+    return (count or 0) < FANOUT_FOLLOWER_LIMIT
+
+
+def followed_authors(user_id: int):
+    return select(models.followers.c.following_id).where(models.followers.c.follower_id == user_id)
+
+
+def pull_authors(user_id: int):
+    """Followed authors too popular to fan out, merged into the feed at read time"""
+    return select(models.User.id).where(models.User.id.in_(followed_authors(user_id)), models.User.followers_count >= FANOUT_FOLLOWER_LIMIT)
+
+
+async def recent_entries(db: AsyncSession, author_ids, limit: int = TIMELINE_LENGTH) -> List[Entry]:
+    rows = await db.execute(
+        select(models.Post.created_at, models.Post.id)
+        .where(models.Post.author_id.in_(author_ids), models.Post.deleted_at.is_(None))
+        .order_by(models.Post.created_at.desc(), models.Post.id.desc())
+        .limit(limit)
+    )
+    return [(to_score(created_at), post_id) for created_at, post_id in rows]
+
+
+async def build(db: AsyncSession, user_id: int):
+    push_authors = followed_authors(user_id).where(models.followers.c.following_id.not_in(pull_authors(user_id)))
+    entries = await recent_entries(db, push_authors)
+    entries += await recent_entries(db, [user_id])
+    await store.replace(user_id, entries)
+
+
+async def feed_post_ids(db: AsyncSession, user_id: int, before: Optional[Entry], limit: int) -> Optional[List[int]]:
+    """Post ids for one feed page from the precomputed timeline.
+
+    Returns None when the page reaches past the capped timeline and must be read from the database.
+    """
+    if not await store.exists(user_id):
+        # built from the primary: a replica behind a fan-out could store a timeline missing the new post
+        async with AsyncSessionLocal() as primary:
+            await build(primary, user_id)
+    entries = await store.page(user_id, before, limit)
+    if len(entries) < limit and await store.size(user_id) >= store.capacity:
+        return None
+    return [post_id for _, post_id in entries]
+
+
+async def follower_chunks(db: AsyncSession, author_id: int):
+    query = select(models.followers.c.follower_id).where(models.followers.c.following_id == author_id)
+    result = await db.stream_scalars(query.execution_options(yield_per=FANOUT_CHUNK_SIZE))
+    async for chunk in result.partitions(FANOUT_CHUNK_SIZE):
+        yield chunk
+
+
+async def fan_out_post(post_id: int, author_id: int, created_at: datetime):
+    entries = [(to_score(created_at), post_id)]
+    await store.add([author_id], entries)
+    async with AsyncSessionLocal() as db:
+        if await is_fanout_author(db, author_id):
+            async for chunk in follower_chunks(db, author_id):
+                await store.add(chunk, entries)
+
+
+async def retract_post(post_id: int, author_id: int):
+    await store.remove([author_id], [post_id])
+    async with AsyncSessionLocal() as db:
+        async for chunk in follower_chunks(db, author_id):
+            await store.remove(chunk, [post_id])
+
+
+async def retract_author(author_id: int, follower_ids: List[int], post_ids: List[int]):
+    """Drop a deleted user's timeline and their posts from their followers'; the follow edges are already gone"""
+    await store.drop(author_id)
+    if post_ids:
+        for start in range(0, len(follower_ids), FANOUT_CHUNK_SIZE):
+            await store.remove(follower_ids[start:start + FANOUT_CHUNK_SIZE], post_ids)
+
+
+async def on_follow(follower_id: int, followee_id: int):
+    if not await store.exists(follower_id):
+        return
+    async with AsyncSessionLocal() as db:
+        if await is_fanout_author(db, followee_id):
+            await store.add([follower_id], await recent_entries(db, [followee_id]))
+
+
+async def on_unfollow(follower_id: int, followee_id: int):
+    if not await store.exists(follower_id):
+        return
+    async with AsyncSessionLocal() as db:
+        await store.remove([follower_id], [post_id for _, post_id in await recent_entries(db, [followee_id])])
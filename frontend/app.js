@@ -0,0 +1,351 @@
+const API_URL = window.location.hostname === 'localhost' || window.location.hostname === '127.0.0.1'
+    ? 'http://localhost:8000' 
+    : window.location.origin;
+
+let token = localStorage.getItem('token');
+let currentUser = null;
+let ws = null;
+let selectedChatUser = null;
+if (token) {
+    loadUser();
+}
+async function login() {
+    const username = document.getElementById('loginUsername').value;
+    const password = document.getElementById('loginPassword').value;
+
+    const formData = new FormData();
+    formData.append('username', username);
+    formData.append('password', password);
+
+    try {
+        const response = await fetch(`${API_URL}/token`, {
+            method: 'POST',
+            body: formData
+        });
+
+        if (response.ok) {
+            const data = await response.json();
+            token = data.access_token;
+            localStorage.setItem('token', token);
+            await loadUser();
+        } else {
+            alert('Login failed!');
+        }
+    } catch (error) {
+        alert('Error: ' + error.message);
+    }
+}
+
+async function register() {
+    const email = document.getElementById('regEmail').value;
+    const username = document.getElementById('regUsername').value;
+    const fullName = document.getElementById('regFullName').value;
+    const password = document.getElementById('regPassword').value;
+    const isAlumni = document.getElementById('isAlumni').checked;
+
+    try {
+        const response = await fetch(`${API_URL}/register`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                email,
+                username,
+                full_name: fullName,
+                password,
+                is_alumni: isAlumni
+            })
+        });
+
+        if (response.ok) {
+            alert('Registration successful! Please login.');
+            showLogin();
+        } else {
+            const error = await response.json();
+            alert('Registration failed: ' + error.detail);
+        }
+    } catch (error) {
+        alert('Error: ' + error.message);
+    }
+}
+
+async function loadUser() {
+    try {
+        const response = await fetch(`${API_URL}/users/me`, {
+            headers: { 'Authorization': `Bearer ${token}` }
+        });
+
+        if (response.ok) {
+            currentUser = await response.json();
+            showMainApp();
+            connectWebSocket();
+            loadFeed();
+        } else {
+            logout();
+        }
+    } catch (error) {
+        logout();
+    }
+}
+
+function logout() {
+    token = null;
+    currentUser = null;
+    localStorage.removeItem('token');
+    if (ws) ws.close();
+    showAuthScreen();
+}
+
+function showAuthScreen() {
+    document.getElementById('authScreen').classList.remove('hidden');
+    document.getElementById('navbar').classList.add('hidden');
+    document.getElementById('mainContent').classList.add('hidden');
+}
+
+function showMainApp() {
+    document.getElementById('authScreen').classList.add('hidden');
+    document.getElementById('navbar').classList.remove('hidden');
+    document.getElementById('mainContent').classList.remove('hidden');
+}
+
+function showLogin() {
+    document.getElementById('loginForm').classList.remove('hidden');
+    document.getElementById('registerForm').classList.add('hidden');
+}
+
+function showRegister() {
+    document.getElementById('loginForm').classList.add('hidden');
+    document.getElementById('registerForm').classList.remove('hidden');
+}
+
+function showFeed() {
+    document.getElementById('feedScreen').classList.remove('hidden');
+    document.getElementById('profileScreen').classList.add('hidden');
+    document.getElementById('chatScreen').classList.add('hidden');
+    loadFeed();
+}
+
+function showProfile() {
+    document.getElementById('feedScreen').classList.add('hidden');
+    document.getElementById('profileScreen').classList.remove('hidden');
+    document.getElementById('chatScreen').classList.add('hidden');
+    loadProfile();
+}
+
+function showChat() {
+    document.getElementById('feedScreen').classList.add('hidden');
+    document.getElementById('profileScreen').classList.add('hidden');
+    document.getElementById('chatScreen').classList.remove('hidden');
+    loadUsers();
+}
+async function loadFeed() {
+    try {
+        const response = await fetch(`${API_URL}/posts/feed`, {
+            headers: { 'Authorization': `Bearer ${token}` }
+        });
+
+        if (response.ok) {
+            const posts = await response.json();
+            displayPosts(posts, await loadLiked(posts));
+        }
+    } catch (error) {
+        console.error('Error loading feed:', error);
+    }
+}
+
+async function loadLiked(posts) {
+    if (!posts.length) return new Set();
+    const params = new URLSearchParams(posts.map(post => ['post_ids', post.id]));
+    const response = await fetch(`${API_URL}/posts/liked?${params}`, {
+        headers: { 'Authorization': `Bearer ${token}` }
+    });
+    return new Set(response.ok ? await response.json() : []);
+}
+
+function displayPosts(posts, liked = new Set()) {
+    const postsList = document.getElementById('postsList');
+    postsList.innerHTML = posts.map(post => `
+        <div class="bg-white dark:bg-gray-800 p-6 rounded-lg shadow mb-4">
+            <div class="flex items-center mb-3">
+                <div class="font-bold text-gray-800 dark:text-white">${post.author.full_name}</div>
+                <span class="text-sm text-gray-500 ml-2">@${post.author.username}</span>
+            </div>
+            <p class="text-gray-700 dark:text-gray-300 mb-3">${post.content}</p>
+            <div class="flex gap-4 text-sm text-gray-500">
+                <button onclick="likePost(${post.id}, ${liked.has(post.id)})" class="${liked.has(post.id) ? 'text-red-600' : 'hover:text-red-600'}"> ${post.likes_count}</button>
+                <span> ${post.comments_count}</span>
+            </div>
+        </div>
+    `).join('');
+}
+
+async function createPost() {
+    const content = document.getElementById('postContent').value;
+    if (!content.trim()) return;
+
+    try {
+        const response = await fetch(`${API_URL}/posts/`, {
+            method: 'POST',
+            headers: {
+                'Authorization': `Bearer ${token}`,
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({ content })
+        });
+
+        if (response.ok) {
+            document.getElementById('postContent').value = '';
+            loadFeed();
+        }
+    } catch (error) {
+        alert('Error creating post');
+    }
+}
+
+async function likePost(postId, liked) {
+    try {
+        await fetch(`${API_URL}/posts/${postId}/like`, {
+            method: liked ? 'DELETE' : 'POST',
+            headers: { 'Authorization': `Bearer ${token}` }
+        });
+        loadFeed();
+    } catch (error) {
+        console.error('Error liking post');
+    }
+}
+async function loadProfile() {
+    const profileContent = document.getElementById('profileContent');
+    profileContent.innerHTML = `
+        <div class="bg-white dark:bg-gray-800 p-6 rounded-lg shadow">
+            <h2 class="text-2xl font-bold mb-2 text-gray-800 dark:text-white">${currentUser.full_name}</h2>
+            <p class="text-gray-600 dark:text-gray-400 mb-4">@${currentUser.username}</p>
+            <p class="text-gray-700 dark:text-gray-300 mb-4">${currentUser.email}</p>
+            <p class="text-sm text-gray-600 dark:text-gray-400">${currentUser.is_alumni ? 'Alumni' : 'Student'}</p>
+            <div class="mt-4 flex gap-4">
+                <div><strong>${currentUser.followers_count}</strong> Followers</div>
+                <div><strong>${currentUser.following_count}</strong> Following</div>
+                <div><strong>${currentUser.posts_count}</strong> Posts</div>
+            </div>
+        </div>
+    `;
+}
+function connectWebSocket() {
+    const wsProtocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+    const wsHost = (window.location.hostname === 'localhost' || window.location.hostname === '127.0.0.1')
+        ? 'localhost:8000'
+        : window.location.host;
+
+    ws = new WebSocket(`${wsProtocol}//${wsHost}/ws/${token}`);
+    ws.onmessage = (event) => {
+        const message = JSON.parse(event.data);
+        if (message.error) {
+            console.error('Message not sent:', message.error);
+            return;
+        }
+        if (selectedChatUser && (message.sender_id === selectedChatUser.id || message.receiver_id === selectedChatUser.id)) {
+            displayMessage(message);
+        }
+    };
+
+    ws.onclose = () => {
+        console.log('WebSocket closed');
+    };
+
+    ws.onerror = (error) => {
+        console.error('WebSocket error:', error);
+    };
+}
+async function loadUsers() {
+    try {
+        const response = await fetch(`${API_URL}/users/`, {
+            headers: { 'Authorization': `Bearer ${token}` }
+        });
+
+        if (response.ok) {
+            const users = await response.json();
+            const usersList = document.getElementById('usersList');
+            usersList.innerHTML = users.filter(u => u.id !== currentUser.id).map(user => `
+                <div onclick="selectChatUser(${user.id})" class="p-2 hover:bg-gray-100 dark:hover:bg-gray-700 rounded cursor-pointer text-gray-700 dark:text-gray-300">
+                    ${user.full_name}
+                </div>
+            `).join('');
+        }
+    } catch (error) {
+        console.error('Error loading users');
+    }
+}
+
+async function selectChatUser(userId) {
+    try {
+        const response = await fetch(`${API_URL}/users/${userId}`, {
+            headers: { 'Authorization': `Bearer ${token}` }
+        });
+
+        if (response.ok) {
+            selectedChatUser = await response.json();
+            document.getElementById('chatInput').disabled = false;
+            loadChatHistory(userId);
+        }
+    } catch (error) {
+        console.error('Error selecting user');
+    }
+}
+
+async function loadChatHistory(userId) {
+    try {
+        const response = await fetch(`${API_URL}/chat/history/${userId}`, {
+            headers: { 'Authorization': `Bearer ${token}` }
+        });
+
+        if (response.ok) {
+            const messages = await response.json();
+            const chatMessages = document.getElementById('chatMessages');
+            chatMessages.innerHTML = messages.map(msg => `
+                <div class="mb-2 ${msg.sender_id === currentUser.id ? 'text-right' : 'text-left'}">
+                    <div class="inline-block p-2 rounded ${msg.sender_id === currentUser.id ? 'bg-blue-600 text-white' : 'bg-gray-200 dark:bg-gray-700 text-gray-800 dark:text-white'}">
+                        ${msg.message}
+                    </div>
+                </div>
+            `).join('');
+            chatMessages.scrollTop = chatMessages.scrollHeight;
+        }
+    } catch (error) {
+        console.error('Error loading chat history');
+    }
+}
+
+function displayMessage(message) {
+    const chatMessages = document.getElementById('chatMessages');
+    const messageDiv = document.createElement('div');
+    messageDiv.className = `mb-2 ${message.sender_id === currentUser.id ? 'text-right' : 'text-left'}`;
+    messageDiv.innerHTML = `
+        <div class="inline-block p-2 rounded ${message.sender_id === currentUser.id ? 'bg-blue-600 text-white' : 'bg-gray-200 dark:bg-gray-700 text-gray-800 dark:text-white'}">
+            ${message.message}
+        </div>
+    `;
+    chatMessages.appendChild(messageDiv);
+    chatMessages.scrollTop = chatMessages.scrollHeight;
+}
+document.addEventListener('DOMContentLoaded', () => {
+    const chatInput = document.getElementById('chatInput');
+    if (chatInput) {
+        chatInput.addEventListener('keypress', (e) => {
+            if (e.key === 'Enter' && selectedChatUser) {
+                const message = chatInput.value.trim();
+                if (message && ws && ws.readyState === WebSocket.OPEN) {
+                    ws.send(JSON.stringify({
+                        receiver_id: selectedChatUser.id,
+                        message: message
+                    }));
+                    chatInput.value = '';
+                }
+            }
+        });
+    }
+});
+function toggleDarkMode() {
+    document.documentElement.classList.toggle('dark');
+    localStorage.setItem('darkMode', document.documentElement.classList.contains('dark'));
+}
+if (localStorage.getItem('darkMode') === 'true') {
+    document.documentElement.classList.add('dark');
+}